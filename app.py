@@ -1,15 +1,26 @@
-import cv2
-import io
 from pathlib import Path
 import time
-from PIL import Image
 import streamlit as st
-import boto3
 import base64
+import hashlib
 import os
-import magic
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-bedrock_runtime = boto3.client("bedrock-runtime", region_name="us-west-2")
+from frame_utils import encode_payload, extract_frames, resize_image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda'))
+from bedrock_pool import BedrockClientPool  # noqa: E402
+from video_transcoder import build_moderation_proxy, file_sha256  # noqa: E402
+from video_container import prepare_video_for_bedrock  # noqa: E402
+from tracing import start_trace, finish_trace, span, wrap  # noqa: E402
+from usage_ledger import begin_request, end_request, record_call, choose_model, choose_frame_count, get_ledger  # noqa: E402
+
+# 多 region 客户端池，通过 BEDROCK_REGIONS / BEDROCK_HEDGE 等环境变量配置
+bedrock_runtime = BedrockClientPool.from_env(default_region="us-west-2")
 
 
 # 模型选项
@@ -21,127 +32,165 @@ IMAGE_MODELS = (
     "us.anthropic.claude-3-5-sonnet-20240620-v1:0",
 )
 
+# 直接上传视频的大小上限；开启审核代理视频后允许更大的原始上传
+MAX_INLINE_VIDEO_MB = 25
+MAX_PROXY_UPLOAD_MB = 200
+# 所有会话共享的后台任务线程数，超出的提交排队等待
+APP_WORKERS = int(os.environ.get('APP_WORKERS', 4))
+# 按视频哈希缓存的抽帧结果个数
+FRAME_CACHE_ENTRIES = int(os.environ.get('APP_FRAME_CACHE_ENTRIES', 16))
+# 多模型对比时共用的抽帧频率和最多帧数
+COMPARE_FPS = float(os.environ.get('APP_COMPARE_FPS', 1))
+COMPARE_MAX_FRAMES = 20
+
+
+class FrameCache:
+    def __init__(self, max_entries=FRAME_CACHE_ENTRIES):
+        """LRU cache of resized frames keyed by (video hash, fps), shared by all sessions"""
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, load):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # 同一视频同时被多个会话提交时只抽帧一次
+        with key_lock:
+            with self._lock:
+                if key in self.entries:
+                    return self.entries[key]
+            value = load()
+            with self._lock:
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                self._key_locks.pop(key, None)
+            return value
+
+
+class Job:
+    def __init__(self, title):
+        """One submitted analysis, run on the shared executor and polled by the page"""
+        self.id = uuid.uuid4().hex
+        self.title = title
+        self.stage = "排队中"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.usage = None
+        self.spans = None
+        # 多模型对比：model_id -> {"status", "result", "error"}
+        self.models = {}
+        self.done = False
+        self.created = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def update(self, stage, progress):
+        with self._lock:
+            self.stage = stage
+            self.progress = max(self.progress, min(1.0, progress))
+
+    def update_model(self, model_id, **fields):
+        with self._lock:
+            self.models.setdefault(model_id, {}).update(fields)
+
+    def finish(self, result=None, error=None, usage=None, spans=None):
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.usage = usage
+            self.spans = spans
+            self.stage = "失败" if error else "完成"
+            self.progress = 1.0
+            self.done = True
+            self.finished = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            return {'stage': self.stage, 'progress': self.progress, 'done': self.done,
+                    'result': self.result, 'error': self.error,
+                    'usage': self.usage, 'spans': self.spans,
+                    'models': {model_id: dict(entry) for model_id, entry in self.models.items()}}
+
+
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=APP_WORKERS, thread_name_prefix='app-job')
+
+
+@st.cache_resource
+def get_frame_cache():
+    return FrameCache()
+
+
+@st.cache_resource
+def get_jobs():
+    return {}
+
+
+def no_progress(stage, progress):
+    pass
+
+
+def load_frames(video_local_path, fps, video_hash=None):
+    """Extracted and resized frames, cached by video content hash"""
+    video_hash = video_hash or file_sha256(video_local_path)
+
+    def load():
+        frames_dir = f'{video_local_path}_{fps}_frames'
+        with span('extract_frames') as s:
+            extract_frames(video_local_path, frames_dir, fps)
+            s.add_bytes(bytes_in=os.path.getsize(video_local_path))
+
+        image_paths = [os.path.join(frames_dir, f)
+                       for f in sorted(os.listdir(frames_dir)) if f.endswith('.jpg')]
+        with span('resize_image', images=len(image_paths)) as s:
+            images = resize_image(image_paths)
+            s.add_bytes(bytes_in=sum(os.path.getsize(p) for p in image_paths),
+                        bytes_out=sum(len(img) for _, img in images))
+        return images
+
+    with span('load_frames', fps=fps) as s:
+        images = get_frame_cache().get((video_hash, fps), load)
+        s.set(frames=len(images))
+    return images
+
+
+def request_bytes(messages):
+    """Size of the image/video bytes in a converse request"""
+    total = 0
+    for message in messages:
+        for block in message['content']:
+            media = block.get('image') or block.get('video')
+            if media and 'bytes' in media['source']:
+                total += len(media['source']['bytes'])
+    return total
+
+
+def select_frames(images, count):
+    """count frames evenly spaced over images"""
+    if count >= len(images):
+        return images
+    step = len(images) / count
+    return [images[int(i * step)] for i in range(count)]
+
+
+def fit_payload(images):
+    """Re-encode the selected frames into the request byte budget (PAYLOAD_BUDGET_BYTES)"""
+    with span('encode_payload', images=len(images)) as s:
+        encoded = encode_payload(images)
+        s.add_bytes(bytes_in=sum(len(img) for _, img in images), bytes_out=sum(len(img) for _, img in encoded))
+    return encoded
+
 
-def extract_frames(video_path, output_dir, fps=1):
-    """
-    从视频中每秒提取一帧并保存到指定目录
-
-    参数:
-        video_path: 视频文件路径
-        output_dir: 输出图片保存目录
-        fps: 每秒提取的帧数，默认为1
-    """
-    # 创建输出目录（如果不存在）
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        print(f"创建输出目录: {output_dir}")
-
-    # 打开视频文件
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"错误: 无法打开视频 {video_path}")
-        return
-
-    # 获取视频信息
-    video_fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = total_frames / video_fps
-
-    print(f"视频信息:")
-    print(f"- 路径: {video_path}")
-    print(f"- FPS: {video_fps}")
-    print(f"- 总帧数: {total_frames}")
-    print(f"- 时长: {duration:.2f} 秒")
-
-    # 计算帧间隔
-    frame_interval = int(video_fps / fps)
-    if frame_interval < 1:
-        frame_interval = 1
-
-    # 提取帧
-    frame_count = 0
-    saved_count = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # 每隔frame_interval帧保存一次
-        if frame_count % frame_interval == 0:
-            # 计算当前时间点（秒）
-            timestamp = frame_count / video_fps
-            # 保存图片
-            output_path = os.path.join(
-                output_dir, f"frame_{saved_count:04d}_{timestamp:.2f}s.jpg")
-            cv2.imwrite(output_path, frame)
-            saved_count += 1
-
-            # 显示进度
-            if saved_count % 10 == 0:
-                print(f"已保存 {saved_count} 帧图片，当前视频时间点: {timestamp:.2f}s")
-
-        frame_count += 1
-        # if saved_count > 19:
-        #     break
-
-    # 释放资源
-    cap.release()
-    print(f"完成! 共提取了 {saved_count} 帧图片，保存在 {output_dir}")
-
-
-def get_mime_type(file_path):
-    mime = magic.Magic(mime=True)
-    mime_type = mime.from_file(file_path)
-    return mime_type
-
-
-def resize_image(images):
-    # 处理所有下载的图片
-    image_bytes_list = []
-    for file_path in images:
-        # 获取文件格式
-        image_format = get_mime_type(file_path)
-        image_format = image_format.split('/')[1]
-        # 读取图片文件
-        file_size = os.path.getsize(file_path)
-
-        with Image.open(file_path) as img:
-            # 检查是否需要调整大小
-            max_size = 720
-            if max(img.width, img.height) > max_size:
-                # 计算调整后的尺寸，保持宽高比
-                ratio = max_size / max(img.width, img.height)
-                new_size = (int(img.width * ratio),
-                            int(img.height * ratio))
-                # 调整图像大小
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-
-            # 如果文件大于3MB，需要进一步压缩
-            if file_size > 3 * 1024 * 1024:  # 3MB in bytes
-                # 计算新的尺寸（50%）
-                new_size = (img.width // 2, img.height // 2)
-                # 调整图像大小
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-
-            # 将图像保存到内存
-            img_byte_arr = io.BytesIO()
-            format_name = img.format if img.format else image_format
-            img.save(img_byte_arr, format=format_name)
-            image_bytes = img_byte_arr.getvalue()
-            image_bytes_list.append((image_format, image_bytes))
-
-    return image_bytes_list
-
-
-def call_claude(model_id, system_prompt, temperature, top_p, length, video_local_path, prompt):
-    frames_dir = f'{video_local_path}_frames'
-    extract_frames(video_local_path, frames_dir, 1)
-
-    image_paths = [os.path.join(frames_dir, f)
-                   for f in os.listdir(frames_dir) if f.endswith('.jpg')]
-    images = resize_image(image_paths)
-
+def image_request(images, prompt, system_prompt, temperature, top_p, length):
+    """converse arguments for a frame set; compare mode shares them across models"""
     content = []
     for format, img in images:
         content.append({
@@ -152,8 +201,6 @@ def call_claude(model_id, system_prompt, temperature, top_p, length, video_local
                 }
             }
         })
-        if len(content) >= 20:
-            break
 
     content.append({
         "text": prompt
@@ -178,83 +225,77 @@ def call_claude(model_id, system_prompt, temperature, top_p, length, video_local
         'temperature': temperature,
         'topP': top_p
     }
+    return messages, system, inferenceConfig
 
-    start_time = time.time()
-
-    response = bedrock_runtime.converse(
-        modelId=model_id,
-        messages=messages,
-        system=system,
-        inferenceConfig=inferenceConfig
-    )
-
-    # 计算耗时
-    elapsed_time = time.time() - start_time
-    st.info(f"API调用耗时: {elapsed_time:.2f}秒")
-    return response
-
-
-def call_nova_by_image(model_id, system_prompt, temperature, top_p, length, video_local_path, prompt):
-    frames_dir = f'{video_local_path}_frames'
-    extract_frames(video_local_path, frames_dir, 0.01)
-
-    image_paths = [os.path.join(frames_dir, f)
-                   for f in os.listdir(frames_dir) if f.endswith('.jpg')]
-    images = resize_image(image_paths)
-
-    content = []
-    for format, img in images:
-        content.append({
-            "image": {
-                "format": format,
-                "source": {
-                    "bytes": img
-                }
-            }
-        })
-        if len(content) >= 20:
-            break
-
-    content.append({
-        "text": prompt
-    })
-
-    messages = [
-        {
-            "role": "user",
-            "content": content,
-        }
-    ]
-
-    if system_prompt:
-        system = [{
-            "text": system_prompt
-        }]
-    else:
-        system = []
-
-    inferenceConfig = {
-        "maxTokens": int(length),
-        'temperature': temperature,
-        'topP': top_p
-    }
 
+def converse(model_id, messages, system, inferenceConfig, images=0, videos=0):
     start_time = time.time()
 
-    response = bedrock_runtime.converse(
-        modelId=model_id,
-        messages=messages,
-        system=system,
-        inferenceConfig=inferenceConfig
-    )
+    with span('converse', model_id=model_id) as s:
+        s.add_bytes(bytes_in=request_bytes(messages))
+        response = bedrock_runtime.converse(
+            modelId=model_id,
+            messages=messages,
+            system=system,
+            inferenceConfig=inferenceConfig
+        )
+        usage = response.get('usage', {})
+        s.set(input_tokens=usage.get('inputTokens'), output_tokens=usage.get('outputTokens'))
 
     # 计算耗时
     elapsed_time = time.time() - start_time
-    st.info(f"API调用耗时: {elapsed_time:.2f}秒")
+    print(f"API调用耗时: {elapsed_time:.2f}秒")
+    record_call(model_id, response, elapsed_time * 1000, images=images, videos=videos)
     return response
 
 
-def call_nova(model_id, system_prompt, temperature, top_p, length, video_local_path, prompt):
+def call_by_image(model_id, system_prompt, temperature, top_p, length, video_local_path, prompt, fps,
+                  video_hash=None, progress=None):
+    progress = progress or no_progress
+    progress("抽帧", 0.1)
+    images = load_frames(video_local_path, fps, video_hash)
+    progress("构造请求", 0.5)
+
+    # 超出 token 预算时先降级模型，仍超出则均匀减少帧数
+    model_id = choose_model(model_id, min(len(images), 20))
+    images = fit_payload(select_frames(images, choose_frame_count(model_id, min(len(images), 20))))
+    messages, system, inferenceConfig = image_request(images, prompt, system_prompt, temperature, top_p, length)
+
+    progress("调用模型", 0.6)
+    return converse(model_id, messages, system, inferenceConfig, images=len(images))
+
+
+def call_claude(model_id, system_prompt, temperature, top_p, length, video_local_path, prompt,
+                video_hash=None, progress=None):
+    return call_by_image(model_id, system_prompt, temperature, top_p, length, video_local_path, prompt, 1,
+                         video_hash, progress)
+
+
+def call_nova_by_image(model_id, system_prompt, temperature, top_p, length, video_local_path, prompt,
+                       video_hash=None, progress=None):
+    return call_by_image(model_id, system_prompt, temperature, top_p, length, video_local_path, prompt, 0.01,
+                         video_hash, progress)
+
+
+def call_nova(model_id, system_prompt, temperature, top_p, length, video_local_path, prompt, use_proxy=False,
+              progress=None):
+    progress = progress or no_progress
+    model_id = choose_model(model_id)
+    progress("生成审核代理视频" if use_proxy else "检查视频容器", 0.1)
+    with span('nova_prepare', use_proxy=use_proxy) as s:
+        s.add_bytes(bytes_in=os.path.getsize(video_local_path))
+        if use_proxy:
+            # 生成低分辨率、低码率、无音轨的审核代理视频，减小上传体积
+            video_local_path = build_moderation_proxy(video_local_path)
+            video_format = "mp4"
+        else:
+            # 按真实容器声明 format，avi 等不支持的容器先 remux 成 mp4
+            video_local_path, video_format = prepare_video_for_bedrock(video_local_path)
+        s.add_bytes(bytes_out=os.path.getsize(video_local_path))
+    if os.path.getsize(video_local_path) > MAX_INLINE_VIDEO_MB * 1024 * 1024:
+        raise RuntimeError(f"视频大小超过{MAX_INLINE_VIDEO_MB}MB，请开启审核代理视频")
+
+    progress("读取视频", 0.4)
     with open(video_local_path, "rb") as file:
         media_bytes = file.read()
 
@@ -264,7 +305,7 @@ def call_nova(model_id, system_prompt, temperature, top_p, length, video_local_p
             "content": [
                 {
                     "video": {
-                        "format": "mp4",
+                        "format": video_format,
                         "source": {
                             "bytes": media_bytes
                         }
@@ -288,19 +329,156 @@ def call_nova(model_id, system_prompt, temperature, top_p, length, video_local_p
         'topP': top_p
     }
 
-    start_time = time.time()
+    progress("调用模型", 0.6)
+    return converse(model_id, messages, system, inferenceConfig, videos=1)
+
+
+def run_job(job, params):
+    """Run one submission on the shared executor; updates only the Job, never st.*"""
+    # 本地运行时设置 TRACE_EXPORT_FILE 把每次提交的阶段耗时写入文件
+    tracer = start_trace('streamlit-app')
+    if tracer:
+        tracer.set(model_id=params['model'])
+    usage = begin_request(token_budget=params['token_budget'])
+    result, error = None, None
+    try:
+        model = params['model']
+        args = (model, params['system_prompt'], params['temperature'], params['top_p'], params['length'],
+                params['video_local_path'], params['prompt'])
+        if model.startswith("us.amazon.nova") and params['nova_input'] == "视频":
+            response = call_nova(*args, use_proxy=params['use_proxy'], progress=job.update)
+        elif model.startswith("us.amazon.nova"):
+            response = call_nova_by_image(*args, video_hash=params['video_hash'], progress=job.update)
+        elif model.startswith("us.anthropic.claude"):
+            response = call_claude(*args, video_hash=params['video_hash'], progress=job.update)
+        else:
+            raise RuntimeError("暂不支持此模型")
+        result = {'output': response.get("output"), 'usage': response.get("usage"),
+                  'metrics': response.get("metrics")}
+    except Exception as e:
+        error = str(e)
+    finally:
+        usage_entry = end_request(usage)
+        trace_record = finish_trace(tracer, 'error' if error else 'ok')
+        job.finish(result, error, usage_entry, trace_record['spans'] if trace_record else None)
+
+
+def compare_one(job, model_id, messages, system, inferenceConfig, images):
+    job.update_model(model_id, status="调用中")
+    try:
+        response = converse(model_id, messages, system, inferenceConfig, images=images)
+        job.update_model(model_id, status="完成", result={
+            'output': response.get("output"), 'usage': response.get("usage"), 'metrics': response.get("metrics")})
+    except Exception as e:
+        job.update_model(model_id, status="失败", error=str(e))
+
+
+def run_compare(job, params):
+    """Extract and encode frames once, then call every selected model concurrently"""
+    tracer = start_trace('streamlit-compare')
+    if tracer:
+        tracer.set(models=len(params['models']))
+    usage = begin_request(token_budget=params['token_budget'])
+    error = None
+    try:
+        models = params['models']
+        for model_id in models:
+            job.update_model(model_id, status="排队中")
+        job.update("抽帧", 0.1)
+        images = load_frames(params['video_local_path'], COMPARE_FPS, params['video_hash'])
+        job.update("构造请求", 0.4)
+        # 所有模型共用同一组帧，预算只影响帧数，不降级模型（否则就不是对比了）
+        count = min(len(images), COMPARE_MAX_FRAMES)
+        images = fit_payload(select_frames(images, min(choose_frame_count(model_id, count) for model_id in models)))
+        messages, system, inferenceConfig = image_request(
+            images, params['prompt'], params['system_prompt'], params['temperature'], params['top_p'],
+            params['length'])
+
+        job.update(f"调用模型 0/{len(models)}", 0.5)
+        with ThreadPoolExecutor(max_workers=len(models), thread_name_prefix='app-compare') as pool:
+            futures = [pool.submit(wrap(compare_one), job, model_id, messages, system, inferenceConfig, len(images))
+                       for model_id in models]
+            for finished, _ in enumerate(as_completed(futures), 1):
+                job.update(f"调用模型 {finished}/{len(models)}", 0.5 + 0.5 * finished / len(models))
+    except Exception as e:
+        error = str(e)
+    finally:
+        usage_entry = end_request(usage)
+        trace_record = finish_trace(tracer, 'error' if error else 'ok')
+        job.finish(None, error, usage_entry, trace_record['spans'] if trace_record else None)
+
+
+def submit_job(params):
+    jobs = get_jobs()
+    # 清理一小时前结束的任务
+    for job_id, old in list(jobs.items()):
+        if old.done and time.time() - old.finished > 3600:
+            jobs.pop(job_id, None)
+    job = Job(params['model'])
+    jobs[job.id] = job
+    get_executor().submit(run_compare if params.get('models') else run_job, job, params)
+    return job
+
+
+def render_models(models):
+    """One column per model, filled in as each call finishes"""
+    for model_id, column in zip(models, st.columns(len(models))):
+        entry = models[model_id]
+        with column:
+            st.markdown(f"**{model_id}**")
+            if entry.get('error'):
+                st.error(entry['error'])
+            elif entry.get('result'):
+                result = entry['result']
+                latency_ms = (result.get('metrics') or {}).get('latencyMs')
+                usage = result.get('usage') or {}
+                if latency_ms is not None:
+                    st.info(f"API调用耗时: {latency_ms / 1000:.2f}秒")
+                st.caption(f"输入 {usage.get('inputTokens')} / 输出 {usage.get('outputTokens')} tokens")
+                for block in result['output']['message']['content']:
+                    if 'text' in block:
+                        st.markdown(block['text'])
+            else:
+                st.caption(entry.get('status', ''))
+
+
+def render_job(job):
+    state = job.snapshot()
+    st.progress(state['progress'], text=state['stage'])
+    if state['models']:
+        render_models(state['models'])
+    if state['error']:
+        st.error(f"call nova failed: {state['error']}")
+    elif state['result']:
+        latency_ms = (state['result'].get('metrics') or {}).get('latencyMs')
+        if latency_ms is not None:
+            st.info(f"API调用耗时: {latency_ms / 1000:.2f}秒")
+        st.json(state['result']['output'])
+        st.json(state['result']['usage'])
+    with st.expander("Token 用量与成本"):
+        st.json(state['usage'])
+        st.json(get_ledger().summary())
+    if state['spans']:
+        with st.expander("阶段耗时"):
+            st.json(state['spans'])
+
+
+def poll_job(job_id):
+    """Progress of a running job; reruns the whole page once it is done"""
+    job = get_jobs().get(job_id)
+    if job is None:
+        return
+    state = job.snapshot()
+    st.progress(state['progress'], text=state['stage'])
+    if state['models']:
+        render_models(state['models'])
+    if state['done']:
+        st.rerun()
 
-    response = bedrock_runtime.converse(
-        modelId=model_id,
-        messages=messages,
-        system=system,
-        inferenceConfig=inferenceConfig
-    )
 
-    # 计算耗时
-    elapsed_time = time.time() - start_time
-    st.info(f"API调用耗时: {elapsed_time:.2f}秒")
-    return response
+if hasattr(st, 'fragment'):
+    # 只刷新进度条所在的片段，不阻塞也不重跑整个页面
+    poll_job = st.fragment(run_every=1.0)(poll_job)
 
 
 # Initialize session state
@@ -337,6 +515,17 @@ Content Detection: Check whether the video involves inappropriate content such a
 
     length = st.text_input("生成长度", value="1024")
 
+    compare = st.checkbox("多模型对比（共用同一组抽帧，并发调用）")
+    compare_models = st.multiselect("对比模型", IMAGE_MODELS, default=list(IMAGE_MODELS[:2]),
+                                    disabled=not compare)
+
+    nova_input = st.radio("Nova 输入方式", ("抽帧图片", "视频"))
+
+    use_proxy = st.checkbox("生成审核代理视频（ffmpeg 降分辨率/帧率/码率，去音轨）", value=True)
+
+    # 0 表示不限制；超出时降级模型或减少帧数
+    token_budget = st.number_input("Token 预算", min_value=0, value=0, step=1000)
+
     # s3_bucket = st.text_input("S3 Bucket", value="")
 
 st.header('AWS Bedrock 视频理解样例')
@@ -350,9 +539,11 @@ Path(tmp_dir).mkdir(parents=True, exist_ok=True)
 uploaded_video = st.file_uploader(
     "请选择要上传的视频文件", type=["mp4", "mov", "avi", "mkv"])
 
+video_local_path = None
 if uploaded_video is not None:
-    if uploaded_video.size / (1024 * 1024) > 25:
-        st.error("视频大小不能超过25MB")
+    max_upload_mb = MAX_PROXY_UPLOAD_MB if use_proxy else MAX_INLINE_VIDEO_MB
+    if uploaded_video.size / (1024 * 1024) > max_upload_mb:
+        st.error(f"视频大小不能超过{max_upload_mb}MB")
         st.stop()
 
     # 显示上传的视频信息
@@ -367,17 +558,25 @@ if uploaded_video is not None:
         # 显示上传的视频
         st.video(uploaded_video)
 
-    # 保存视频到本地tmp目录
-    save_path = os.path.join(tmp_dir, uploaded_video.name)
-    with open(save_path, "wb") as f:
-        f.write(uploaded_video.getbuffer())
+    # 保存视频到本地tmp目录：按内容哈希命名，每次 rerun 不再重复写入
+    upload_key = (uploaded_video.name, uploaded_video.size, getattr(uploaded_video, 'file_id', None))
+    if st.session_state.get('upload_key') != upload_key:
+        video_hash = hashlib.sha256(uploaded_video.getbuffer()).hexdigest()
+        ext = os.path.splitext(uploaded_video.name)[1].lower()
+        save_path = os.path.join(tmp_dir, f'{video_hash[:16]}{ext}')
+        if not os.path.exists(save_path):
+            with open(save_path, "wb") as f:
+                f.write(uploaded_video.getbuffer())
+        st.session_state.upload_key = upload_key
+        st.session_state.video_hash = video_hash
+        st.session_state.video_path = save_path
+    video_local_path = st.session_state.video_path
 
     with col2:
         st.write("文件详情:")
         for key, value in file_details.items():
             st.write(f"{key}: {value}")
-        video_local_path = st.text_input(
-            'video_local_path', value=save_path, disabled=True)
+        st.text_input('video_local_path', value=video_local_path, disabled=True)
 
 
 prompt = st.text_area("提示词", value="", height=200, key="prompt")
@@ -389,31 +588,33 @@ if st.button("提交"):
     if not video_local_path:
         st.error("请上传视频")
         st.stop()
-    if model.startswith("us.amazon.nova"):
-        my_bar = st.progress(0, text="Processing...")
-        with st.spinner('Processing...'):
-            try:
-                # response = call_nova(model, system_prompt, temperature,
-                #                      top_p, length, video_local_path, prompt)
-                response = call_nova_by_image(
-                    model, system_prompt, temperature, top_p, length, video_local_path, prompt)
-                st.json(response.get("output"))
-                st.json(response.get("usage"))
-            except Exception as e:
-                st.error(f"call nova failed: {str(e)}")
-            finally:
-                my_bar.progress(100, text="Done")
-    elif model.startswith("us.anthropic.claude"):
-        my_bar = st.progress(0, text="Processing...")
-        with st.spinner('Processing...'):
-            try:
-                response = call_claude(model, system_prompt, temperature,
-                                       top_p, length, video_local_path, prompt)
-                st.json(response.get("output"))
-                st.json(response.get("usage"))
-            except Exception as e:
-                st.error(f"call nova failed: {str(e)}")
-            finally:
-                my_bar.progress(100, text="Done")
+    if compare and not compare_models:
+        st.error("请选择对比模型")
+        st.stop()
+    # 提交到所有会话共享的线程池，页面只轮询进度
+    job = submit_job({
+        'model': model,
+        'system_prompt': system_prompt,
+        'temperature': temperature,
+        'top_p': top_p,
+        'length': length,
+        'video_local_path': video_local_path,
+        'video_hash': st.session_state.video_hash,
+        'prompt': prompt,
+        'nova_input': nova_input,
+        'use_proxy': use_proxy,
+        'token_budget': int(token_budget),
+        'models': list(compare_models) if compare else None,
+    })
+    st.session_state.job_id = job.id
+
+job_id = st.session_state.get('job_id')
+current_job = get_jobs().get(job_id) if job_id else None
+if current_job is not None:
+    if current_job.done:
+        render_job(current_job)
     else:
-        st.error("暂不支持此模型")
+        poll_job(job_id)
+        if not hasattr(st, 'fragment'):
+            time.sleep(1)
+            st.rerun()
@@ -0,0 +1,393 @@
+"""Local stand-in for the AWS APIs the Lambda uses, for offline load tests
+
+Implements the subset the handler calls:
+  bedrock-runtime  Converse, ConverseStream (event stream framing)
+  rekognition      DetectFaces, DetectModerationLabels
+  s3               HeadObject, GetObject (incl. Range), served from --s3-root/<bucket>/<key>
+
+Every operation has a configurable latency distribution (lognormal around a
+median), throttle rate and canned response; see DEFAULT_CONFIG. GET /_stats
+returns per-operation counters, POST /_reset clears them.
+
+Point boto3 at it with AWS_ENDPOINT_URL=http://127.0.0.1:9000 and
+AWS_S3_ADDRESSING_STYLE=path (any dummy credentials).
+
+Usage: python benchmarks/aws_stub_server.py --s3-root ./fixtures [--port 9000] [--config stub.json] [--time-scale 1.0]
+"""
+import argparse
+import base64
+import binascii
+import copy
+import email.utils
+import io
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from PIL import Image
+
+NO_ISSUE_TEXT = json.dumps({
+    'NO_ISSUE': {'explanation': 'stub response', 'is_exist': 1, 'confidence': 90}
+})
+
+DEFAULT_CONFIG = {
+    'converse': {
+        'latency_ms': {'median': 1500, 'sigma': 0.35},
+        'throttle_rate': 0.0,
+        'text': NO_ISSUE_TEXT,
+        'input_tokens': 3000,
+        'output_tokens': 150,
+    },
+    'converse_stream': {
+        'latency_ms': {'median': 1500, 'sigma': 0.35},
+        'throttle_rate': 0.0,
+        'text': NO_ISSUE_TEXT,
+        'input_tokens': 3000,
+        'output_tokens': 150,
+        'chunks': 8,
+    },
+    'detect_faces': {
+        'latency_ms': {'median': 250, 'sigma': 0.3},
+        'throttle_rate': 0.0,
+        # per_tile: 一个清晰的成年人脸位于拼图每一格中心；none: 不返回人脸
+        'faces': 'per_tile',
+        # 抽帧画面的宽高比，用于从拼图尺寸推算行数
+        'tile_aspect': 4 / 3,
+        'cols': 3,
+        'confidence': 99.5,
+        'age_range': [25, 35],
+        'gender': 'Female',
+    },
+    'detect_moderation_labels': {
+        'latency_ms': {'median': 200, 'sigma': 0.3},
+        'throttle_rate': 0.0,
+        'labels': [],
+    },
+    's3_get': {
+        'latency_ms': {'median': 15, 'sigma': 0.5},
+        'throttle_rate': 0.0,
+    },
+}
+
+CONVERSE_PATH = re.compile(r'^/model/(?P<model>[^/]+)/(?P<op>converse|converse-stream)$')
+
+
+def merge_config(base, override):
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def sample_latency(latency, time_scale=1.0):
+    """Seconds drawn from a lognormal with the given median (ms) and sigma"""
+    median = latency.get('median', 0) / 1000
+    sigma = latency.get('sigma', 0)
+    value = median * math.exp(random.gauss(0, sigma)) if sigma else median
+    return value * time_scale
+
+
+def event_stream_message(event_type, payload):
+    """One application/vnd.amazon.eventstream frame"""
+    headers = b''
+    for name, value in ((':event-type', event_type), (':content-type', 'application/json'),
+                        (':message-type', 'event')):
+        name_bytes, value_bytes = name.encode(), value.encode()
+        headers += struct.pack('>B', len(name_bytes)) + name_bytes + b'\x07' + struct.pack('>H', len(value_bytes)) + value_bytes
+    body = json.dumps(payload).encode()
+    total_length = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack('>II', total_length, len(headers))
+    prelude += struct.pack('>I', binascii.crc32(prelude) & 0xffffffff)
+    message = prelude + headers + body
+    return message + struct.pack('>I', binascii.crc32(message) & 0xffffffff)
+
+
+def mosaic_faces(image_bytes, config):
+    """One face per mosaic tile, with the grid inferred from the image size"""
+    if config.get('faces') != 'per_tile':
+        return []
+    width, height = Image.open(io.BytesIO(image_bytes)).size
+    cols = config['cols']
+    tile_height = width / cols / config['tile_aspect']
+    rows = max(1, round(height / tile_height))
+    faces = []
+    for row in range(rows):
+        for col in range(cols):
+            faces.append({
+                'BoundingBox': {'Left': (col + 0.35) / cols, 'Top': (row + 0.3) / rows,
+                                'Width': 0.3 / cols, 'Height': 0.4 / rows},
+                'Confidence': config['confidence'],
+                'AgeRange': {'Low': config['age_range'][0], 'High': config['age_range'][1]},
+                'Gender': {'Value': config['gender'], 'Confidence': 99.0},
+                'FaceOccluded': {'Value': False, 'Confidence': 99.0},
+            })
+    return faces
+
+
+class StubState:
+    def __init__(self, config, s3_root, time_scale=1.0):
+        self.config = config
+        self.s3_root = s3_root
+        self.time_scale = time_scale
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def count(self, operation, throttled=False, bytes_in=0, bytes_out=0):
+        with self._lock:
+            entry = self.stats.setdefault(operation, {'requests': 0, 'throttled': 0, 'bytes_in': 0, 'bytes_out': 0})
+            entry['requests'] += 1
+            entry['throttled'] += int(throttled)
+            entry['bytes_in'] += bytes_in
+            entry['bytes_out'] += bytes_out
+
+    def snapshot(self):
+        with self._lock:
+            return copy.deepcopy(self.stats)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'AWSStub/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None, content_type='application/json'):
+        self._send(status, json.dumps(payload).encode(), content_type, headers)
+
+    def _delay(self, operation):
+        time.sleep(sample_latency(self.state.config[operation]['latency_ms'], self.state.time_scale))
+
+    def _throttled(self, operation):
+        return random.random() < self.state.config[operation].get('throttle_rate', 0)
+
+    # ---- routing ----
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/_stats':
+            return self._send_json(200, self.state.snapshot())
+        return self._s3_get(path)
+
+    def do_HEAD(self):
+        return self._s3_get(urlparse(self.path).path)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._read_body()
+        if path == '/_reset':
+            self.state.reset()
+            return self._send_json(200, {})
+        match = CONVERSE_PATH.match(path)
+        if match:
+            return self._converse(unquote(match.group('model')), match.group('op'), body)
+        target = self.headers.get('X-Amz-Target', '')
+        if target == 'RekognitionService.DetectFaces':
+            return self._detect_faces(body)
+        if target == 'RekognitionService.DetectModerationLabels':
+            return self._detect_moderation_labels(body)
+        return self._send_json(404, {'message': f'Unsupported operation: {target or path}'})
+
+    # ---- bedrock-runtime ----
+
+    def _converse(self, model_id, op, body):
+        operation = 'converse' if op == 'converse' else 'converse_stream'
+        config = self.state.config[operation]
+        if self._throttled(operation):
+            self.state.count(operation, throttled=True, bytes_in=len(body))
+            return self._send_json(429, {'message': 'Too many requests, please wait before trying again.'},
+                                   headers={'x-amzn-ErrorType': 'ThrottlingException'})
+
+        latency = sample_latency(config['latency_ms'], self.state.time_scale)
+        usage = {'inputTokens': config['input_tokens'], 'outputTokens': config['output_tokens'],
+                 'totalTokens': config['input_tokens'] + config['output_tokens']}
+        metrics = {'latencyMs': int(latency * 1000)}
+        if operation == 'converse':
+            time.sleep(latency)
+            payload = {
+                'output': {'message': {'role': 'assistant', 'content': [{'text': config['text']}]}},
+                'stopReason': 'end_turn',
+                'usage': usage,
+                'metrics': metrics,
+            }
+            response = json.dumps(payload).encode()
+            self.state.count(operation, bytes_in=len(body), bytes_out=len(response))
+            return self._send(200, response)
+
+        # 首个 token 在一半延迟后到达，其余分块均匀输出
+        text = config['text']
+        n_chunks = max(1, config['chunks'])
+        size = max(1, math.ceil(len(text) / n_chunks))
+        events = [event_stream_message('messageStart', {'role': 'assistant'})]
+        events += [event_stream_message('contentBlockDelta', {'contentBlockIndex': 0, 'delta': {'text': text[i:i + size]}})
+                   for i in range(0, len(text), size)]
+        events += [event_stream_message('contentBlockStop', {'contentBlockIndex': 0}),
+                   event_stream_message('messageStop', {'stopReason': 'end_turn'}),
+                   event_stream_message('metadata', {'usage': usage, 'metrics': metrics})]
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.amazon.eventstream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        time.sleep(latency / 2)
+        step = latency / 2 / len(events)
+        for event in events:
+            self.wfile.write(f'{len(event):x}\r\n'.encode() + event + b'\r\n')
+            self.wfile.flush()
+            time.sleep(step)
+        self.wfile.write(b'0\r\n\r\n')
+        self.state.count(operation, bytes_in=len(body), bytes_out=sum(len(e) for e in events))
+
+    # ---- rekognition ----
+
+    def _rekognition_throttle(self, operation, body):
+        self.state.count(operation, throttled=True, bytes_in=len(body))
+        self._send_json(400, {'__type': 'ThrottlingException', 'message': 'Rate exceeded'},
+                        content_type='application/x-amz-json-1.1')
+
+    def _detect_faces(self, body):
+        operation = 'detect_faces'
+        if self._throttled(operation):
+            return self._rekognition_throttle(operation, body)
+        self._delay(operation)
+        image_bytes = base64.b64decode(json.loads(body)['Image']['Bytes'])
+        payload = {'FaceDetails': mosaic_faces(image_bytes, self.state.config[operation])}
+        self.state.count(operation, bytes_in=len(body))
+        self._send_json(200, payload, content_type='application/x-amz-json-1.1')
+
+    def _detect_moderation_labels(self, body):
+        operation = 'detect_moderation_labels'
+        if self._throttled(operation):
+            return self._rekognition_throttle(operation, body)
+        self._delay(operation)
+        payload = {'ModerationLabels': self.state.config[operation]['labels'], 'ModerationModelVersion': '7.0'}
+        self.state.count(operation, bytes_in=len(body))
+        self._send_json(200, payload, content_type='application/x-amz-json-1.1')
+
+    # ---- s3 ----
+
+    def _s3_error(self, status, code, message):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code><Message>{message}</Message></Error>'
+        self._send(status, body.encode(), content_type='application/xml')
+
+    def _s3_get(self, path):
+        operation = 's3_get'
+        bucket, _, key = unquote(path.lstrip('/')).partition('/')
+        file_path = os.path.realpath(os.path.join(self.state.s3_root, bucket, key))
+        if not key or not file_path.startswith(os.path.realpath(self.state.s3_root) + os.sep):
+            return self._s3_error(400, 'InvalidRequest', 'Path-style bucket/key expected')
+        if self._throttled(operation):
+            self.state.count(operation, throttled=True)
+            return self._s3_error(503, 'SlowDown', 'Please reduce your request rate.')
+        if not os.path.isfile(file_path):
+            self.state.count(operation)
+            return self._s3_error(404, 'NoSuchKey', 'The specified key does not exist.')
+        self._delay(operation)
+
+        stat = os.stat(file_path)
+        size = stat.st_size
+        start, end = 0, size - 1
+        status = 200
+        headers = {
+            'ETag': f'"{int(stat.st_mtime)}-{size}"',
+            'Last-Modified': email.utils.formatdate(stat.st_mtime, usegmt=True),
+            'Accept-Ranges': 'bytes',
+        }
+        range_header = self.headers.get('Range')
+        if range_header:
+            match = re.match(r'bytes=(\d*)-(\d*)$', range_header)
+            if not match:
+                return self._s3_error(416, 'InvalidRange', 'The requested range is not satisfiable')
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(size - 1, int(last)) if last else size - 1
+            else:
+                start, end = max(0, size - int(last)), size - 1
+            if start > end:
+                return self._s3_error(416, 'InvalidRange', 'The requested range is not satisfiable')
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        if self.command == 'HEAD':
+            self.state.count(operation)
+            return self._send_head(size, headers)
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.state.count(operation, bytes_out=len(data))
+        self._send(status, data, 'binary/octet-stream', headers)
+
+    def _send_head(self, size, headers):
+        self.send_response(200)
+        self.send_header('Content-Type', 'binary/octet-stream')
+        self.send_header('Content-Length', str(size))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+
+def start_server(config=None, s3_root='.', host='127.0.0.1', port=0, time_scale=1.0):
+    """Start the stub in a background thread, returns (server, endpoint_url)"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(merge_config(DEFAULT_CONFIG, config), s3_root, time_scale)
+    thread = threading.Thread(target=server.serve_forever, name='aws-stub', daemon=True)
+    thread.start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--s3-root', default='.')
+    parser.add_argument('--config', default=None, help='JSON file overriding DEFAULT_CONFIG per operation')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='multiply every sampled latency')
+    args = parser.parse_args()
+
+    config = None
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    server, endpoint_url = start_server(config, args.s3_root, args.host, args.port, args.time_scale)
+    print(f"AWS stub listening on {endpoint_url} (s3 root: {os.path.abspath(args.s3_root)})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
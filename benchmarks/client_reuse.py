@@ -0,0 +1,78 @@
+"""Warm-invocation overhead of per-call boto3 clients vs the shared client registry
+
+Measures client acquisition per invocation and, with --endpoint-url (e.g. a local
+stub server), end-to-end detect_faces throughput at the given concurrency.
+
+Usage: python benchmarks/client_reuse.py [--iterations 200] [--endpoint-url http://127.0.0.1:9000] [--concurrency 16]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+from aws_clients import get_client, clear_clients  # noqa: E402
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+
+def tiny_jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+TINY_JPEG = tiny_jpeg()
+
+
+def timed(fn, iterations):
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start_time) / iterations * 1000
+
+
+def throughput(make_client, endpoint_url, calls, concurrency):
+    def one(_):
+        client = make_client()
+        client.detect_faces(Image={'Bytes': TINY_JPEG}, Attributes=['AGE_RANGE', 'GENDER', 'FACE_OCCLUDED'])
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(calls)))
+    return calls / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--endpoint-url', default=None)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--calls', type=int, default=500)
+    args = parser.parse_args()
+
+    per_call = timed(lambda: boto3.client('rekognition', region_name=REGION, endpoint_url=args.endpoint_url),
+                     args.iterations)
+    clear_clients()
+    first = timed(lambda: get_client('rekognition', REGION, args.endpoint_url), 1)
+    cached = timed(lambda: get_client('rekognition', REGION, args.endpoint_url), args.iterations)
+    print(f"boto3.client() per invocation:  {per_call:8.3f} ms")
+    print(f"registry, first (cold) call:    {first:8.3f} ms")
+    print(f"registry, warm call:            {cached:8.3f} ms")
+
+    if args.endpoint_url:
+        before = throughput(lambda: boto3.client('rekognition', region_name=REGION, endpoint_url=args.endpoint_url),
+                            args.endpoint_url, args.calls, args.concurrency)
+        after = throughput(lambda: get_client('rekognition', REGION, args.endpoint_url),
+                           args.endpoint_url, args.calls, args.concurrency)
+        print(f"detect_faces throughput, per-call clients: {before:8.1f} req/s")
+        print(f"detect_faces throughput, shared registry:  {after:8.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
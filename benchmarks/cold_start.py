@@ -0,0 +1,72 @@
+"""Cold-start (init) duration of the Lambda module
+
+Imports lambda_function in fresh interpreters and reports the init duration, which
+heavy modules were loaded at import time, and the slowest imports (python -X importtime).
+
+Usage: python benchmarks/cold_start.py [--runs 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+HEAVY_MODULES = ('cv2', 'numpy', 'PIL', 'requests', 'boto3', 'botocore')
+
+PROBE = f"""
+import sys, time
+start_time = time.perf_counter()
+import lambda_function
+elapsed = time.perf_counter() - start_time
+print(elapsed)
+print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+
+
+def run_once():
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=LAMBDA_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    # 没有加载任何重量级模块时第二行为空
+    elapsed, _, loaded = result.stdout.strip('\n').partition('\n')
+    return float(elapsed), loaded
+
+
+def slowest_imports(limit):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import lambda_function'], cwd=LAMBDA_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, raw_name = line[len('import time:'):].split('|')
+        # 嵌套导入带有额外缩进，只保留顶层导入
+        if len(raw_name) - len(raw_name.lstrip()) > 1:
+            continue
+        name = raw_name.strip()
+        rows.append((int(cumulative_us), name))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    durations = []
+    loaded = ''
+    for _ in range(args.runs):
+        elapsed, loaded = run_once()
+        durations.append(elapsed * 1000)
+    durations.sort()
+    print(f"init duration (import lambda_function), {args.runs} runs:")
+    print(f"  min {durations[0]:.1f} ms  median {statistics.median(durations):.1f} ms  max {durations[-1]:.1f} ms")
+    print(f"heavy modules loaded at init: {loaded or '(none)'}")
+    print("slowest top-level imports (cumulative):")
+    for cumulative_us, name in slowest_imports(args.top):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
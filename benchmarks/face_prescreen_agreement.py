@@ -0,0 +1,61 @@
+"""Agreement of the local face pre-screen with recorded Rekognition detect_faces responses
+
+Cases are recorded by the Lambda when FACE_RECORD_DIR is set; each case directory holds
+frames/*.jpg and detect_faces.json.
+
+Usage: python benchmarks/face_prescreen_agreement.py <record_dir>
+"""
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+from face_prescreen import prescreen_frames, local_face_result, get_detector  # noqa: E402
+from lambda_function import analysis_face_details  # noqa: E402
+
+
+def main(record_dir):
+    detector = get_detector()
+    cases = sorted(glob.glob(os.path.join(record_dir, '*', 'detect_faces.json')))
+    if not cases:
+        print(f"No recorded cases in {record_dir}")
+        return
+
+    decided = agreed_decided = agreed_overall = 0
+    local_seconds = []
+    for case_file in cases:
+        case_dir = os.path.dirname(case_file)
+        with open(case_file) as f:
+            case = json.load(f)
+        frame_paths = sorted(glob.glob(os.path.join(case_dir, 'frames', '*.jpg')))
+
+        start_time = time.perf_counter()
+        prescreen = prescreen_frames(frame_paths, detector)
+        local_seconds.append(time.perf_counter() - start_time)
+
+        rek_face_issue = 'FACE_ISSUE' in analysis_face_details(case['response'], case['sub_image_count'])
+        # 本地判定有无 FACE_ISSUE：使用与 Rekognition 相同的 2/3 判定线
+        local_face_issue = prescreen['frames_with_face'] < prescreen['frame_count'] * 2 / 3
+        agreed_overall += int(local_face_issue == rek_face_issue)
+        if local_face_result(prescreen):
+            decided += 1
+            agreed_decided += int(rek_face_issue)
+
+    n = len(cases)
+    local_seconds.sort()
+    print(f"cases:                       {n}")
+    print(f"decided locally:             {decided} ({decided / n:.1%}) -> Rekognition calls saved")
+    if decided:
+        print(f"agreement on local decisions: {agreed_decided / decided:.1%}")
+    print(f"FACE_ISSUE agreement overall: {agreed_overall / n:.1%}")
+    print(f"local pre-screen p50 / p95:  {local_seconds[n // 2] * 1000:.1f} / "
+          f"{local_seconds[min(n - 1, int(n * 0.95))] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python benchmarks/face_prescreen_agreement.py <record_dir>")
+        sys.exit(1)
+    main(sys.argv[1])
@@ -0,0 +1,161 @@
+"""Drive the Lambda handler at a target concurrency against the local AWS stub
+
+Starts benchmarks/aws_stub_server.py in-process (or uses --endpoint-url), writes a
+synthetic test video into the stub's S3 root, then invokes handler() from a thread
+pool and reports throughput, latency percentiles and error / throttle rates.
+
+Usage: python benchmarks/load_test.py [--requests 200] [--concurrency 16] [--config stub.json]
+                                      [--time-scale 0.1] [--video my.mp4] [--event '{"use_proxy": true}']
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCHMARK_DIR, '..', 'lambda'))
+sys.path.append(BENCHMARK_DIR)
+from aws_stub_server import start_server  # noqa: E402
+
+BUCKET = 'loadtest'
+
+
+class Context:
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def synthetic_video(path, seconds=10, fps=10, size=(320, 240)):
+    """Moving gradient with a bright block, so the quality checks see a normal video"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    width, height = size
+    base = np.tile(np.linspace(60, 200, width, dtype=np.uint8), (height, 1))
+    for i in range(seconds * fps):
+        frame = cv2.cvtColor(base, cv2.COLOR_GRAY2BGR)
+        x = (i * 3) % (width - 40)
+        cv2.rectangle(frame, (x, 80), (x + 40, 160), (40, 180, 230), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def configure_environment(endpoint_url):
+    # 必须在导入 lambda_function 之前设置，客户端按环境变量指向桩服务
+    os.environ['AWS_ENDPOINT_URL'] = endpoint_url
+    os.environ['AWS_S3_ADDRESSING_STYLE'] = 'path'
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('TRACE_ENABLED', '0')
+
+
+def run_load(handler, event, requests, concurrency):
+    def one(_):
+        start_time = time.perf_counter()
+        try:
+            response = handler(dict(event), Context())
+        except Exception as e:
+            response = {'err_no': 1, 'err_msg': f'{type(e).__name__}: {e}', 'data': {}}
+        return time.perf_counter() - start_time, response
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(requests)))
+    return time.perf_counter() - start_time, results
+
+
+def report(elapsed, results, concurrency, stub_stats):
+    latencies = [latency * 1000 for latency, _ in results]
+    errors = [r for _, r in results if r.get('err_no') != 0]
+    throttled = [r for r in errors if 'Throttl' in r.get('err_msg', '') or 'SlowDown' in r.get('err_msg', '')]
+    tags = {}
+    for _, r in results:
+        for tag in r.get('data', {}):
+            tags[tag] = tags.get(tag, 0) + 1
+    error_messages = {}
+    for r in errors:
+        error_messages[r['err_msg'][:120]] = error_messages.get(r['err_msg'][:120], 0) + 1
+    return {
+        'requests': len(results),
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(results) / elapsed, 2),
+        'latency_ms': {p: round(percentile(latencies, v), 1)
+                       for p, v in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))},
+        'error_rate': round(len(errors) / len(results), 4),
+        'throttle_rate': round(len(throttled) / len(results), 4),
+        'errors': error_messages,
+        'tags': tags,
+        'stub': stub_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--endpoint-url', default=None, help='use a running stub instead of starting one')
+    parser.add_argument('--s3-root', default=None, help='S3 root of the running stub (with --endpoint-url)')
+    parser.add_argument('--config', default=None, help='stub config JSON (in-process stub only)')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='stub latency multiplier (in-process stub only)')
+    parser.add_argument('--video', default=None, help='video to upload, default: synthetic 10s 320x240')
+    parser.add_argument('--event', default='{}', help='extra handler event fields as JSON')
+    parser.add_argument('--output', default=None, help='write the report JSON to this file')
+    args = parser.parse_args()
+
+    work_dir = args.s3_root or tempfile.mkdtemp(prefix='loadtest_')
+    os.makedirs(os.path.join(work_dir, BUCKET), exist_ok=True)
+    key = 'video' + (os.path.splitext(args.video)[1] if args.video else '.mp4')
+    if args.video:
+        shutil.copy(args.video, os.path.join(work_dir, BUCKET, key))
+    else:
+        synthetic_video(os.path.join(work_dir, BUCKET, key))
+
+    server = None
+    endpoint_url = args.endpoint_url
+    if endpoint_url is None:
+        config = None
+        if args.config:
+            with open(args.config) as f:
+                config = json.load(f)
+        server, endpoint_url = start_server(config, work_dir, time_scale=args.time_scale)
+    configure_environment(endpoint_url)
+
+    from lambda_function import handler
+
+    event = {'video_s3_uri': f's3://{BUCKET}/{key}', **json.loads(args.event)}
+    # 预热：客户端创建、OpenCV 等首次导入不计入结果
+    handler(dict(event), Context())
+    if server:
+        server.state.reset()
+
+    elapsed, results = run_load(handler, event, args.requests, args.concurrency)
+    result = report(elapsed, results, args.concurrency, server.state.snapshot() if server else None)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+    if server:
+        server.shutdown()
+    if not args.s3_root:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
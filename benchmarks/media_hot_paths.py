@@ -0,0 +1,214 @@
+"""Micro-benchmarks for the media hot paths, with baseline comparison
+
+Benchmarks extract_frames / resize_image (frame_utils, used by app.py; the
+pre-draft serial resize is kept here as resize_image_legacy for comparison),
+extract_and_merge_all_frames and analysis_merged_images (detect_faces replaced
+by a canned per-tile response) from the Lambda, and VideoQualityChecker.check_all
+on the synthetic clips from synthetic_videos.py.
+
+Each case runs --warmup untimed rounds and --rounds timed rounds; min/median/mean/
+stddev/max are reported in ms. --save writes the results as a baseline JSON;
+--compare exits with status 1 if any case's median regressed by more than
+--max-regression against that baseline.
+
+Usage: python benchmarks/media_hot_paths.py [--rounds 5] [--filter merge] [--save baseline.json]
+                                            [--compare baseline.json --max-regression 0.15]
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCHMARK_DIR, '..'))
+sys.path.append(os.path.join(BENCHMARK_DIR, '..', 'lambda'))
+sys.path.append(BENCHMARK_DIR)
+from synthetic_videos import ensure_clips  # noqa: E402
+from aws_stub_server import DEFAULT_CONFIG, mosaic_faces  # noqa: E402
+from frame_utils import extract_frames, resize_image  # noqa: E402
+from video_quality_checker import VideoQualityChecker  # noqa: E402
+import lambda_function  # noqa: E402
+from PIL import Image  # noqa: E402
+
+DEFAULT_FIXTURES_DIR = os.path.join(tempfile.gettempdir(), 'video_understanding_bench_fixtures')
+
+
+def bench(fn, setup=None, rounds=5, warmup=1):
+    """Time fn(setup()) over rounds; setup is not timed"""
+    timings = []
+    for i in range(warmup + rounds):
+        arg = setup() if setup else None
+        start_time = time.perf_counter()
+        fn(arg)
+        elapsed = (time.perf_counter() - start_time) * 1000
+        if i >= warmup:
+            timings.append(elapsed)
+    return {
+        'rounds': rounds,
+        'min': round(min(timings), 3),
+        'median': round(statistics.median(timings), 3),
+        'mean': round(statistics.mean(timings), 3),
+        'stddev': round(statistics.stdev(timings), 3) if len(timings) > 1 else 0.0,
+        'max': round(max(timings), 3),
+    }
+
+
+def get_mime_type(file_path):
+    # 旧版 resize_image 用 python-magic 判断格式，只有对比基准需要
+    import magic
+
+    mime = magic.Magic(mime=True)
+    mime_type = mime.from_file(file_path)
+    return mime_type
+
+
+def resize_image_legacy(images):
+    """resize_image before draft decoding / thread pool / byte target: full decode, serial"""
+    image_bytes_list = []
+    for file_path in images:
+        image_format = get_mime_type(file_path).split('/')[1]
+        file_size = os.path.getsize(file_path)
+        with Image.open(file_path) as img:
+            if max(img.width, img.height) > 720:
+                ratio = 720 / max(img.width, img.height)
+                img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.Resampling.LANCZOS)
+            if file_size > 3 * 1024 * 1024:
+                img = img.resize((img.width // 2, img.height // 2), Image.Resampling.LANCZOS)
+            img_byte_arr = io.BytesIO()
+            img.save(img_byte_arr, format=img.format if img.format else image_format)
+            image_bytes_list.append((image_format, img_byte_arr.getvalue()))
+    return image_bytes_list
+
+
+def fresh_copy(work_dir, clip):
+    """Copy a clip into its own directory, the Lambda writes frames/mosaic next to the video"""
+    def setup():
+        case_dir = tempfile.mkdtemp(dir=work_dir)
+        path = os.path.join(case_dir, os.path.basename(clip['path']))
+        shutil.copy(clip['path'], path)
+        return path
+    return setup
+
+
+def canned_face_detection(tile_aspect):
+    config = dict(DEFAULT_CONFIG['detect_faces'], tile_aspect=tile_aspect)
+
+    def detect(image):
+        return {'FaceDetails': mosaic_faces(lambda_function.read_image(image), config)}
+    return detect
+
+
+def build_cases(clips, work_dir):
+    """name -> (fn, setup)"""
+    cases = {}
+    for name, clip in clips.items():
+        cases[f'extract_frames[{name}]'] = (
+            lambda path: extract_frames(path, path + '_frames', 1), fresh_copy(work_dir, clip))
+        cases[f'extract_and_merge_all_frames[{name}]'] = (
+            lambda path: lambda_function.extract_and_merge_all_frames(path), fresh_copy(work_dir, clip))
+        cases[f'check_all[{name}]'] = (
+            lambda path: VideoQualityChecker(path).check_all(), lambda clip=clip: clip['path'])
+
+    # resize_image 和 analysis_merged_images 的输入只准备一次
+    for name in ('hd_720p_30fps_15s', 'fhd_1080p_25fps_8s'):
+        if name not in clips:
+            continue
+        clip = clips[name]
+        frames_dir = os.path.join(work_dir, f'{name}_frames')
+        extract_frames(clip['path'], frames_dir, 1)
+        frame_paths = sorted(glob.glob(os.path.join(frames_dir, '*.jpg')))[:20]
+        cases[f'resize_image_legacy[{name}]'] = (resize_image_legacy, lambda paths=frame_paths: paths)
+        cases[f'resize_image_serial[{name}]'] = (
+            lambda paths: resize_image(paths, workers=1), lambda paths=frame_paths: paths)
+        cases[f'resize_image[{name}]'] = (lambda paths: resize_image(paths), lambda paths=frame_paths: paths)
+
+        video_path = fresh_copy(work_dir, clip)()
+        merged, n = lambda_function.extract_and_merge_all_frames(video_path)
+        detect = canned_face_detection(clip['width'] / clip['height'])
+        cases[f'analysis_merged_images[{name}]'] = (
+            lambda args, detect=detect: analysis_with(detect, *args), lambda merged=merged, n=n: (merged, n))
+    return cases
+
+
+def analysis_with(detect, merged, n):
+    original = lambda_function.faceDetection
+    lambda_function.faceDetection = detect
+    try:
+        return lambda_function.analysis_merged_images(merged, n)
+    finally:
+        lambda_function.faceDetection = original
+
+
+def compare(results, baseline, max_regression):
+    """Cases whose median is slower than baseline by more than max_regression"""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get('benchmarks', {}).get(name)
+        if not base:
+            continue
+        change = stats['median'] / base['median'] - 1
+        stats['change'] = round(change, 4)
+        if change > max_regression:
+            regressions.append((name, base['median'], stats['median'], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--filter', default=None, help='only run cases whose name contains this')
+    parser.add_argument('--fixtures-dir', default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument('--save', default=None, help='write results as a baseline JSON')
+    parser.add_argument('--compare', default=None, help='baseline JSON to compare medians against')
+    parser.add_argument('--max-regression', type=float, default=0.15)
+    args = parser.parse_args()
+
+    clips = ensure_clips(args.fixtures_dir)
+    work_dir = tempfile.mkdtemp(prefix='media_bench_')
+    try:
+        cases = build_cases(clips, work_dir)
+        results = {}
+        for name, (fn, setup) in cases.items():
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = bench(fn, setup, args.rounds, args.warmup)
+            stats = results[name]
+            print(f"{name:60s} median {stats['median']:10.2f} ms  min {stats['min']:10.2f}  "
+                  f"stddev {stats['stddev']:8.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before:.2f} ms -> {after:.2f} ms ({change:+.1%})")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"No regressions above {args.max_regression:.0%} against {args.compare}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                            'processor': platform.processor(), 'cpus': os.cpu_count()},
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'benchmarks': results,
+            }, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Scaling of the keyframe-range parallel decoder with the number of worker processes
+
+Generates a long synthetic clip (cached in --fixtures-dir), then samples it at
+--fps with lambda/parallel_decode.decode_frames for each worker count and
+reports the median wall time, frames/s and speedup over 1 worker. Every run
+must return the same timestamps as the single-process decode.
+
+Usage: python benchmarks/parallel_decode_scaling.py [--seconds 120] [--size 1920x1080] [--fps 1]
+                                                    [--workers 1,2,4,8] [--rounds 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCHMARK_DIR, '..', 'lambda'))
+sys.path.append(BENCHMARK_DIR)
+from synthetic_videos import make_clip  # noqa: E402
+import parallel_decode  # noqa: E402
+
+DEFAULT_FIXTURES_DIR = os.path.join(tempfile.gettempdir(), 'video_understanding_bench_fixtures')
+
+
+def ensure_long_clip(fixtures_dir, width, height, seconds, fps=25):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    path = os.path.join(fixtures_dir, f'long_{width}x{height}_{fps}fps_{seconds}s.mp4')
+    if not os.path.exists(path):
+        tmp_path = path + '.tmp.mp4'
+        make_clip(tmp_path, width, height, fps, seconds, gop=fps * 2)
+        os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=int, default=120)
+    parser.add_argument('--size', default='1920x1080')
+    parser.add_argument('--fps', type=float, default=1, help='sampling rate')
+    parser.add_argument('--workers', default=None, help='comma separated, default: 1,2,4,... up to the CPU count')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--fixtures-dir', default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument('--output', default=None, help='write the results JSON to this file')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split('x'))
+    path = ensure_long_clip(args.fixtures_dir, width, height, args.seconds)
+    times = [i / args.fps for i in range(int(args.seconds * args.fps))]
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(',')]
+    else:
+        cpus = os.cpu_count() or 1
+        worker_counts = sorted({1, cpus} | {2 ** i for i in range(1, 6) if 2 ** i <= cpus})
+    # 基准对比的是并行本身，不受最短时长阈值影响
+    parallel_decode.DECODE_MIN_SECONDS = 0
+
+    reference = None
+    results = []
+    for workers in worker_counts:
+        timings = []
+        for _ in range(args.rounds):
+            start_time = time.perf_counter()
+            frames = parallel_decode.decode_frames(path, times, args.seconds, workers=workers)
+            timings.append(time.perf_counter() - start_time)
+        stamps = [t for t, _ in frames]
+        if reference is None:
+            reference = stamps
+        elif stamps != reference:
+            raise SystemExit(f"workers={workers} returned different timestamps than workers={worker_counts[0]}")
+        median = statistics.median(timings)
+        results.append({'workers': workers, 'median_s': round(median, 3), 'frames': len(frames),
+                        'frames_per_s': round(len(frames) / median, 1)})
+    for result in results:
+        result['speedup'] = round(results[0]['median_s'] / result['median_s'], 2)
+        print(f"workers {result['workers']:3d}  median {result['median_s']:8.3f} s  "
+              f"{result['frames_per_s']:8.1f} frames/s  speedup {result['speedup']:5.2f}x")
+
+    report = {'video': {'path': path, 'size': args.size, 'seconds': args.seconds},
+              'cpus': os.cpu_count(), 'sample_fps': args.fps, 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
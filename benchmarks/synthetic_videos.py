@@ -0,0 +1,82 @@
+"""Deterministic synthetic clips for the benchmarks
+
+Every clip is generated with cv2.VideoWriter from a fixed seed: a textured
+background with moving shapes, optionally with black and frozen segments, so
+the quality checker's blackdetect / freezedetect paths are exercised too.
+"""
+import json
+import os
+
+import cv2
+import numpy as np
+
+# name -> (width, height, fps, seconds, gop, black (start, end) or None, frozen (start, end) or None)
+CLIP_SPECS = {
+    'small_240p_10fps_10s': (320, 240, 10, 10, 10, None, None),
+    'hd_720p_30fps_15s': (1280, 720, 30, 15, 60, None, None),
+    'fhd_1080p_25fps_8s': (1920, 1080, 25, 8, 250, None, None),
+    'portrait_720x1280_30fps_6s': (720, 1280, 30, 6, 30, None, None),
+    'black_frozen_480p_25fps_12s': (854, 480, 25, 12, 25, (3, 6), (8, 11)),
+}
+
+
+def render_frame(index, width, height, fps, texture):
+    t = index / fps
+    frame = texture.copy()
+    # 水平移动的矩形和沿圆周移动的圆，模拟正常运动
+    x = int((t * width / 4) % max(1, width - width // 6))
+    cv2.rectangle(frame, (x, height // 3), (x + width // 6, height // 3 + height // 4), (40, 180, 230), -1)
+    cx = int(width / 2 + width / 4 * np.cos(t))
+    cy = int(height / 2 + height / 4 * np.sin(t))
+    cv2.circle(frame, (cx, cy), max(8, min(width, height) // 10), (230, 200, 60), -1)
+    cv2.putText(frame, f'{t:5.2f}s', (10, max(30, height // 12)), cv2.FONT_HERSHEY_SIMPLEX,
+                max(0.6, width / 1280), (255, 255, 255), 2)
+    return frame
+
+
+def make_clip(path, width, height, fps, seconds, gop=None, black=None, frozen=None, seed=0):
+    """Write one clip; gop is requested from the writer backend via VIDEOWRITER_PROP_KEY_INTERVAL"""
+    params = [cv2.VIDEOWRITER_PROP_KEY_INTERVAL, gop] if gop else []
+    writer = cv2.VideoWriter(path, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height), params)
+    if not writer.isOpened():
+        raise RuntimeError(f"Failed to open VideoWriter for {path}")
+    rng = np.random.RandomState(seed)
+    texture = cv2.resize(rng.randint(40, 200, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8),
+                         (width, height), interpolation=cv2.INTER_LINEAR)
+    black_frame = np.zeros((height, width, 3), np.uint8)
+    frozen_frame = None
+    for index in range(int(seconds * fps)):
+        t = index / fps
+        if black and black[0] <= t < black[1]:
+            frame = black_frame
+        elif frozen and frozen[0] <= t < frozen[1]:
+            if frozen_frame is None:
+                frozen_frame = render_frame(index, width, height, fps, texture)
+            frame = frozen_frame
+        else:
+            frame = render_frame(index, width, height, fps, texture)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def ensure_clips(fixtures_dir, names=None):
+    """Generate the clips that are missing, returns {name: {"path", "width", ...}}"""
+    os.makedirs(fixtures_dir, exist_ok=True)
+    clips = {}
+    for name in names or CLIP_SPECS:
+        width, height, fps, seconds, gop, black, frozen = CLIP_SPECS[name]
+        path = os.path.join(fixtures_dir, f'{name}.mp4')
+        if not os.path.exists(path):
+            # 先写临时文件，避免中断后留下不完整的 fixture
+            tmp_path = os.path.join(fixtures_dir, f'.{name}.tmp.mp4')
+            make_clip(tmp_path, width, height, fps, seconds, gop, black, frozen)
+            os.replace(tmp_path, path)
+        clips[name] = {'path': path, 'width': width, 'height': height, 'fps': fps, 'seconds': seconds,
+                       'gop': gop, 'black': black, 'frozen': frozen}
+    return clips
+
+
+if __name__ == "__main__":
+    import sys
+    print(json.dumps(ensure_clips(sys.argv[1] if len(sys.argv) > 1 else 'fixtures'), indent=2))
@@ -0,0 +1,218 @@
+import hashlib
+import io
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda'))
+from parallel_decode import decode_frames  # noqa: E402
+
+# 图片长边上限与单张编码后的字节目标（Bedrock 单张图片上限 3.75MB）
+RESIZE_MAX_SIDE = int(os.environ.get('RESIZE_MAX_SIDE', 720))
+RESIZE_MAX_BYTES = int(os.environ.get('RESIZE_MAX_BYTES', 3 * 1024 * 1024))
+RESIZE_WORKERS = int(os.environ.get('RESIZE_WORKERS', min(8, os.cpu_count() or 1)))
+# 超出字节目标时依次尝试的 JPEG/WebP 质量，75 为 PIL 默认值
+RESIZE_QUALITY_STEPS = (75, 60, 45, 30)
+# 一次请求所有帧的总字节预算（0 表示不限制，原样发送），按帧平均分配
+PAYLOAD_BUDGET_BYTES = int(os.environ.get('PAYLOAD_BUDGET_BYTES', 4 * 1024 * 1024))
+# 质量搜索的下限与上限，低于下限宁可超预算也不再降质
+PAYLOAD_MIN_QUALITY = int(os.environ.get('PAYLOAD_MIN_QUALITY', 40))
+PAYLOAD_MAX_QUALITY = 90
+# 重新编码的格式：jpeg 或 webp
+PAYLOAD_FORMAT = os.environ.get('PAYLOAD_FORMAT', 'jpeg')
+PAYLOAD_CACHE_ENTRIES = int(os.environ.get('PAYLOAD_CACHE_ENTRIES', 512))
+
+_payload_cache = OrderedDict()
+_payload_cache_lock = threading.Lock()
+
+
+def extract_frames(video_path, output_dir, fps=1):
+    """
+    从视频中每秒提取一帧并保存到指定目录
+
+    参数:
+        video_path: 视频文件路径
+        output_dir: 输出图片保存目录
+        fps: 每秒提取的帧数，默认为1
+    """
+    # 创建输出目录（如果不存在）
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"创建输出目录: {output_dir}")
+
+    # 打开视频文件
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"错误: 无法打开视频 {video_path}")
+        return
+
+    # 获取视频信息
+    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    duration = total_frames / video_fps
+
+    print(f"视频信息:")
+    print(f"- 路径: {video_path}")
+    print(f"- FPS: {video_fps}")
+    print(f"- 总帧数: {total_frames}")
+    print(f"- 时长: {duration:.2f} 秒")
+
+    # 计算帧间隔
+    frame_interval = int(video_fps / fps)
+    if frame_interval < 1:
+        frame_interval = 1
+    cap.release()
+
+    # 长视频按关键帧切成多个区间，多进程并行解码（见 lambda/parallel_decode.py）
+    times = [index / video_fps for index in range(0, total_frames, frame_interval)]
+    frames = decode_frames(video_path, times, duration)
+
+    saved_count = 0
+    for timestamp, data in frames:
+        # 保存图片
+        output_path = os.path.join(
+            output_dir, f"frame_{saved_count:04d}_{timestamp:.2f}s.jpg")
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        saved_count += 1
+
+        # 显示进度
+        if saved_count % 10 == 0:
+            print(f"已保存 {saved_count} 帧图片，当前视频时间点: {timestamp:.2f}s")
+
+    print(f"完成! 共提取了 {saved_count} 帧图片，保存在 {output_dir}")
+
+
+def encode_image(img, image_format, max_bytes):
+    """Encode img, lowering the quality (then the size) until it fits max_bytes"""
+    # 有损格式从默认质量开始逐级降低，无损格式只能缩小尺寸
+    qualities = RESIZE_QUALITY_STEPS if image_format in ('jpeg', 'webp') else (None,)
+    while True:
+        for q in qualities:
+            img_byte_arr = io.BytesIO()
+            options = {'quality': q} if q is not None else {}
+            img.save(img_byte_arr, format=image_format, **options)
+            if img_byte_arr.tell() <= max_bytes:
+                return img_byte_arr.getvalue()
+        if min(img.width, img.height) <= 64:
+            return img_byte_arr.getvalue()
+        img = img.resize((img.width // 2, img.height // 2), Image.Resampling.LANCZOS)
+
+
+def preprocess_image(file_path, max_size=None, max_bytes=None):
+    """One frame -> (format, bytes) no larger than max_size px on the long side and max_bytes"""
+    max_size = max_size or RESIZE_MAX_SIDE
+    max_bytes = max_bytes or RESIZE_MAX_BYTES
+    with Image.open(file_path) as img:
+        # 格式取自文件头，和原先按 MIME 类型判断的子类型一致（jpeg/png/webp/gif）
+        image_format = img.format.lower()
+        ratio = max_size / max(img.width, img.height)
+        if ratio < 1:
+            new_size = (int(img.width * ratio), int(img.height * ratio))
+            # JPEG 直接以 1/2、1/4、1/8 缩小的 DCT 解码到不小于目标的尺寸，再做 LANCZOS
+            img.draft(img.mode, new_size)
+            img = img.resize(new_size, Image.Resampling.LANCZOS)
+        else:
+            img.load()
+        return image_format, encode_image(img, image_format, max_bytes)
+
+
+def resize_image(images, max_size=None, max_bytes=None, workers=None):
+    """Preprocess frames in parallel (PIL releases the GIL while decoding/encoding), order preserved"""
+    workers = min(workers or RESIZE_WORKERS, len(images)) or 1
+    if workers == 1:
+        return [preprocess_image(path, max_size, max_bytes) for path in images]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda path: preprocess_image(path, max_size, max_bytes), images))
+
+
+def encode_quality(img, image_format, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def search_quality(img, image_format, max_bytes, min_quality, max_quality=PAYLOAD_MAX_QUALITY):
+    """Highest quality in [min_quality, max_quality] whose encoding fits max_bytes
+
+    Returns (quality, bytes); when even min_quality does not fit, the
+    min_quality encoding is returned anyway.
+    """
+    best = encode_quality(img, image_format, max_quality)
+    if len(best) <= max_bytes:
+        return max_quality, best
+    lo, hi = min_quality, max_quality - 1
+    best_quality, best = None, None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        data = encode_quality(img, image_format, mid)
+        if len(data) <= max_bytes:
+            best_quality, best = mid, data
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    if best is None:
+        return min_quality, encode_quality(img, image_format, min_quality)
+    return best_quality, best
+
+
+def encode_frame(frame, max_bytes, image_format, min_quality):
+    """(format, bytes) -> (format, bytes, quality) within max_bytes, cached by frame hash
+
+    A frame already within max_bytes in the requested format is passed through
+    unchanged (quality None), so it is not re-encoded twice.
+    """
+    source_format, data = frame
+    if source_format == image_format and len(data) <= max_bytes:
+        return source_format, data, None
+    key = (hashlib.sha1(data).hexdigest(), image_format, max_bytes, min_quality)
+    with _payload_cache_lock:
+        if key in _payload_cache:
+            _payload_cache.move_to_end(key)
+            return _payload_cache[key]
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert('RGB')
+    quality, encoded = search_quality(img, image_format, max_bytes, min_quality)
+    result = (image_format, encoded, quality)
+    with _payload_cache_lock:
+        _payload_cache[key] = result
+        while len(_payload_cache) > PAYLOAD_CACHE_ENTRIES:
+            _payload_cache.popitem(last=False)
+    return result
+
+
+def encode_payload(frames, budget_bytes=None, image_format=None, min_quality=None, workers=None):
+    """Fit a request's frames into a total byte budget, returns [(format, bytes)]
+
+    The budget is split evenly; bytes left over by frames that fit at full
+    quality are spread over the frames that were still quality-limited in a
+    second pass.
+    """
+    budget_bytes = PAYLOAD_BUDGET_BYTES if budget_bytes is None else budget_bytes
+    image_format = image_format or PAYLOAD_FORMAT
+    min_quality = min_quality or PAYLOAD_MIN_QUALITY
+    if not frames or not budget_bytes:
+        return list(frames)
+    workers = min(workers or RESIZE_WORKERS, len(frames))
+
+    def encode_all(targets):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(targets, executor.map(
+                lambda i: encode_frame(frames[i], targets[i], image_format, min_quality), targets)))
+
+    share = budget_bytes // len(frames)
+    encoded = encode_all({i: share for i in range(len(frames))})
+
+    # 质量受预算限制的帧（且还没到上限）分摊其他帧省下的字节
+    limited = [i for i, (_, _, quality) in encoded.items()
+               if quality is not None and quality < PAYLOAD_MAX_QUALITY]
+    spare = budget_bytes - sum(len(data) for _, data, _ in encoded.values())
+    if limited and spare > len(limited) * share * 0.1:
+        extra = spare // len(limited)
+        encoded.update(encode_all({i: len(encoded[i][1]) + extra for i in limited}))
+    return [(fmt, data) for fmt, data, _ in (encoded[i] for i in range(len(frames)))]
@@ -0,0 +1,150 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import uuid
+
+from aws_clients import get_client
+from result_store import open_result_store, QUEUED, RUNNING, SUCCEEDED, FAILED
+
+# 异步任务的结果存储：s3://bucket/prefix、dynamodb://table，本地可用 sqlite:///path.db、file:///dir
+RESULT_STORE = os.environ.get('RESULT_STORE', '')
+# 提交后的执行方式：lambda（以 Event 方式异步调用本函数）或 queue（发送到 WORKER_QUEUE，由 queue_worker 执行）
+ASYNC_DISPATCH = os.environ.get('ASYNC_DISPATCH', 'lambda')
+WORKER_QUEUE = os.environ.get('WORKER_QUEUE', '')
+
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,128}$')
+
+
+class JobNotFound(RuntimeError):
+    pass
+
+
+_current_job = contextvars.ContextVar('async_job', default=None)
+_store = None
+_queue = None
+_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        if not RESULT_STORE:
+            raise RuntimeError("Async mode requires RESULT_STORE")
+        with _lock:
+            if _store is None:
+                _store = open_result_store(RESULT_STORE)
+    return _store
+
+
+def dispatch(job_event, context):
+    """Start the job without waiting for it"""
+    global _queue
+    if ASYNC_DISPATCH == 'queue':
+        from queue_worker import open_queue
+
+        if not WORKER_QUEUE:
+            raise RuntimeError("ASYNC_DISPATCH=queue requires WORKER_QUEUE")
+        with _lock:
+            if _queue is None:
+                _queue = open_queue(WORKER_QUEUE)
+        _queue.send(job_event)
+        return
+    function_name = getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+    if not function_name:
+        raise RuntimeError("ASYNC_DISPATCH=lambda requires running in Lambda (AWS_LAMBDA_FUNCTION_NAME)")
+    get_client('lambda').invoke(FunctionName=function_name, InvocationType='Event',
+                                Payload=json.dumps(job_event).encode('utf-8'))
+
+
+def submit_job(event, context):
+    """Record the job, dispatch it and return its job_id immediately
+
+    A caller-supplied job_id makes the submission idempotent: resubmitting an
+    existing job returns its current status instead of running it again.
+    """
+    job_id = event.get('job_id') or uuid.uuid4().hex
+    if not JOB_ID_PATTERN.match(job_id):
+        raise RuntimeError("Invalid job_id")
+    job_event = {k: v for k, v in event.items() if k != 'async'}
+    job_event['job_id'] = job_id
+
+    store = get_store()
+    if not store.create(job_id, job_event):
+        return job_status(job_id)
+    try:
+        dispatch(job_event, context)
+    except Exception as e:
+        store.set_status(job_id, FAILED, result={'err_no': 1, 'err_msg': f'dispatch failed: {e}', 'data': {}})
+        raise
+    return {
+        'err_no': 0,
+        'err_msg': '',
+        'data': {'job_id': job_id, 'status': QUEUED}
+    }
+
+
+def job_status(job_id):
+    """Status, partial stage results and (once finished) the final handler response"""
+    record = get_store().get(job_id)
+    if record is None:
+        return {
+            'err_no': 1,
+            'err_msg': f'job not found: {job_id}',
+            'data': {}
+        }
+    record.pop('event', None)
+    return {
+        'err_no': 0,
+        'err_msg': '',
+        'data': record
+    }
+
+
+def begin_job(job_id):
+    """Mark a dispatched job as running and make it current for report_stage()
+
+    Raises JobNotFound for a job_id that was never submitted, so a stray id
+    cannot create a job record.
+    """
+    if not job_id or not RESULT_STORE:
+        return None
+    try:
+        store = get_store()
+        if store.get(job_id) is None:
+            raise JobNotFound(f'job not found: {job_id}')
+        store.set_status(job_id, RUNNING)
+    except JobNotFound:
+        raise
+    except KeyError:
+        # get() 与 set_status() 之间任务被删除（例如 TTL 过期）
+        raise JobNotFound(f'job not found: {job_id}')
+    except Exception as e:
+        # 结果存储不可用时仍然执行分析，调用方拿到同步返回值
+        print(f"Failed to mark job {job_id} running: {e}")
+        return None
+    _current_job.set(job_id)
+    return job_id
+
+
+def report_stage(stage, data):
+    """Write one stage result of the current job (no-op outside async jobs)"""
+    job_id = _current_job.get()
+    if job_id is None:
+        return
+    try:
+        get_store().put_stage(job_id, stage, data)
+    except Exception as e:
+        print(f"Failed to store stage {stage} of {job_id}: {e}")
+
+
+def end_job(job_id, response):
+    if job_id is None:
+        return
+    if _current_job.get() == job_id:
+        _current_job.set(None)
+    try:
+        get_store().set_status(job_id, SUCCEEDED if response.get('err_no') == 0 else FAILED, result=response)
+    except Exception as e:
+        print(f"Failed to store result of {job_id}: {e}")
@@ -0,0 +1,67 @@
+import os
+import threading
+
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 50))
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', 5))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', 60))
+AWS_S3_ADDRESSING_STYLE = os.environ.get('AWS_S3_ADDRESSING_STYLE', 'auto')
+
+# Nova 处理视频可能超过 60 秒
+SERVICE_READ_TIMEOUTS = {
+    'bedrock-runtime': float(os.environ.get('BEDROCK_READ_TIMEOUT', 300)),
+}
+# bedrock-runtime 的节流由 BedrockClientPool 切换 region 处理，客户端内只做少量重试
+SERVICE_RETRIES = {
+    'bedrock-runtime': {'max_attempts': 2, 'mode': 'standard'},
+}
+DEFAULT_RETRIES = {'max_attempts': 4, 'mode': 'adaptive'}
+
+_session = None
+_clients = {}
+_lock = threading.Lock()
+
+
+def client_config(service):
+    """Tuned botocore config: larger connection pool, keep-alive, explicit timeouts"""
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=SERVICE_READ_TIMEOUTS.get(service, AWS_READ_TIMEOUT),
+        tcp_keepalive=True,
+        retries=SERVICE_RETRIES.get(service, DEFAULT_RETRIES),
+        s3={'addressing_style': AWS_S3_ADDRESSING_STYLE},
+    )
+
+
+def get_client(service, region=None, endpoint_url=None):
+    """Lazily created client cached per (service, region, endpoint_url)
+
+    Clients are thread safe and reused across warm invocations, so credential
+    resolution, endpoint setup and TLS handshakes happen once per container.
+    """
+    global _session
+    key = (service, region, endpoint_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    # boto3 的 Session 创建客户端不是线程安全的
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            if _session is None:
+                import boto3
+                _session = boto3.session.Session()
+            client = _session.client(service, region_name=region, endpoint_url=endpoint_url,
+                                     config=client_config(service))
+            _clients[key] = client
+        return client
+
+
+def clear_clients():
+    """Drop all cached clients (e.g. after credentials or endpoints change)"""
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
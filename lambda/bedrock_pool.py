@@ -0,0 +1,306 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from aws_clients import get_client
+from usage_ledger import current_usage, record_hedge_call
+
+# Errors that say "this region is busy or broken right now", so the request is
+# worth sending to another region.
+REGIONAL_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ServiceQuotaExceededException',
+    'ModelNotReadyException',
+    'ModelTimeoutException',
+    'InternalServerException',
+}
+THROTTLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceQuotaExceededException',
+}
+
+
+# botocore 在出错时才导入，import lambda_function 时不加载
+def _error_code(error):
+    from botocore.exceptions import ClientError
+
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code', '')
+    return ''
+
+
+def is_regional_error(error):
+    """Return True if the error is specific to the region that served the call"""
+    from botocore.exceptions import EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError
+
+    connection_errors = (EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError)
+    return isinstance(error, connection_errors) or _error_code(error) in REGIONAL_ERROR_CODES
+
+
+class RegionStats:
+    def __init__(self, region, window=200):
+        """Health and latency bookkeeping for one region"""
+        self.region = region
+        self.inflight = 0
+        self.latencies = deque(maxlen=window)
+        self.successes = 0
+        self.failures = 0
+        self.throttles = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def is_healthy(self, now=None):
+        return (now or time.monotonic()) >= self.unhealthy_until
+
+    def percentile(self, p):
+        """Latency percentile in seconds, None while there are no samples"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self):
+        return {
+            'region': self.region,
+            'healthy': self.is_healthy(),
+            'inflight': self.inflight,
+            'samples': len(self.latencies),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'successes': self.successes,
+            'failures': self.failures,
+            'throttles': self.throttles,
+        }
+
+
+def default_client_factory(region, endpoint_url=None):
+    return get_client('bedrock-runtime', region, endpoint_url)
+
+
+class BedrockClientPool:
+    def __init__(self, regions, endpoint_urls=None, client_factory=None, hedge=False,
+                 hedge_percentile=95, hedge_min_delay=0.5, hedge_min_samples=20,
+                 failure_threshold=3, cooldown=30, max_workers=8):
+        """Bedrock runtime clients spread over several regions
+
+        Parameters:
+        regions -- regions to route to, in order of preference
+        endpoint_urls -- optional {region: url} overrides, e.g. local stub endpoints
+        client_factory -- callable(region, endpoint_url) returning a client
+        hedge -- send a duplicate request to a second region after the hedge delay
+        hedge_percentile -- latency percentile of the primary region used as hedge delay
+        hedge_min_delay -- lower bound of the hedge delay (seconds)
+        hedge_min_samples -- samples needed before the percentile is trusted
+        failure_threshold -- consecutive failures before a region is taken out of rotation
+        cooldown -- seconds a region stays out of rotation (doubled on throttling)
+        """
+        if not regions:
+            raise ValueError("At least one region is required")
+        self.regions = list(regions)
+        self.endpoint_urls = endpoint_urls or {}
+        self.client_factory = client_factory or default_client_factory
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_workers = max_workers
+
+        self.stats = {region: RegionStats(region) for region in self.regions}
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @classmethod
+    def from_env(cls, default_region):
+        """Build a pool from environment variables
+
+        BEDROCK_REGIONS -- comma separated regions, default_region if unset
+        BEDROCK_ENDPOINT_URLS -- comma separated region=url pairs
+        BEDROCK_HEDGE -- "1" to enable hedged requests
+        BEDROCK_HEDGE_PERCENTILE / BEDROCK_HEDGE_MIN_DELAY -- hedge delay tuning
+        """
+        regions = [r.strip() for r in os.environ.get('BEDROCK_REGIONS', default_region).split(',') if r.strip()]
+        endpoint_urls = {}
+        for pair in os.environ.get('BEDROCK_ENDPOINT_URLS', '').split(','):
+            if '=' in pair:
+                region, url = pair.split('=', 1)
+                endpoint_urls[region.strip()] = url.strip()
+        return cls(
+            regions,
+            endpoint_urls=endpoint_urls,
+            hedge=os.environ.get('BEDROCK_HEDGE', '0') == '1',
+            hedge_percentile=float(os.environ.get('BEDROCK_HEDGE_PERCENTILE', 95)),
+            hedge_min_delay=float(os.environ.get('BEDROCK_HEDGE_MIN_DELAY', 0.5)),
+        )
+
+    def client(self, region):
+        """Lazily created client for a region"""
+        with self._lock:
+            client = self._clients.get(region)
+            if client is None:
+                client = self.client_factory(region, self.endpoint_urls.get(region))
+                self._clients[region] = client
+            return client
+
+    def ranked_regions(self):
+        """Regions ordered for routing: healthy first, then least loaded, then fastest"""
+        now = time.monotonic()
+        with self._lock:
+            def key(region):
+                s = self.stats[region]
+                p50 = s.percentile(50)
+                return (
+                    0 if s.is_healthy(now) else 1,
+                    s.inflight,
+                    p50 if p50 is not None else 0.0,
+                    self.regions.index(region),
+                )
+            return sorted(self.regions, key=key)
+
+    def hedge_delay(self, region):
+        """Delay before the duplicate request is sent, None if hedging is not possible yet"""
+        s = self.stats[region]
+        if len(s.latencies) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, s.percentile(self.hedge_percentile))
+
+    def converse(self, **kwargs):
+        return self.call('converse', **kwargs)
+
+    def converse_stream(self, **kwargs):
+        # Streams cannot be raced, so they are routed but never hedged
+        return self.call('converse_stream', _hedge=False, **kwargs)
+
+    def call(self, operation, _hedge=None, **kwargs):
+        """Call a bedrock-runtime operation, failing over to other regions on regional errors"""
+        regions = self.ranked_regions()
+        hedge = self.hedge if _hedge is None else _hedge
+        if hedge and len(regions) > 1:
+            return self._call_hedged(operation, regions, kwargs)
+
+        last_error = None
+        for region in regions:
+            try:
+                return self._call_region(region, operation, kwargs)
+            except Exception as e:
+                # 非 botocore 异常不是 region 故障，is_regional_error 返回 False，直接抛出
+                if not is_regional_error(e):
+                    raise
+                last_error = e
+                print(f"Bedrock region {region} failed ({_error_code(e) or type(e).__name__}), trying next region")
+        raise last_error
+
+    def _call_hedged(self, operation, regions, kwargs):
+        executor = self._get_executor()
+        primary, others = regions[0], regions[1:]
+        delay = self.hedge_delay(primary)
+        # 输掉竞速的请求同样计费，在调用方的请求上记账
+        usage = current_usage()
+        started = {}
+
+        def submit(region):
+            future = executor.submit(self._call_region, region, operation, kwargs)
+            started[future] = time.monotonic()
+            return future
+
+        # Without enough samples there is no delay to hedge on: wait for the primary
+        pending = {submit(primary)}
+        done, pending = wait(pending, timeout=delay)
+        last_error = None
+        for future in done:
+            error = future.exception()
+            if error is None:
+                return future.result()
+            if not is_regional_error(error):
+                raise error
+            last_error = error
+
+        # Primary is slow (or failed): race it against the next region(s)
+        while pending or others:
+            if others:
+                pending.add(submit(others.pop(0)))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = None
+            for future in done:
+                error = future.exception()
+                if error is None and winner is None:
+                    winner = future
+                elif error is None:
+                    self._record_hedge_loser(future, started[future], kwargs, usage)
+                elif winner is None and not is_regional_error(error):
+                    raise error
+                else:
+                    last_error = error
+            if winner is not None:
+                for future in pending:
+                    future.add_done_callback(
+                        lambda f: self._record_hedge_loser(f, started[f], kwargs, usage))
+                return winner.result()
+        raise last_error
+
+    def _record_hedge_loser(self, future, start_time, kwargs, usage):
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            record_hedge_call(kwargs.get('modelId', ''), future.result(),
+                              (time.monotonic() - start_time) * 1000, usage)
+        except Exception as e:
+            print(f"Failed to record hedged call: {e}")
+
+    def _call_region(self, region, operation, kwargs):
+        s = self.stats[region]
+        client = self.client(region)
+        with self._lock:
+            s.inflight += 1
+        start_time = time.monotonic()
+        try:
+            response = getattr(client, operation)(**kwargs)
+        except Exception as e:
+            self._record_failure(region, e)
+            raise
+        finally:
+            with self._lock:
+                s.inflight -= 1
+        self._record_success(region, time.monotonic() - start_time)
+        return response
+
+    def _record_success(self, region, elapsed):
+        with self._lock:
+            s = self.stats[region]
+            s.latencies.append(elapsed)
+            s.successes += 1
+            s.consecutive_failures = 0
+
+    def _record_failure(self, region, error):
+        if not is_regional_error(error):
+            return
+        with self._lock:
+            s = self.stats[region]
+            s.failures += 1
+            s.consecutive_failures += 1
+            throttled = _error_code(error) in THROTTLE_ERROR_CODES
+            if throttled:
+                s.throttles += 1
+            if throttled or s.consecutive_failures >= self.failure_threshold:
+                cooldown = self.cooldown * (2 if throttled else 1)
+                s.unhealthy_until = time.monotonic() + cooldown
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='bedrock-hedge')
+            return self._executor
+
+    def snapshot(self):
+        """Per-region health and latency summary"""
+        with self._lock:
+            return [self.stats[region].snapshot() for region in self.regions]
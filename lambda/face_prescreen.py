@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import cv2
+
+# MINORS_ISSUE / MALE_ISSUE 依赖 Rekognition 的年龄、性别属性，默认有人脸时仍调用 Rekognition
+FACE_ATTRIBUTES_REQUIRED = os.environ.get('FACE_ATTRIBUTES_REQUIRED', '1') == '1'
+# 可选 OpenCV DNN 人脸模型（res10 SSD caffe），未配置时使用 Haar cascade
+FACE_DNN_MODEL = os.environ.get('FACE_DNN_MODEL', '')
+FACE_DNN_CONFIG = os.environ.get('FACE_DNN_CONFIG', '')
+FACE_RECORD_DIR = os.environ.get('FACE_RECORD_DIR', '')
+
+PRESCREEN_MAX_SIDE = 640
+# 有脸帧占比低于该值视为明显无人脸；Rekognition 的判定线是 2/3
+NO_FACE_RATIO = 1 / 3
+# 单人脸宽度至少占画面宽度的比例才算"构图良好"
+MIN_FACE_WIDTH_RATIO = 0.08
+
+
+class LocalFaceDetector:
+    def __init__(self, dnn_model=None, dnn_config=None, dnn_confidence=0.6):
+        """CPU face detector: OpenCV DNN if a model is configured, Haar cascade otherwise"""
+        self.dnn_confidence = dnn_confidence
+        self.net = None
+        self.cascade = None
+        if dnn_model and dnn_config:
+            self.net = cv2.dnn.readNetFromCaffe(dnn_config, dnn_model)
+        else:
+            cascade_path = os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')
+            self.cascade = cv2.CascadeClassifier(cascade_path)
+            if self.cascade.empty():
+                raise RuntimeError(f"Failed to load Haar cascade: {cascade_path}")
+        self._lock = threading.Lock()
+
+    def detect(self, image):
+        """Faces in a BGR image as [(x, y, w, h)] in image pixels"""
+        height, width = image.shape[:2]
+        scale = min(1.0, PRESCREEN_MAX_SIDE / max(height, width))
+        if scale < 1.0:
+            image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+        if self.net is not None:
+            blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104.0, 177.0, 123.0))
+            # cv2.dnn.Net 不是线程安全的
+            with self._lock:
+                self.net.setInput(blob)
+                detections = self.net.forward()
+            h, w = image.shape[:2]
+            faces = []
+            for i in range(detections.shape[2]):
+                if detections[0, 0, i, 2] < self.dnn_confidence:
+                    continue
+                x1, y1, x2, y2 = detections[0, 0, i, 3:7] * [w, h, w, h]
+                faces.append((x1, y1, x2 - x1, y2 - y1))
+        else:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            gray = cv2.equalizeHist(gray)
+            min_side = max(24, int(min(gray.shape) * 0.06))
+            faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side))
+
+        return [tuple(v / scale for v in face) for face in faces]
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def get_detector():
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = LocalFaceDetector(FACE_DNN_MODEL, FACE_DNN_CONFIG)
+        return _detector
+
+
+def prescreen_frames(frame_paths, detector=None):
+    """Local face pre-screen on the sampled frames
+
+    Returns a dict with per-frame face counts and a decision:
+    no_face -- clearly too few frames with a face, FACE_ISSUE can be decided locally
+    single_face -- one well-framed face in every frame
+    ambiguous -- anything else, Rekognition decides
+    """
+    detector = detector or get_detector()
+    per_frame = []
+    well_framed = 0
+    for frame_path in frame_paths:
+        image = cv2.imread(frame_path)
+        if image is None:
+            per_frame.append(0)
+            continue
+        faces = detector.detect(image)
+        per_frame.append(len(faces))
+        if len(faces) == 1 and faces[0][2] >= image.shape[1] * MIN_FACE_WIDTH_RATIO:
+            well_framed += 1
+
+    n = len(per_frame)
+    frames_with_face = sum(1 for c in per_frame if c > 0)
+    if n and frames_with_face < n * NO_FACE_RATIO:
+        decision = 'no_face'
+    elif n and well_framed == n:
+        decision = 'single_face'
+    else:
+        decision = 'ambiguous'
+
+    return {
+        'decision': decision,
+        'frame_count': n,
+        'frames_with_face': frames_with_face,
+        'faces_per_frame': per_frame,
+    }
+
+
+def local_face_result(prescreen):
+    """Rekognition-style tags for a locally decided pre-screen, {} if not decided"""
+    if prescreen['decision'] != 'no_face':
+        return {}
+    n = prescreen['frame_count']
+    # 有脸帧越少越确定
+    confidence = int(90 + 9 * (1 - prescreen['frames_with_face'] / (n * NO_FACE_RATIO)))
+    explanation = f"Local pre-screen found a face in {prescreen['frames_with_face']} of {n} sampled frames"
+    return {
+        'FACE_ISSUE': {
+            'explanation': f'There is no face continuously appearing in the video frame. {explanation}',
+            'is_exist': 1,
+            'confidence': confidence
+        },
+        'FACE_OCCLUDED_ISSUE': {
+            'explanation': f'The face is occluded in the video frame. {explanation}',
+            'is_exist': 1,
+            'confidence': confidence
+        },
+    }
+
+
+def record_face_case(frame_paths, response, sub_image_count, record_dir=None):
+    """Save frames and the detect_faces response for the agreement benchmark"""
+    record_dir = record_dir or FACE_RECORD_DIR
+    if not record_dir:
+        return
+    case_dir = os.path.join(record_dir, uuid.uuid4().hex)
+    os.makedirs(os.path.join(case_dir, 'frames'), exist_ok=True)
+    # 抽帧可能在 memfd 中（/proc/self/fd/N），按顺序重新命名
+    for index, frame_path in enumerate(frame_paths):
+        shutil.copy(frame_path, os.path.join(case_dir, 'frames', f'frame_{index:03d}.jpg'))
+    with open(os.path.join(case_dir, 'detect_faces.json'), 'w') as f:
+        json.dump({'sub_image_count': sub_image_count, 'response': response}, f, default=str)
@@ -0,0 +1,162 @@
+import os
+
+import cv2
+import numpy as np
+
+# 本地判定的置信度达到该值才在调用 Bedrock 前直接返回
+LOCAL_QUALITY_CONFIDENCE = float(os.environ.get('LOCAL_QUALITY_CONFIDENCE', 90))
+LOCAL_QUALITY_SAMPLES = int(os.environ.get('LOCAL_QUALITY_SAMPLES', 20))
+
+ANALYSIS_SIDE = 320
+# Laplacian 方差（ANALYSIS_SIDE 缩放后）低于该值视为模糊
+SHARPNESS_THRESHOLD = 40.0
+# 相邻帧全局位移（占画面宽度比例）高于该值视为抖动
+MOTION_THRESHOLD = 0.03
+DARK_LEVEL = 16
+BRIGHT_LEVEL = 240
+DARK_MEAN = 45
+BRIGHT_MEAN = 215
+# 超过该比例的采样帧有问题才判定为视频级问题
+ISSUE_FRAME_RATIO = 0.5
+
+
+def _to_gray(frame, side=ANALYSIS_SIDE):
+    height, width = frame.shape[:2]
+    scale = side / max(height, width)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def sample_frame_pairs(video_path, max_samples=None):
+    """Grayscale (frame, next frame) pairs at evenly spaced timestamps
+
+    Returns (timestamps, frames, next_frames) where frames/next_frames are uint8
+    arrays of shape (N, H, W).
+    """
+    max_samples = max_samples or LOCAL_QUALITY_SAMPLES
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError("无法打开视频文件")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    duration = total_frames / fps if fps else 0
+
+    # 每秒一帧，最多 max_samples 个采样点
+    count = max(1, min(max_samples, int(duration)))
+    timestamps = [duration * (i + 0.5) / count for i in range(count)]
+    stamps, frames, next_frames = [], [], []
+    for t in timestamps:
+        cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+        ok_a, frame_a = cap.read()
+        ok_b, frame_b = cap.read()
+        if not (ok_a and ok_b):
+            continue
+        stamps.append(round(t, 2))
+        frames.append(_to_gray(frame_a))
+        next_frames.append(_to_gray(frame_b))
+    cap.release()
+
+    if not frames:
+        return [], np.empty((0, 0, 0), np.uint8), np.empty((0, 0, 0), np.uint8)
+    return stamps, np.stack(frames), np.stack(next_frames)
+
+
+def sharpness_scores(frames):
+    """Laplacian variance per frame"""
+    return np.array([cv2.Laplacian(frame, cv2.CV_64F).var() for frame in frames])
+
+
+def motion_scores(frames, next_frames):
+    """Global translation between consecutive frames (fraction of frame width) via phase correlation"""
+    if len(frames) == 0:
+        return np.array([])
+    height, width = frames.shape[1:]
+    window = cv2.createHanningWindow((width, height), cv2.CV_32F)
+    scores = []
+    for a, b in zip(frames.astype(np.float32), next_frames.astype(np.float32)):
+        (dx, dy), _ = cv2.phaseCorrelate(a, b, window)
+        scores.append(np.hypot(dx, dy) / width)
+    return np.array(scores)
+
+
+def exposure_stats(frames):
+    """Mean brightness and dark/bright clipped pixel fractions per frame (vectorized over the batch)"""
+    flat = frames.reshape(len(frames), -1)
+    return {
+        'mean': flat.mean(axis=1),
+        'dark_fraction': (flat <= DARK_LEVEL).mean(axis=1),
+        'bright_fraction': (flat >= BRIGHT_LEVEL).mean(axis=1),
+    }
+
+
+def _confidence(ratio):
+    """Map the share of bad frames (ISSUE_FRAME_RATIO..1) to a confidence (70..99)"""
+    span = (ratio - ISSUE_FRAME_RATIO) / (1 - ISSUE_FRAME_RATIO)
+    return int(70 + 29 * min(1.0, max(0.0, span)))
+
+
+def _times(timestamps, mask):
+    return ', '.join(f'{t:.1f}s' for t, bad in zip(timestamps, mask) if bad)
+
+
+def score_video(video_path, max_samples=None):
+    """Local blur / shake / exposure analysis
+
+    Returns a dict with the per-sample metrics and a verdict in the handler's
+    tag schema (only tags that exist are included).
+    """
+    timestamps, frames, next_frames = sample_frame_pairs(video_path, max_samples)
+    if not timestamps:
+        return {'samples': 0, 'verdict': {}}
+
+    sharpness = sharpness_scores(frames)
+    motion = motion_scores(frames, next_frames)
+    exposure = exposure_stats(frames)
+
+    dark = (exposure['mean'] < DARK_MEAN) | (exposure['dark_fraction'] > 0.6)
+    bright = (exposure['mean'] > BRIGHT_MEAN) | (exposure['bright_fraction'] > 0.6)
+    # 过暗/过亮帧的 Laplacian 方差天然偏低，只算作曝光问题
+    blurry = (sharpness < SHARPNESS_THRESHOLD) & ~dark & ~bright
+    shaky = motion > MOTION_THRESHOLD
+
+    n = len(timestamps)
+    verdict = {}
+    quality_ratio = max(blurry.mean(), shaky.mean())
+    if quality_ratio >= ISSUE_FRAME_RATIO:
+        reasons = []
+        if blurry.mean() >= ISSUE_FRAME_RATIO:
+            reasons.append(f'blurry frames {int(blurry.sum())}/{n} (median sharpness {np.median(sharpness):.1f}) at {_times(timestamps, blurry)}')
+        if shaky.mean() >= ISSUE_FRAME_RATIO:
+            reasons.append(f'shaky frames {int(shaky.sum())}/{n} (median motion {np.median(motion):.3f}) at {_times(timestamps, shaky)}')
+        verdict['VIDEO_QUALITY_ISSUE'] = {
+            'explanation': 'Local analysis: ' + '; '.join(reasons),
+            'is_exist': 1,
+            'confidence': _confidence(quality_ratio)
+        }
+
+    lighting_ratio = max(dark.mean(), bright.mean())
+    if lighting_ratio >= ISSUE_FRAME_RATIO:
+        kind = 'too dark' if dark.mean() >= bright.mean() else 'too bright'
+        mask = dark if kind == 'too dark' else bright
+        verdict['TECHNICAL_ISSUE'] = {
+            'explanation': f'Local analysis: poor lighting, {kind} in {int(mask.sum())}/{n} frames '
+                           f'(median brightness {np.median(exposure["mean"]):.0f}) at {_times(timestamps, mask)}',
+            'is_exist': 1,
+            'confidence': _confidence(lighting_ratio)
+        }
+
+    return {
+        'samples': n,
+        'timestamps': timestamps,
+        'sharpness': sharpness.round(2).tolist(),
+        'motion': motion.round(4).tolist(),
+        'brightness': exposure['mean'].round(1).tolist(),
+        'verdict': verdict,
+    }
+
+
+def confident_issues(verdict, threshold=None):
+    """Tags confident enough to short-circuit the pipeline"""
+    threshold = LOCAL_QUALITY_CONFIDENCE if threshold is None else threshold
+    return {tag: detail for tag, detail in verdict.items() if detail['confidence'] >= threshold}
@@ -1,17 +1,45 @@
-import shutil
+import io
 import json
 import time
 import os
 import math
 from urllib.parse import urlparse
-import cv2
-import boto3
 import uuid
-from PIL import Image
-import requests
-from video_quality_checker import check_video_quality
-
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from aws_clients import get_client
+from bedrock_pool import BedrockClientPool
+from video_payload import VideoPayload, plan_video_payload
+from video_transcoder import build_moderation_proxy
+from video_container import prepare_video_for_bedrock
+from video_segmenter import split_video, analyze_segments, merge_segment_results
+from progressive_scan import progressive_scan, PROGRESSIVE_FIRST_WINDOW
+from mosaic_tiles import attribute_faces_to_tiles, requery_uncertain_tiles, confident_faces
+from moderation_labels import REKOGNITION_MODERATION_ENABLED, MODERATION_MIN_CONFIDENCE, analysis_moderation_labels
+from tracing import start_trace, finish_trace, span, wrap
+from usage_ledger import begin_request, end_request, record_call, choose_model
+from scratch_space import open_scratch, close_scratch, current_scratch
+from parallel_decode import DECODE_MIN_SECONDS, decode_frames, decode_workers
+from async_jobs import JobNotFound, submit_job, job_status, begin_job, end_job, report_stage
+
+# cv2、PIL、requests 等重量级依赖在各阶段内按需导入，质检直接拒绝等路径不会加载 OpenCV/PIL
 TMP_DIR = '/tmp'
+# 调用 Nova 前是否先生成低分辨率、低码率、无音轨的审核代理视频
+NOVA_PROXY_ENABLED = os.environ.get('NOVA_PROXY_ENABLED', '0') == '1'
+# 超过该时长的视频切段并行分析（单次抽帧拼图最多 20 帧）
+SEGMENT_THRESHOLD_SECONDS = float(os.environ.get('SEGMENT_THRESHOLD_SECONDS', 20))
+MOSAIC_MAX_FRAMES = 20
+# 渐进式扫描：按逐渐增大的时间窗口分析，命中高置信度违规即停止
+PROGRESSIVE_SCAN = os.environ.get('PROGRESSIVE_SCAN', '0') == '1'
+# 本地模糊/抖动/曝光评分
+LOCAL_QUALITY_ENABLED = os.environ.get('LOCAL_QUALITY', '0') == '1'
+# 本地 CPU 人脸预筛
+FACE_PRESCREEN_ENABLED = os.environ.get('FACE_PRESCREEN', '0') == '1'
+FACE_RECORD_DIR = os.environ.get('FACE_RECORD_DIR', '')
+# 内存受限模式：拼图格缩小到 MOSAIC_TILE_MAX_SIDE，inline 上传阈值降低（见 video_payload）
+MEMORY_BOUNDED = os.environ.get('MEMORY_BOUNDED', '0') == '1'
+# 拼图中每格的最长边，0 表示保持抽帧原分辨率
+MOSAIC_TILE_MAX_SIDE = int(os.environ.get('MOSAIC_TILE_MAX_SIDE', 960 if MEMORY_BOUNDED else 0))
 NOVA_PROMPT = """
 You are a professional video review and tagging model expert, responsible for reviewing and tagging individual videos according to the given review rules.
 Please carefully read the review rules in <rules> and strictly follow these rules to review and classify videos.
@@ -125,7 +153,17 @@ SYSTEM_PROMPT = "You are an expert in video moderation. You are responsible for
 
 
 def extract_and_merge_all_frames(local_video_path: str):
+    frame_paths, _ = extract_sampled_frames(local_video_path)
+    merged_path = merge_frames(frame_paths, os.path.dirname(local_video_path))
+    return merged_path, len(frame_paths)
+
+
+def extract_sampled_frames(local_video_path: str):
+    """Sample frames for the mosaic; returns (frame_paths, frame_times) with times in seconds from the clip start"""
+    import cv2
+
     local_dir = os.path.dirname(local_video_path)
+    scratch = current_scratch()
 
     frame_dir = f'{local_dir}/frames'
     os.makedirs(frame_dir, exist_ok=True)
@@ -141,198 +179,283 @@ def extract_and_merge_all_frames(local_video_path: str):
 
     frame_paths = []
     frame_count = 0
-    current_time = 0
 
-    while current_time < duration:
+    # 每秒抽一帧；切段/窗口的实际时长可能超过标称值（GOP 很长时），超过拼图上限则在整段内均匀抽取
+    times = list(range(math.ceil(duration)))
+    if len(times) > MOSAIC_MAX_FRAMES:
+        times = [i * duration / MOSAIC_MAX_FRAMES for i in range(MOSAIC_MAX_FRAMES)]
+
+    if duration >= DECODE_MIN_SECONDS and decode_workers() > 1:
+        # 长视频按关键帧区间多进程并行解码，帧经共享内存按时间顺序返回
+        cap.release()
+        frame_times = []
+        for frame_time, encoded in decode_frames(local_video_path, times, duration):
+            frame_filename = f'{frame_dir}/frame_{frame_count:03d}.jpg'
+            if scratch:
+                frame_paths.append(scratch.write_bytes(frame_filename, encoded))
+            else:
+                with open(frame_filename, 'wb') as f:
+                    f.write(encoded)
+                frame_paths.append(frame_filename)
+            frame_times.append(frame_time)
+            frame_count += 1
+        return frame_paths, frame_times
+
+    for current_time in times:
         cap.set(cv2.CAP_PROP_POS_MSEC, current_time * 1000)  # 设置时间位置
         success, frame = cap.read()
         if not success:
             break
 
         frame_filename = f'{frame_dir}/frame_{frame_count:03d}.jpg'
-        cv2.imwrite(frame_filename, frame)
-        frame_paths.append(frame_filename)
+        if scratch:
+            # 抽帧较小，优先放在 memfd 中，不占 /tmp
+            _, encoded = cv2.imencode('.jpg', frame)
+            frame_paths.append(scratch.write_bytes(frame_filename, encoded))
+        else:
+            cv2.imwrite(frame_filename, frame)
+            frame_paths.append(frame_filename)
 
         frame_count += 1
-        current_time += 1  # 每秒抽一帧
 
     cap.release()
+    return frame_paths, times[:frame_count]
+
+
+_mosaic_buffers = threading.local()
+
+
+def _mosaic_buffer():
+    """Per-thread JPEG encode buffer, reused across invocations"""
+    buffer = getattr(_mosaic_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _mosaic_buffers.buffer = io.BytesIO()
+    buffer.seek(0)
+    return buffer
+
+
+def merge_frames(frame_paths, local_dir):
+    from PIL import Image
 
     # 拼接图片，每行最多3列
-    images = [Image.open(fp) for fp in frame_paths]
-    if not images:
+    if not frame_paths:
         raise RuntimeError("没有成功抽帧")
 
-    if len(images) > 20:
-        raise RuntimeError("More than 20 images")
+    if len(frame_paths) > MOSAIC_MAX_FRAMES:
+        raise RuntimeError(f"More than {MOSAIC_MAX_FRAMES} images")
 
-    frame_width, frame_height = images[0].size
+    # 逐帧解码、粘贴后立即释放，内存中只保留画布和当前一帧
+    with Image.open(frame_paths[0]) as first:
+        frame_width, frame_height = first.size
+    scale = 1.0
+    if MOSAIC_TILE_MAX_SIDE and max(frame_width, frame_height) > MOSAIC_TILE_MAX_SIDE:
+        scale = MOSAIC_TILE_MAX_SIDE / max(frame_width, frame_height)
+        frame_width, frame_height = int(frame_width * scale), int(frame_height * scale)
     cols = 3
-    rows = math.ceil(len(images) / cols)
+    rows = math.ceil(len(frame_paths) / cols)
 
     merged_width = cols * frame_width
     merged_height = rows * frame_height
 
     merged_image = Image.new("RGB", (merged_width, merged_height))
 
-    for idx, img in enumerate(images):
+    for idx, fp in enumerate(frame_paths):
         x = (idx % cols) * frame_width
         y = (idx // cols) * frame_height
-        merged_image.paste(img, (x, y))
-
+        with Image.open(fp) as img:
+            if scale < 1.0:
+                # JPEG 在解码时直接按 1/2、1/4、1/8 缩小，不展开全分辨率像素
+                img.draft('RGB', (frame_width, frame_height))
+                img = img.resize((frame_width, frame_height), Image.Resampling.LANCZOS)
+            merged_image.paste(img, (x, y))
+
+    # 编码到复用的缓冲区再写文件，避免每次调用重新分配
+    buffer = _mosaic_buffer()
+    merged_image.save(buffer, format='JPEG')
+    merged_image.close()
+    size = buffer.tell()
     merged_path = f'{local_dir}/merged_image.jpg'
-    merged_image.save(merged_path)
+    scratch = current_scratch()
+    with buffer.getbuffer() as view, view[:size] as data:
+        if scratch:
+            merged_path = scratch.write_bytes(merged_path, data)
+        else:
+            with open(merged_path, 'wb') as f:
+                f.write(data)
     print(f"拼接图保存到: {merged_path}")
 
-    return merged_path, len(images)
+    return merged_path
 
 
-def imageModeration(image_path):
-    client = boto3.client('rekognition')
+def read_image(image):
+    """Image bytes from a path, or the bytes themselves"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    with open(image, 'rb') as image_file:
+        return image_file.read()
 
-    with open(image_path, 'rb') as image_file:
-        image_data = image_file.read()
 
-    response = client.detect_moderation_labels(
-        Image={
-            'Bytes': image_data
-        },
-        MinConfidence=50
-    )
-    return response
+def imageModeration(image):
+    client = get_client('rekognition')
 
+    image_bytes = read_image(image)
+    with span('detect_moderation_labels') as s:
+        s.add_bytes(bytes_in=len(image_bytes))
+        response = client.detect_moderation_labels(
+            Image={
+                'Bytes': image_bytes
+            },
+            MinConfidence=MODERATION_MIN_CONFIDENCE
+        )
+        s.set(labels=len(response.get('ModerationLabels', [])))
+    return response
 
-def faceDetection(image_path):
-    client = boto3.client('rekognition')
 
-    with open(image_path, 'rb') as image_file:
-        image_data = image_file.read()
+def faceDetection(image):
+    client = get_client('rekognition')
 
-    response = client.detect_faces(
-        Image={
-            'Bytes': image_data
-        },
-        Attributes=['AGE_RANGE', 'GENDER', 'FACE_OCCLUDED']
-    )
+    image_bytes = read_image(image)
+    with span('detect_faces') as s:
+        s.add_bytes(bytes_in=len(image_bytes))
+        response = client.detect_faces(
+            Image={
+                'Bytes': image_bytes
+            },
+            Attributes=['AGE_RANGE', 'GENDER', 'FACE_OCCLUDED']
+        )
+        s.set(faces=len(response.get('FaceDetails', [])))
     return response
 
 
-def analysis_merged_images(image: str, sub_image_count):
-    min_age = 14
-    max_age = 18
-    is_minors = False
-    gender = "Female"
-    face_count = 0
-    face_not_occluded_count = 0
+def rekognition_stage(merged_image, sub_image_count, frame_paths=None, face_detection=True, moderation=True,
+                      frame_times=None):
+    """detect_faces and detect_moderation_labels on the same mosaic, concurrently
+
+    The mosaic is read once and the same buffer is sent to both APIs.
+    frame_times are the video times of the tiles, reported in face verdicts.
+    """
+    image_bytes = read_image(merged_image)
+    result = {}
+    with span('rekognition', face_detection=face_detection, moderation=moderation) as s, \
+            ThreadPoolExecutor(max_workers=2, thread_name_prefix='rekognition') as executor:
+        s.add_bytes(bytes_in=len(image_bytes))
+        # wrap 让工作线程里的 span 记录到当前调用的 trace 上
+        face_future = executor.submit(
+            wrap(analysis_merged_images), image_bytes, sub_image_count, frame_paths,
+            frame_times) if face_detection else None
+        moderation_future = executor.submit(wrap(imageModeration), image_bytes) if moderation else None
+        if face_future is not None:
+            result.update(face_future.result())
+        if moderation_future is not None:
+            result.update(analysis_moderation_labels(moderation_future.result()))
+    return result
+
 
+def analysis_merged_images(image, sub_image_count, frame_paths=None, frame_times=None):
     response = faceDetection(image)
-    for face_detail in response.get('FaceDetails', []):
-        if face_detail.get('Confidence') > 80:
-            face_count += 1
+    if FACE_RECORD_DIR and frame_paths:
+        from face_prescreen import record_face_case
+        record_face_case(frame_paths, response, sub_image_count)
+
+    # 把每个人脸框映射回所在的拼图格（即对应的抽帧时间点）
+    tiles = attribute_faces_to_tiles(response.get('FaceDetails', []), sub_image_count, frame_times)
+    if frame_paths:
+        # 只在不确定的格子可能改变判定结果时，按原分辨率单帧重查
+        requery_uncertain_tiles(tiles, frame_paths, faceDetection, sub_image_count * 2 / 3)
+    return analysis_tiles(tiles, sub_image_count)
+
+
+def analysis_face_details(response, sub_image_count, frame_times=None):
+    tiles = attribute_faces_to_tiles(response.get('FaceDetails', []), sub_image_count, frame_times)
+    return analysis_tiles(tiles, sub_image_count)
+
+
+def format_frame_times(timestamps):
+    return ', '.join(f'{round(t, 1):g}s' for t in timestamps)
+
+
+def analysis_tiles(tiles, sub_image_count):
+    min_age = 14
+    max_age = 18
+    minor_times = []
+    male_times = []
+    face_times = []
+    face_not_occluded_times = []
+
+    for tile in tiles:
+        faces = confident_faces(tile)
+        if faces:
+            face_times.append(tile['timestamp'])
+        if any(face_detail.get('FaceOccluded').get('Value') == False for face_detail in faces):
+            face_not_occluded_times.append(tile['timestamp'])
+        for face_detail in faces:
             if face_detail.get('AgeRange').get('Low') < min_age and face_detail.get('AgeRange').get('High') < max_age and face_detail.get('FaceOccluded').get('Value') == False:
-                is_minors = True
+                minor_times.append(tile['timestamp'])
             if face_detail.get('Gender').get('Value') == "Male":
-                gender = "Male"
-            if face_detail.get('FaceOccluded').get('Value') == False:
-                face_not_occluded_count += 1
+                male_times.append(tile['timestamp'])
 
+    all_times = [tile['timestamp'] for tile in tiles]
     result = {}
-    # 出现了几张人脸，数量必须大于 sub_image_count*2/3
-    if face_count < sub_image_count * 2 / 3:
+    # 出现人脸的帧数，必须大于 sub_image_count*2/3（同一帧多张人脸只算一次）
+    if len(face_times) < sub_image_count * 2 / 3:
+        missing = [t for t in all_times if t not in face_times]
         result['FACE_ISSUE'] = {
-            'explanation': 'There is no face continuously appearing in the video frame',
+            'explanation': f'There is no face continuously appearing in the video frame (face in {len(face_times)}/{sub_image_count} frames, missing at {format_frame_times(missing)})',
             'is_exist': 1,
-            'confidence': 99
+            'confidence': 99,
+            'timestamps': missing
         }
     # 未成年判断
-    if is_minors:
+    if minor_times:
+        minor_times = sorted(set(minor_times))
         result['MINORS_ISSUE'] = {
-            'explanation': 'Minors may appear in the video',
+            'explanation': f'Minors may appear in the video (at {format_frame_times(minor_times)})',
             'is_exist': 1,
-            'confidence': 99
+            'confidence': 99,
+            'timestamps': minor_times
         }
     # 判断是否出现过男人
-    if gender == "Male":
+    if male_times:
+        male_times = sorted(set(male_times))
         result['MALE_ISSUE'] = {
-            'explanation': 'Male may appear in the video',
+            'explanation': f'Male may appear in the video (at {format_frame_times(male_times)})',
             'is_exist': 1,
-            'confidence': 99
+            'confidence': 99,
+            'timestamps': male_times
         }
-    # 判断未遮挡人脸的数量 必须大于 sub_image_count*2/3
-    if face_not_occluded_count < sub_image_count * 2 / 3:
+    # 判断未遮挡人脸的帧数 必须大于 sub_image_count*2/3
+    if len(face_not_occluded_times) < sub_image_count * 2 / 3:
+        occluded = [t for t in all_times if t not in face_not_occluded_times]
         result['FACE_OCCLUDED_ISSUE'] = {
-            'explanation': 'The face is occluded in the video frame',
+            'explanation': f'The face is occluded in the video frame (at {format_frame_times(occluded)})',
             'is_exist': 1,
-            'confidence': 99
+            'confidence': 99,
+            'timestamps': occluded
         }
 
     return result
 
 
-bedrock_runtime = boto3.client("bedrock-runtime", region_name="us-east-1")
+# 多 region 客户端池，通过 BEDROCK_REGIONS / BEDROCK_HEDGE 等环境变量配置
+bedrock_runtime = BedrockClientPool.from_env(default_region="us-east-1")
 
 
 def call_nova_use_local_file(video_local_path, model_id, prompt, system_prompt, temperature, top_p, max_token):
-    with open(video_local_path, "rb") as file:
-        media_bytes = file.read()
-
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {
-                    "video": {
-                        "format": "mp4",
-                        "source": {
-                            "bytes": media_bytes
-                        }
-                    }
-                },
-                {"text": prompt},
-            ],
-        }
-    ]
-
-    system = [{
-        "text": system_prompt
-    }]
-
-    inferenceConfig = {
-        "maxTokens": int(max_token),
-        'temperature': temperature,
-        'topP': top_p
-    }
+    payload = VideoPayload("bytes", local_path=video_local_path)
+    return call_nova_use_payload(payload, model_id, prompt, system_prompt, temperature, top_p, max_token)
 
-    start_time = time.time()
-
-    response = bedrock_runtime.converse(
-        modelId=model_id,
-        messages=messages,
-        system=system,
-        inferenceConfig=inferenceConfig
-    )
 
-    # 计算耗时
-    elapsed_time = time.time() - start_time
-    print(f"API调用耗时: {elapsed_time:.2f}秒")
-    return response
+def call_nova_use_s3_file(s3_uri, model_id, prompt, system_prompt, temperature, top_p, max_token):
+    payload = VideoPayload("s3", s3_uri=s3_uri)
+    return call_nova_use_payload(payload, model_id, prompt, system_prompt, temperature, top_p, max_token)
 
 
-def call_nova_use_s3_file(s3_uri, model_id, prompt, system_prompt, temperature, top_p, max_token):
+def call_nova_use_payload(payload, model_id, prompt, system_prompt, temperature, top_p, max_token):
     messages = [
         {
             "role": "user",
             "content": [
-                {
-                    "video": {
-                        "format": "mp4",
-                        "source": {
-                            "s3Location": {
-                                "uri": s3_uri
-                            }
-                        }
-                    }
-                },
+                payload.video_block(),
                 {"text": prompt},
             ],
         }
@@ -350,49 +473,62 @@ def call_nova_use_s3_file(s3_uri, model_id, prompt, system_prompt, temperature,
 
     start_time = time.time()
 
-    response = bedrock_runtime.converse(
-        modelId=model_id,
-        messages=messages,
-        system=system,
-        inferenceConfig=inferenceConfig
-    )
+    with span('nova_converse', kind=payload.kind, model_id=model_id) as s:
+        s.add_bytes(bytes_in=(payload.size or 0) if payload.kind == 'bytes' else 0)
+        response = bedrock_runtime.converse(
+            modelId=model_id,
+            messages=messages,
+            system=system,
+            inferenceConfig=inferenceConfig
+        )
+        usage = response.get('usage', {})
+        s.set(input_tokens=usage.get('inputTokens'), output_tokens=usage.get('outputTokens'))
 
     # 计算耗时
     elapsed_time = time.time() - start_time
-    print(f"API调用耗时: {elapsed_time:.2f}秒")
+    print(f"API调用耗时({payload.kind}): {elapsed_time:.2f}秒")
+    record_call(model_id, response, elapsed_time * 1000, videos=1)
     return response
 
 
+def scratch_dir(tmp_uuid):
+    """Directory for a downloaded video: the invocation's scratch space, or a new /tmp/<uuid>"""
+    scratch = current_scratch()
+    if scratch:
+        return scratch.dir
+    local_dir = f'{TMP_DIR}/{tmp_uuid}'
+    os.makedirs(local_dir, exist_ok=True)
+    return local_dir
+
+
 def download_video_from_s3(s3_uri):
     # 解析 S3 URI
     assert s3_uri.startswith("s3://")
     _, bucket_key = s3_uri.split("s3://", 1)
     bucket, key = bucket_key.split("/", 1)
 
-    # 创建存储目录
-    tmp_dir = TMP_DIR
-    os.makedirs(tmp_dir, exist_ok=True)
-
+    # 创建存储目录，有当前调用的 scratch 空间时下载到其中
     tmp_uuid = uuid.uuid4()
-    local_dir = f'{tmp_dir}/{tmp_uuid}'
-    os.makedirs(local_dir, exist_ok=True)
-
-    # 下载视频到本地
-    s3 = boto3.client('s3')
-    local_video_path = f'{local_dir}/{tmp_uuid}.mp4'
+    local_dir = scratch_dir(tmp_uuid)
+
+    # 下载视频到本地，保留原始扩展名，容器类型后续由 ffprobe 判断
+    s3 = get_client('s3')
+    scratch = current_scratch()
+    if scratch:
+        # 先确认 /tmp 预算能放下，放不下时先淘汰缓存，仍不够则直接失败
+        scratch.ensure_capacity(s3.head_object(Bucket=bucket, Key=key)['ContentLength'])
+    ext = os.path.splitext(key)[1].lower() or '.mp4'
+    local_video_path = f'{local_dir}/{tmp_uuid}{ext}'
     s3.download_file(bucket, key, local_video_path)
 
     return local_video_path
 
 
 def download_video_from_url(video_url):
-    # 创建存储目录
-    tmp_dir = TMP_DIR
-    os.makedirs(tmp_dir, exist_ok=True)
+    import requests
 
-    tmp_uuid = uuid.uuid4()
-    local_dir = f'{tmp_dir}/{tmp_uuid}'
-    os.makedirs(local_dir, exist_ok=True)
+    # 创建存储目录，有当前调用的 scratch 空间时下载到其中
+    local_dir = scratch_dir(uuid.uuid4())
 
     # 从URL中提取文件名
     filename = extract_filename_from_url(video_url)
@@ -406,6 +542,9 @@ def download_video_from_url(video_url):
 
     with requests.get(video_url, stream=True) as response:
         response.raise_for_status()
+        scratch = current_scratch()
+        if scratch and response.headers.get('Content-Length'):
+            scratch.ensure_capacity(int(response.headers['Content-Length']))
         with open(output_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=8192):
                 if chunk:
@@ -421,32 +560,216 @@ def extract_filename_from_url(url):
     return filename
 
 
+def get_video_duration(local_video_path):
+    import cv2
+
+    cap = cv2.VideoCapture(local_video_path)
+    if not cap.isOpened():
+        raise RuntimeError("无法打开视频文件")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return total_frames / fps if fps else 0
+
+
+def quality_stage(local_video_path):
+    from video_quality_checker import check_video_quality
+
+    # ffmpeg check video quality
+    video_quality_check_result = check_video_quality(local_video_path)
+    video_quality_result = {}
+    for r in video_quality_check_result['issues']:
+        video_quality_result[str(r['type']).upper()] = {
+            'explanation': r['description'],
+            'is_exist': 1,
+            'confidence': 99
+        }
+    return video_quality_result
+
+
+def nova_stage(local_video_path, event, video_s3_uri=None):
+    model_id = event.get('model_id', 'us.amazon.nova-pro-v1:0')
+    prompt = event.get('prompt', NOVA_PROMPT)
+    system_prompt = event.get('system_prompt', SYSTEM_PROMPT)
+    temperature = event.get('temperature', 0.3)
+    top_p = event.get('top_p', 0.5)
+    max_token = event.get('max_token', 2048)
+    # 超出请求/批次 token 预算时降级到更便宜的模型
+    model_id = choose_model(model_id)
+
+    # S3 来源直接传 s3Location，URL 来源按大小选择 inline 或暂存到 scratch bucket
+    # 按真实容器声明 format，Bedrock 不支持的容器（如 avi）先 remux 成 mp4
+    with span('nova_prepare') as s:
+        s.add_bytes(bytes_in=os.path.getsize(local_video_path))
+        if event.get('use_proxy', NOVA_PROXY_ENABLED):
+            proxy_path = build_moderation_proxy(local_video_path)
+            payload = plan_video_payload(proxy_path)
+        else:
+            video_path, video_format = prepare_video_for_bedrock(local_video_path)
+            source_s3_uri = video_s3_uri if video_path == local_video_path else None
+            payload = plan_video_payload(video_path, source_s3_uri, video_format=video_format)
+        s.add_bytes(bytes_out=payload.size or 0)
+        s.set(kind=payload.kind)
+    try:
+        nova_response = call_nova_use_payload(
+            payload, model_id, prompt, system_prompt, temperature, top_p, max_token)
+    finally:
+        payload.cleanup()
+
+    return json.loads(nova_response.get("output").get(
+        "message").get("content")[0].get("text"))
+
+
+def analyze_video(local_video_path, event, video_s3_uri=None, stage_prefix='', time_offset=0.0):
+    """frames -> rekognition -> nova on one video (or one chunk of it)
+
+    Stage verdicts of async jobs are stored as <stage_prefix><stage>.
+    time_offset is the start of the chunk in the original video, so frame
+    timestamps in the verdicts refer to the whole video.
+    """
+    with span('frames') as s:
+        frame_paths, frame_times = extract_sampled_frames(local_video_path)
+        frame_times = [round(time_offset + t, 3) for t in frame_times]
+        s.add_bytes(bytes_in=os.path.getsize(local_video_path),
+                    bytes_out=sum(os.path.getsize(fp) for fp in frame_paths))
+        s.set(frames=len(frame_paths))
+
+    # 本地人脸预筛：明显无人脸直接判定，无需属性时单人脸也跳过 detect_faces
+    run_face_detection = True
+    if event.get('face_prescreen', FACE_PRESCREEN_ENABLED):
+        from face_prescreen import FACE_ATTRIBUTES_REQUIRED, prescreen_frames, local_face_result
+
+        with span('face_prescreen') as s:
+            prescreen = prescreen_frames(frame_paths)
+            s.set(decision=prescreen['decision'])
+        print(f"本地人脸预筛: {prescreen['decision']} ({prescreen['frames_with_face']}/{prescreen['frame_count']})")
+        local_result = local_face_result(prescreen)
+        if local_result:
+            report_stage(f'{stage_prefix}face_prescreen', local_result)
+            return local_result
+        if prescreen['decision'] == 'single_face' and not FACE_ATTRIBUTES_REQUIRED:
+            run_face_detection = False
+
+    run_moderation = event.get('rekognition_moderation', REKOGNITION_MODERATION_ENABLED)
+    if run_face_detection or run_moderation:
+        with span('mosaic') as s:
+            merged_imaged = merge_frames(frame_paths, os.path.dirname(local_video_path))
+            s.add_bytes(bytes_out=os.path.getsize(merged_imaged))
+
+        # rekognition check face + moderation labels
+        rek_moderation_result = rekognition_stage(
+            merged_imaged, len(frame_paths), frame_paths,
+            face_detection=run_face_detection, moderation=run_moderation, frame_times=frame_times)
+        rek_moderation_result = {k: rek_r for k, rek_r in rek_moderation_result.items()
+                                 if rek_r['is_exist'] != 0}
+        report_stage(f'{stage_prefix}rekognition', rek_moderation_result)
+
+        if len(rek_moderation_result.keys()) > 0:
+            print(f'rekognition check failed')
+            return rek_moderation_result
+
+    # nova check
+    nova_result = nova_stage(local_video_path, event, video_s3_uri)
+    report_stage(f'{stage_prefix}nova', nova_result)
+    return nova_result
+
+
+def analyze_video_segmented(local_video_path, event, duration):
+    """Split a long video at keyframes and analyse the chunks concurrently"""
+    segment_dir = os.path.join(os.path.dirname(local_video_path), 'segments')
+    scratch = current_scratch()
+    if scratch:
+        # 分段是无重编码的拷贝，约占原视频大小
+        scratch.ensure_capacity(os.path.getsize(local_video_path))
+    with span('segment_split') as s:
+        segments = split_video(local_video_path, segment_dir, duration,
+                               n_segments=event.get('segments'))
+        s.set(segments=len(segments))
+    print(f'视频时长 {duration:.1f}秒，切分为 {len(segments)} 段并行分析')
+    segment_results = analyze_segments(
+        segments, wrap(lambda segment: analyze_video(
+            segment['path'], event, stage_prefix=f"segment_{segment['index']:03d}.",
+            time_offset=segment['start'])))
+    return merge_segment_results(segment_results)
+
+
+def analyze_video_progressive(local_video_path, event, duration):
+    """Scan growing windows and stop at the first high-confidence violation"""
+    window_dir = os.path.join(os.path.dirname(local_video_path), 'windows')
+    scratch = current_scratch()
+    if scratch:
+        scratch.ensure_capacity(os.path.getsize(local_video_path))
+    return progressive_scan(
+        local_video_path, window_dir, duration,
+        wrap(lambda window: analyze_video(window['path'], event, stage_prefix=f"window_{window['index']:03d}.",
+                                          time_offset=window['start'])),
+        threshold=event.get('early_stop_confidence'))
+
+
 def handler(event, context):
+    # 异步模式：{"async": true, ...} 立即返回 job_id；{"job_id": ...}（不带视频）查询状态和结果
+    if event.get('async'):
+        try:
+            return submit_job(event, context)
+        except Exception as e:
+            return {
+                'err_no': 1,
+                'err_msg': str(e),
+                'data': {}
+            }
+    if event.get('job_id') and not event.get('video_s3_uri') and not event.get('video_url'):
+        try:
+            return job_status(event['job_id'])
+        except Exception as e:
+            return {
+                'err_no': 1,
+                'err_msg': str(e),
+                'data': {}
+            }
+
+    # 异步提交的任务在这里执行，各阶段结果逐步写入结果存储
+    try:
+        job_id = begin_job(event.get('job_id'))
+    except JobNotFound as e:
+        return {
+            'err_no': 1,
+            'err_msg': str(e),
+            'data': {}
+        }
+    response = run_pipeline(event, context)
+    end_job(job_id, response)
+    return response
+
+
+def run_pipeline(event, context):
+    # 每次调用输出一行 EMF：各阶段耗时、CPU、字节数与峰值内存
+    tracer = start_trace(os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'video-understanding'))
+    request_id = getattr(context, 'aws_request_id', None)
+    if tracer:
+        tracer.set(request_id=request_id)
+    # 记录本次调用的 Bedrock token 用量与成本，可选单请求/批次预算
+    usage = begin_request(request_id, event.get('token_budget'),
+                          event.get('batch_id'), event.get('batch_token_budget'))
+    # 本次调用的临时空间：小文件放 memfd，/tmp 按预算使用，结束时无论成败都清理
+    scratch = open_scratch()
+    status = 'ok'
     try:
         video_s3_uri = event.get('video_s3_uri', '')
         video_url = event.get('video_url', '')
 
-        if video_s3_uri:
-            local_video_path = download_video_from_s3(video_s3_uri)
-        elif video_url:
-            print(f'video url: {video_url}')
-            local_video_path = download_video_from_url(video_url)
-        else:
-            raise RuntimeError("Invalid param")
-
-        merged_imaged, sub_image_count = extract_and_merge_all_frames(
-            local_video_path)
-
-        # ffmpeg check video quality
-        video_quality_check_result = check_video_quality(local_video_path)
-        video_quality_result = {}
-        for r in video_quality_check_result['issues']:
-            video_quality_result[str(r['type']).upper()] = {
-                'explanation': r['description'],
-                'is_exist': 1,
-                'confidence': 99
-            }
-
+        with span('download') as s:
+            if video_s3_uri:
+                local_video_path = download_video_from_s3(video_s3_uri)
+            elif video_url:
+                print(f'video url: {video_url}')
+                local_video_path = download_video_from_url(video_url)
+            else:
+                raise RuntimeError("Invalid param")
+            s.add_bytes(bytes_out=os.path.getsize(local_video_path))
+
+        with span('quality'):
+            video_quality_result = quality_stage(local_video_path)
+        report_stage('quality', video_quality_result)
         if len(video_quality_result.keys()) > 0:
             print(f'video format check failed')
             return {
@@ -455,50 +778,66 @@ def handler(event, context):
                 'data': video_quality_result
             }
 
-        # rekognition check face
-        rek_moderation_result = analysis_merged_images(
-            merged_imaged, sub_image_count)
-        for k, rek_r in rek_moderation_result.items():
-            if rek_r['is_exist'] == 0:
-                del rek_moderation_result[k]
-
-        if len(rek_moderation_result.keys()) > 0:
-            print(f'rekognition check failed')
+        # 本地模糊/抖动/曝光评分，明显的画质问题在调用 Rekognition、Bedrock 之前直接返回
+        if event.get('local_quality', LOCAL_QUALITY_ENABLED):
+            from frame_quality import score_video, confident_issues
+
+            with span('local_quality') as s:
+                local_quality = score_video(local_video_path)
+                local_quality_result = confident_issues(local_quality['verdict'])
+                s.set(samples=local_quality['samples'])
+            report_stage('local_quality', local_quality_result)
+            if local_quality_result:
+                print('local quality check failed')
+                return {
+                    'err_no': 0,
+                    'err_msg': '',
+                    'data': local_quality_result
+                }
+
+        with span('duration'):
+            duration = get_video_duration(local_video_path)
+        if tracer:
+            tracer.set(duration_s=round(duration, 2))
+        if event.get('progressive', PROGRESSIVE_SCAN) and duration > PROGRESSIVE_FIRST_WINDOW:
+            data, trigger_window = analyze_video_progressive(local_video_path, event, duration)
             return {
                 'err_no': 0,
                 'err_msg': '',
-                'data': rek_moderation_result
+                'data': data,
+                'trigger_window': trigger_window
             }
 
-        # nova check
-        model_id = event.get('model_id', 'us.amazon.nova-pro-v1:0')
-        prompt = event.get('prompt', NOVA_PROMPT)
-        system_prompt = event.get('system_prompt', SYSTEM_PROMPT)
-        temperature = event.get('temperature', 0.3)
-        top_p = event.get('top_p', 0.5)
-        max_token = event.get('max_token', 2048)
-
-        nova_response = call_nova_use_local_file(
-            local_video_path, model_id, prompt, system_prompt, temperature, top_p, max_token)
-
-        nova_result = json.loads(nova_response.get("output").get(
-            "message").get("content")[0].get("text"))
+        # 长视频按关键帧切段并行分析，再合并各段结果
+        if duration > SEGMENT_THRESHOLD_SECONDS:
+            data = analyze_video_segmented(local_video_path, event, duration)
+        else:
+            data = analyze_video(local_video_path, event, video_s3_uri)
 
         return {
             'err_no': 0,
             'err_msg': '',
-            'data': nova_result
+            'data': data
         }
     except Exception as e:
         # raise e
+        status = 'error'
         return {
             'err_no': 1,
             'err_msg': str(e),
             'data': {}
         }
     finally:
-        local_dir = os.path.dirname(local_video_path)
-        shutil.rmtree(local_dir)
+        usage_entry = end_request(usage)
+        scratch_usage = close_scratch(scratch)
+        if tracer:
+            tracer.set(tokens=usage_entry['tokens'], cost_usd=usage_entry['cost_usd'])
+            tracer.metric('scratch.peak_bytes', scratch_usage['peak_bytes'], 'Bytes')
+            tracer.metric('scratch.memfd_bytes', scratch_usage['memfd_bytes'], 'Bytes')
+            tracer.metric('scratch.evicted_bytes', scratch_usage['evicted_bytes'], 'Bytes')
+            tracer.metric('scratch.swept_bytes', scratch_usage['swept_bytes'], 'Bytes')
+            tracer.metric('scratch.fs_free_bytes', scratch_usage['fs_free_bytes'], 'Bytes')
+        finish_trace(tracer, status)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+import os
+
+REKOGNITION_MODERATION_ENABLED = os.environ.get('REKOGNITION_MODERATION', '0') == '1'
+# 只有高置信度（明确）的标签才直接判定，其余交给 Nova
+MODERATION_CONFIDENCE = float(os.environ.get('MODERATION_CONFIDENCE', 90))
+# detect_moderation_labels 的 MinConfidence
+MODERATION_MIN_CONFIDENCE = 50
+
+# Rekognition 审核标签（v6 与 v7 分类体系）到 NOVA_PROMPT 标签的映射，按标签名或父标签名匹配
+LABEL_TAGS = {
+    # NUDITY
+    'Explicit Nudity': 'NUDITY',
+    'Explicit': 'NUDITY',
+    'Nudity': 'NUDITY',
+    'Graphic Male Nudity': 'NUDITY',
+    'Graphic Female Nudity': 'NUDITY',
+    'Exposed Male Genitalia': 'NUDITY',
+    'Exposed Female Genitalia': 'NUDITY',
+    'Exposed Buttocks or Anus': 'NUDITY',
+    'Exposed Female Nipple': 'NUDITY',
+    'Non-Explicit Nudity': 'NUDITY',
+    'Non-Explicit Nudity of Intimate parts and Kissing': 'NUDITY',
+    'Partially Exposed Buttocks': 'NUDITY',
+    'Partially Exposed Female Breast': 'NUDITY',
+    'Implied Nudity': 'NUDITY',
+    # 泳装/内衣、暴露服装不属于 NUDITY 规则的直接拒绝范围，交给 Nova 结合上下文判断
+    # SEXUAL_SUGGESTION
+    'Sexual Activity': 'SEXUAL_SUGGESTION',
+    'Explicit Sexual Activity': 'SEXUAL_SUGGESTION',
+    'Sexual Situations': 'SEXUAL_SUGGESTION',
+    'Adult Toys': 'SEXUAL_SUGGESTION',
+    'Sex Toys': 'SEXUAL_SUGGESTION',
+    'Suggestive': 'SEXUAL_SUGGESTION',
+    'Obstructed Intimate Parts': 'SEXUAL_SUGGESTION',
+}
+
+
+def label_tag(label):
+    """NOVA_PROMPT tag for a ModerationLabels entry, None if it is not mapped"""
+    return LABEL_TAGS.get(label.get('Name')) or LABEL_TAGS.get(label.get('ParentName'))
+
+
+def analysis_moderation_labels(response, min_confidence=None):
+    """Map detect_moderation_labels output onto NUDITY / SEXUAL_SUGGESTION tags
+
+    Only labels at or above min_confidence produce a tag, so borderline
+    cases are still left to Nova.
+    """
+    min_confidence = MODERATION_CONFIDENCE if min_confidence is None else min_confidence
+    found = {}
+    for label in response.get('ModerationLabels', []):
+        tag = label_tag(label)
+        confidence = label.get('Confidence', 0)
+        if tag is None or confidence < min_confidence:
+            continue
+        entry = found.setdefault(tag, {'labels': [], 'confidence': 0})
+        entry['labels'].append(f"{label.get('Name')} ({confidence:.0f})")
+        entry['confidence'] = max(entry['confidence'], confidence)
+
+    result = {}
+    for tag, entry in found.items():
+        result[tag] = {
+            'explanation': f"Rekognition moderation labels: {', '.join(entry['labels'])}",
+            'is_exist': 1,
+            'confidence': int(entry['confidence'])
+        }
+    return result
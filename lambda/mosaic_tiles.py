@@ -0,0 +1,96 @@
+import math
+import os
+
+# 拼接图每行最多 3 列，与 merge_frames 保持一致
+MOSAIC_COLS = 3
+FACE_CONFIDENCE = 80
+# 低于 FACE_CONFIDENCE 但高于该值的人脸视为"不确定"，可按原分辨率单帧重查
+UNCERTAIN_FACE_CONFIDENCE = 50
+MAX_TILE_REQUERIES = int(os.environ.get('MAX_TILE_REQUERIES', 3))
+
+
+def tile_index_for_box(bounding_box, sub_image_count, cols=MOSAIC_COLS):
+    """Tile index of a Rekognition BoundingBox (ratios of the whole mosaic), None if outside any tile"""
+    rows = math.ceil(sub_image_count / cols)
+    cx = bounding_box.get('Left', 0) + bounding_box.get('Width', 0) / 2
+    cy = bounding_box.get('Top', 0) + bounding_box.get('Height', 0) / 2
+    col = min(cols - 1, max(0, int(cx * cols)))
+    row = min(rows - 1, max(0, int(cy * rows)))
+    index = row * cols + col
+    return index if index < sub_image_count else None
+
+
+def to_tile_box(bounding_box, index, sub_image_count, cols=MOSAIC_COLS):
+    """Convert a mosaic-relative BoundingBox to ratios of its own tile"""
+    rows = math.ceil(sub_image_count / cols)
+    col, row = index % cols, index // cols
+    return {
+        'Left': bounding_box.get('Left', 0) * cols - col,
+        'Top': bounding_box.get('Top', 0) * rows - row,
+        'Width': bounding_box.get('Width', 0) * cols,
+        'Height': bounding_box.get('Height', 0) * rows,
+    }
+
+
+def attribute_faces_to_tiles(face_details, sub_image_count, frame_times=None, cols=MOSAIC_COLS):
+    """Map each FaceDetails entry of a mosaic back to its tile and timestamp
+
+    frame_times are the sample times (seconds) of the tiles; without them tile
+    i is taken to be at i seconds. Returns one dict per tile: {"index",
+    "timestamp", "faces", "requeried"}; every face gets a "TileBox" with its
+    bounding box relative to the tile.
+    """
+    tiles = [{'index': i, 'timestamp': frame_times[i] if frame_times else i, 'faces': [], 'requeried': False}
+             for i in range(sub_image_count)]
+    for face_detail in face_details:
+        bounding_box = face_detail.get('BoundingBox', {})
+        index = tile_index_for_box(bounding_box, sub_image_count, cols)
+        if index is None:
+            continue
+        face = dict(face_detail)
+        face['TileBox'] = to_tile_box(bounding_box, index, sub_image_count, cols)
+        tiles[index]['faces'].append(face)
+    return tiles
+
+
+def confident_faces(tile, min_confidence=FACE_CONFIDENCE):
+    return [f for f in tile['faces'] if f.get('Confidence', 0) > min_confidence]
+
+
+def is_uncertain(tile):
+    """No confident face, but at least one low-confidence detection"""
+    if confident_faces(tile):
+        return False
+    return any(f.get('Confidence', 0) >= UNCERTAIN_FACE_CONFIDENCE for f in tile['faces'])
+
+
+def requery_uncertain_tiles(tiles, frame_paths, detect_fn, coverage_threshold, max_requeries=None):
+    """Re-run face detection on the original frames of uncertain tiles
+
+    Only done when the uncertain tiles could move the face coverage across
+    coverage_threshold, i.e. when the re-query can change the verdict.
+    detect_fn(image_path) returns a detect_faces response for a single frame.
+
+    Returns the number of re-queried tiles.
+    """
+    max_requeries = MAX_TILE_REQUERIES if max_requeries is None else max_requeries
+    covered = sum(1 for tile in tiles if confident_faces(tile))
+    uncertain = [tile for tile in tiles if is_uncertain(tile)]
+    if not uncertain or covered >= coverage_threshold or covered + len(uncertain) < coverage_threshold:
+        return 0
+
+    # 优先重查置信度最高的不确定帧
+    uncertain.sort(key=lambda t: max(f.get('Confidence', 0) for f in t['faces']), reverse=True)
+    requeried = 0
+    for tile in uncertain[:max_requeries]:
+        response = detect_fn(frame_paths[tile['index']])
+        faces = []
+        for face_detail in response.get('FaceDetails', []):
+            face = dict(face_detail)
+            face['TileBox'] = face_detail.get('BoundingBox', {})
+            faces.append(face)
+        tile['faces'] = faces
+        tile['requeried'] = True
+        requeried += 1
+    print(f"按原分辨率重查了 {requeried} 个不确定的拼图格")
+    return requeried
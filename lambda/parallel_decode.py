@@ -0,0 +1,166 @@
+import json
+import os
+import struct
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from video_segmenter import probe_keyframes, choose_cut_points
+
+# 并行解码的进程数，0 表示按 CPU 数（Lambda 1769MB 以上才有多个 vCPU）
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', 0))
+# 短于该时长的视频直接单进程解码，启动子进程和打开多个 capture 的开销不划算
+DECODE_MIN_SECONDS = float(os.environ.get('DECODE_MIN_SECONDS', 30))
+
+# Lambda 没有 /dev/shm，multiprocessing 的队列/信号量不可用；调用方（Streamlit、分段线程）又是多线程进程，
+# 直接 fork 可能继承被其他线程持有的锁而死锁。子进程用 subprocess 启动新解释器，帧经管道返回
+PARALLEL_SUPPORTED = bool(sys.executable)
+# 子进程输出的每帧记录头：时间点序号 + JPEG 长度
+_RECORD = struct.Struct('<qq')
+
+
+def decode_workers(workers=None):
+    workers = workers or DECODE_WORKERS or os.cpu_count() or 1
+    return max(1, workers) if PARALLEL_SUPPORTED else 1
+
+
+def plan_ranges(video_path, duration, n_ranges):
+    """n_ranges keyframe-aligned (start, end) ranges covering [0, duration)"""
+    if n_ranges <= 1:
+        return [(0.0, duration)]
+    cuts = choose_cut_points(probe_keyframes(video_path), duration, duration / n_ranges)
+    bounds = [0.0] + cuts + [duration]
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+
+def decode_range(video_path, start, times, store):
+    """Decode times (sorted, seconds) from one capture, calling store(index, jpeg_bytes)
+
+    Seeks once to start (a keyframe, so the seek is cheap), then reads forward;
+    each requested time gets the first frame at or after it.
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError("无法打开视频文件")
+    try:
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_MSEC, start * 1000)
+        # 半帧的容差，避免时间戳浮点误差跳过目标帧
+        tolerance = 0.5 / (cap.get(cv2.CAP_PROP_FPS) or 25)
+        index = 0
+        while index < len(times):
+            if not cap.grab():
+                break
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if timestamp + tolerance < times[index]:
+                continue
+            success, frame = cap.retrieve()
+            if not success:
+                break
+            _, encoded = cv2.imencode('.jpg', frame)
+            while index < len(times) and times[index] <= timestamp + tolerance:
+                store(index, encoded)
+                index += 1
+    finally:
+        cap.release()
+
+
+def _read_frames(stdout, count):
+    """Read (index, length, data) records written by a worker; missing times stay None"""
+    frames = [None] * count
+    while True:
+        header = stdout.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            break
+        index, length = _RECORD.unpack(header)
+        frames[index] = stdout.read(length)
+    return frames
+
+
+def _run_wave(video_path, jobs):
+    """Decode one wave of (start, times) jobs in worker processes; returns [[bytes or None]] per job
+
+    Workers are fresh interpreters (fork + exec via subprocess), so locks held
+    by other threads or OpenCV's thread pool in this process are never
+    inherited; each one streams its JPEG frames back over its stdout pipe.
+    """
+    procs = []
+    try:
+        for start, times in jobs:
+            proc = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            procs.append(proc)
+            proc.stdin.write(json.dumps({'video_path': video_path, 'start': start, 'times': times}).encode())
+            proc.stdin.close()
+        # 每个管道一个读线程，避免某个子进程写满管道后阻塞
+        with ThreadPoolExecutor(max_workers=len(procs)) as executor:
+            futures = [executor.submit(_read_frames, proc.stdout, len(times)) for proc, (_, times) in zip(procs, jobs)]
+            results = [future.result() for future in futures]
+        failed = [proc.stderr.read().decode(errors='replace').strip()[-300:] for proc in procs if proc.wait() != 0]
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            proc.stderr.close()
+    if failed:
+        raise RuntimeError(f"{len(failed)} decode worker(s) failed: {failed[0]}")
+    return results
+
+
+def decode_frames(video_path, times, duration, workers=None):
+    """JPEG frames at the given times (seconds), in timestamp order
+
+    Long videos are split into keyframe-aligned ranges, each decoded by its own
+    worker process with its own capture; encoded frames come back over pipes
+    as raw bytes instead of being pickled. Returns [(time, bytes)], times past
+    the end of the stream are dropped.
+    """
+    times = sorted(times)
+    workers = decode_workers(workers)
+    if workers == 1 or duration < DECODE_MIN_SECONDS or len(times) < 2:
+        frames = {}
+        decode_range(video_path, 0.0, times, lambda i, encoded: frames.__setitem__(i, encoded.tobytes()))
+        return [(times[i], frames[i]) for i in sorted(frames)]
+
+    jobs = []
+    ranges = plan_ranges(video_path, duration, workers)
+    for i, (start, end) in enumerate(ranges):
+        last = i == len(ranges) - 1
+        in_range = [t for t in times if start <= t < end or (last and t >= end)]
+        if in_range:
+            jobs.append((start, in_range))
+
+    try:
+        decoded = []
+        for (_, in_range), frames in zip(jobs, _run_wave(video_path, jobs)):
+            decoded.extend((t, data) for t, data in zip(in_range, frames) if data is not None)
+        return decoded
+    except (OSError, RuntimeError) as e:
+        print(f"并行解码失败，改为单进程解码: {e}")
+        return decode_frames(video_path, times, duration, workers=1)
+
+
+def _worker_main():
+    """Worker process: read {"video_path", "start", "times"} from stdin, write frame records to stdout"""
+    import cv2
+
+    # 并行度来自多个进程，每个进程内 OpenCV 单线程
+    cv2.setNumThreads(1)
+    job = json.loads(sys.stdin.buffer.read())
+    out = sys.stdout.buffer
+
+    def store(index, encoded):
+        data = encoded.tobytes()
+        out.write(_RECORD.pack(index, len(data)))
+        out.write(data)
+
+    decode_range(job['video_path'], job['start'], job['times'], store)
+    out.flush()
+
+
+if __name__ == "__main__":
+    _worker_main()
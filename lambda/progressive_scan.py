@@ -0,0 +1,119 @@
+import os
+
+from tracing import span
+from video_segmenter import cut_segment, merge_segment_results, probe_keyframes, MAX_SEGMENT_SECONDS
+
+PROGRESSIVE_FIRST_WINDOW = float(os.environ.get('PROGRESSIVE_FIRST_WINDOW', 5))
+PROGRESSIVE_GROWTH = float(os.environ.get('PROGRESSIVE_GROWTH', 2))
+EARLY_STOP_CONFIDENCE = float(os.environ.get('EARLY_STOP_CONFIDENCE', 90))
+# 按整段视频中有脸帧占比判定的标签，单个窗口无法定论，不触发提前停止
+COVERAGE_TAGS = {'FACE_ISSUE', 'FACE_OCCLUDED_ISSUE'}
+
+
+def progressive_windows(duration, first_window=None, growth=None, max_window=None):
+    """Growing, back-to-back windows over the timeline
+
+    e.g. first_window=5, growth=2 -> 0-5, 5-15, 15-33, ... with every window
+    capped at max_window so a single window still fits in one mosaic.
+    """
+    first_window = first_window or PROGRESSIVE_FIRST_WINDOW
+    growth = growth or PROGRESSIVE_GROWTH
+    max_window = max_window or MAX_SEGMENT_SECONDS
+
+    windows = []
+    start = 0.0
+    size = min(first_window, max_window)
+    while start < duration:
+        end = min(duration, start + size)
+        # 剩余不足 1 秒时并入当前窗口
+        if duration - end < 1:
+            end = duration
+        windows.append((start, end))
+        start = end
+        size = min(size * growth, max_window)
+    return windows
+
+
+def snap_windows(windows, keyframes):
+    """Move the bounds between windows onto the nearest keyframes
+
+    A stream-copied window starts at the keyframe at or before its nominal
+    start, so unsnapped bounds would make windows overlap and report the
+    wrong time range. Windows that collapse onto the same keyframe merge.
+    """
+    if not keyframes or len(windows) < 2:
+        return windows
+    duration = windows[-1][1]
+    bounds = [0.0]
+    for _, end in windows[:-1]:
+        candidates = [k for k in keyframes if bounds[-1] < k < duration]
+        if not candidates:
+            break
+        cut = min(candidates, key=lambda k: abs(k - end))
+        if cut > bounds[-1]:
+            bounds.append(cut)
+    bounds.append(duration)
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+
+
+def triggering_tag(result, threshold):
+    """First content tag that exists with confidence >= threshold
+
+    NO_ISSUE and the coverage tags (COVERAGE_TAGS) never stop the scan.
+    """
+    for tag, detail in result.items():
+        if tag == 'NO_ISSUE' or tag in COVERAGE_TAGS or not isinstance(detail, dict):
+            continue
+        if int(detail.get('is_exist', 0)) and detail.get('confidence', 0) >= threshold:
+            return tag, detail
+    return None
+
+
+def progressive_scan(video_path, work_dir, duration, analyze_fn, threshold=None, first_window=None, growth=None):
+    """Analyse the video window by window and stop at the first confident violation
+
+    analyze_fn(window) runs the frames -> rekognition -> nova stages on one window.
+
+    Returns (verdict, trigger) where verdict merges the windows analysed so far and
+    trigger describes the window that stopped the scan (None if the whole video
+    was scanned without a confident violation).
+    """
+    threshold = EARLY_STOP_CONFIDENCE if threshold is None else threshold
+    ext = os.path.splitext(video_path)[1] or '.mp4'
+
+    window_results = []
+    keyframes = probe_keyframes(video_path)
+    windows = snap_windows(progressive_windows(duration, first_window, growth), keyframes)
+    # 拿不到关键帧时窗口边界不在关键帧上，改为精确切割（重新编码），保证窗口不重叠、上报的区间准确
+    accurate = not keyframes
+    for index, (start, end) in enumerate(windows):
+        window_dir = os.path.join(work_dir, f'win_{index:03d}')
+        os.makedirs(window_dir, exist_ok=True)
+        with span('window_cut', index=index):
+            window_path = cut_segment(video_path, start, end, os.path.join(window_dir, f'win_{index:03d}{ext}'),
+                                      accurate=accurate)
+        window = {
+            'index': index,
+            'path': window_path,
+            'start': start,
+            'end': end,
+        }
+        result = analyze_fn(window)
+        window_results.append((window, result))
+
+        hit = triggering_tag(result, threshold)
+        if hit:
+            tag, detail = hit
+            print(f'窗口 {index} ({start:.1f}-{end:.1f}s) 命中 {tag}，提前结束扫描')
+            trigger = {
+                'index': index,
+                'start': round(start, 3),
+                'end': round(end, 3),
+                'tag': tag,
+                'confidence': detail.get('confidence'),
+                'windows_scanned': index + 1,
+                'windows_total': len(windows),
+            }
+            return merge_segment_results(window_results), trigger
+
+    return merge_segment_results(window_results), None
@@ -0,0 +1,444 @@
+import argparse
+import json
+import math
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_clients import get_client
+from tracing import register_listener
+
+WORKER_MIN_CONCURRENCY = int(os.environ.get('WORKER_MIN_CONCURRENCY', 1))
+WORKER_MAX_CONCURRENCY = int(os.environ.get('WORKER_MAX_CONCURRENCY', 16))
+# 消息处理期间按该可见性超时定期续期
+WORKER_VISIBILITY_TIMEOUT = int(os.environ.get('WORKER_VISIBILITY_TIMEOUT', 300))
+# 超过该接收次数仍失败的消息转入死信
+WORKER_MAX_RECEIVES = int(os.environ.get('WORKER_MAX_RECEIVES', 3))
+# 目标：当前积压在该时间内处理完，据此计算需要的并发
+WORKER_DRAIN_SECONDS = float(os.environ.get('WORKER_DRAIN_SECONDS', 60))
+# 模型/识别阶段延迟超过基线的倍数时认为下游已饱和（限流），并发减半
+WORKER_LATENCY_BACKOFF = float(os.environ.get('WORKER_LATENCY_BACKOFF', 2.0))
+# SQS 死信队列，不设置时超过重试次数的消息直接删除
+WORKER_DLQ_URL = os.environ.get('WORKER_DLQ_URL', '')
+# 调用下游服务的阶段，用它们的耗时判断是否饱和
+DOWNSTREAM_STAGES = ('nova_converse', 'detect_faces', 'detect_moderation_labels')
+
+
+class Message:
+    def __init__(self, id, body, receipt, receive_count=1):
+        self.id = id
+        self.body = body
+        self.receipt = receipt
+        self.receive_count = receive_count
+
+
+class MemoryQueue:
+    def __init__(self):
+        """In-process queue with SQS-like visibility timeouts, for local runs"""
+        self._messages = {}
+        self.dead = []
+        self._lock = threading.Condition()
+
+    def send(self, body):
+        with self._lock:
+            message_id = str(uuid.uuid4())
+            self._messages[message_id] = {'body': body, 'visible_at': 0.0, 'receive_count': 0, 'receipt': None}
+            self._lock.notify_all()
+            return message_id
+
+    def receive(self, max_messages, wait_seconds, visibility_timeout):
+        deadline = time.time() + wait_seconds
+        with self._lock:
+            while True:
+                now = time.time()
+                ready = [(message_id, m) for message_id, m in self._messages.items() if m['visible_at'] <= now]
+                if ready or now >= deadline:
+                    break
+                self._lock.wait(min(1.0, deadline - now))
+            messages = []
+            for message_id, m in ready[:max_messages]:
+                m['visible_at'] = now + visibility_timeout
+                m['receive_count'] += 1
+                m['receipt'] = str(uuid.uuid4())
+                messages.append(Message(message_id, m['body'], m['receipt'], m['receive_count']))
+            return messages
+
+    def _current(self, message):
+        m = self._messages.get(message.id)
+        return m if m and m['receipt'] == message.receipt else None
+
+    def ack(self, message):
+        with self._lock:
+            if self._current(message):
+                del self._messages[message.id]
+
+    def extend(self, message, seconds):
+        with self._lock:
+            m = self._current(message)
+            if m:
+                m['visible_at'] = time.time() + seconds
+
+    def release(self, message, delay=0):
+        self.extend(message, delay)
+        with self._lock:
+            self._lock.notify_all()
+
+    def dead_letter(self, message, reason):
+        with self._lock:
+            if self._current(message):
+                del self._messages[message.id]
+                self.dead.append({'id': message.id, 'body': message.body, 'reason': reason})
+
+    def backlog(self):
+        now = time.time()
+        with self._lock:
+            return sum(1 for m in self._messages.values() if m['visible_at'] <= now)
+
+    def size(self):
+        with self._lock:
+            return len(self._messages)
+
+
+class SqliteQueue:
+    def __init__(self, path):
+        """SQLite-backed queue; several worker processes can share one file"""
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS messages (id TEXT PRIMARY KEY, body TEXT, created REAL, '
+                'visible_at REAL, receive_count INTEGER DEFAULT 0, receipt TEXT, dead INTEGER DEFAULT 0, '
+                'reason TEXT)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS messages_ready ON messages (dead, visible_at)')
+
+    def send(self, body):
+        message_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT INTO messages (id, body, created, visible_at) VALUES (?, ?, ?, ?)',
+                               (message_id, json.dumps(body), now, now))
+        return message_id
+
+    def receive(self, max_messages, wait_seconds, visibility_timeout):
+        deadline = time.time() + wait_seconds
+        while True:
+            messages = self._claim(max_messages, visibility_timeout)
+            if messages or time.time() >= deadline:
+                return messages
+            time.sleep(min(0.5, max(0.0, deadline - time.time())))
+
+    def _claim(self, max_messages, visibility_timeout):
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE 事务保证多个进程不会领取同一条消息
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    'SELECT id, body, receive_count FROM messages WHERE dead = 0 AND visible_at <= ? '
+                    'ORDER BY created LIMIT ?', (now, max_messages)).fetchall()
+                messages = []
+                for message_id, body, receive_count in rows:
+                    receipt = str(uuid.uuid4())
+                    self._conn.execute(
+                        'UPDATE messages SET visible_at = ?, receive_count = ?, receipt = ? WHERE id = ?',
+                        (now + visibility_timeout, receive_count + 1, receipt, message_id))
+                    messages.append(Message(message_id, json.loads(body), receipt, receive_count + 1))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return messages
+
+    def _execute(self, sql, params):
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def ack(self, message):
+        self._execute('DELETE FROM messages WHERE id = ? AND receipt = ?', (message.id, message.receipt))
+
+    def extend(self, message, seconds):
+        self._execute('UPDATE messages SET visible_at = ? WHERE id = ? AND receipt = ?',
+                      (time.time() + seconds, message.id, message.receipt))
+
+    def release(self, message, delay=0):
+        self.extend(message, delay)
+
+    def dead_letter(self, message, reason):
+        self._execute('UPDATE messages SET dead = 1, reason = ? WHERE id = ? AND receipt = ?',
+                      (reason, message.id, message.receipt))
+
+    def backlog(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM messages WHERE dead = 0 AND visible_at <= ?',
+                                      (time.time(),)).fetchone()[0]
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM messages WHERE dead = 0').fetchone()[0]
+
+
+class SqsQueue:
+    def __init__(self, queue_url, dlq_url=None):
+        self.queue_url = queue_url
+        self.dlq_url = WORKER_DLQ_URL if dlq_url is None else dlq_url
+        self.sqs = get_client('sqs')
+
+    def send(self, body):
+        return self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(body))['MessageId']
+
+    def receive(self, max_messages, wait_seconds, visibility_timeout):
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=max(1, min(10, max_messages)),
+            WaitTimeSeconds=int(min(20, wait_seconds)),
+            VisibilityTimeout=visibility_timeout,
+            AttributeNames=['ApproximateReceiveCount'],
+        )
+        return [Message(m['MessageId'], json.loads(m['Body']), m['ReceiptHandle'],
+                        int(m.get('Attributes', {}).get('ApproximateReceiveCount', 1)))
+                for m in response.get('Messages', [])]
+
+    def ack(self, message):
+        self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message.receipt)
+
+    def extend(self, message, seconds):
+        self.sqs.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=message.receipt,
+                                           VisibilityTimeout=int(seconds))
+
+    def release(self, message, delay=0):
+        self.extend(message, min(int(delay), 43200))
+
+    def dead_letter(self, message, reason):
+        if self.dlq_url:
+            self.sqs.send_message(QueueUrl=self.dlq_url, MessageBody=json.dumps(
+                {'event': message.body, 'reason': reason, 'message_id': message.id}, ensure_ascii=False))
+        self.ack(message)
+
+    def _attributes(self, *names):
+        attributes = self.sqs.get_queue_attributes(QueueUrl=self.queue_url, AttributeNames=list(names))
+        return sum(int(v) for v in attributes['Attributes'].values())
+
+    def backlog(self):
+        return self._attributes('ApproximateNumberOfMessages')
+
+    def size(self):
+        return self._attributes('ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible',
+                                'ApproximateNumberOfMessagesDelayed')
+
+
+def open_queue(uri):
+    """https://sqs.<region>.amazonaws.com/... | sqlite:///path/to/file.db | memory://"""
+    if uri.startswith('sqlite://'):
+        return SqliteQueue(uri[len('sqlite://'):])
+    if uri.startswith('memory://'):
+        return MemoryQueue()
+    return SqsQueue(uri)
+
+
+class ConcurrencyController:
+    def __init__(self, min_concurrency, max_concurrency, drain_seconds=None, latency_backoff=None):
+        """Target concurrency from backlog and downstream stage latency
+
+        Demand is the concurrency that drains the backlog within drain_seconds
+        at the observed job time. The cap grows by one per adjustment while
+        downstream latency stays near its baseline, and is halved when it rises
+        above latency_backoff x baseline (throttling or a saturated endpoint),
+        so more threads do not just queue more retries.
+        """
+        self.min = max(1, min_concurrency)
+        self.max = max(self.min, max_concurrency)
+        self.drain_seconds = drain_seconds or WORKER_DRAIN_SECONDS
+        self.latency_backoff = latency_backoff or WORKER_LATENCY_BACKOFF
+        self.cap = self.min
+        self.target = self.min
+        self.job_seconds = None
+        self.latencies = deque(maxlen=50)
+        self.baseline_ms = None
+        self._lock = threading.Lock()
+
+    def observe_job(self, seconds):
+        with self._lock:
+            self.job_seconds = seconds if self.job_seconds is None else 0.8 * self.job_seconds + 0.2 * seconds
+
+    def observe_trace(self, record):
+        """Trace listener: collects the downstream stage wall times of every finished job"""
+        stage_ms = [s['wall_ms'] for s in record.get('spans', []) if s['name'] in DOWNSTREAM_STAGES]
+        if not stage_ms:
+            return
+        with self._lock:
+            self.latencies.extend(stage_ms)
+
+    def adjust(self, backlog, inflight):
+        with self._lock:
+            if self.latencies:
+                recent = sorted(self.latencies)[len(self.latencies) // 2]
+                # 基线取观察到的中位延迟的较低值，并缓慢上移以适应正常变化
+                if self.baseline_ms is None or recent < self.baseline_ms:
+                    self.baseline_ms = recent
+                else:
+                    self.baseline_ms *= 1.01
+                if recent > self.baseline_ms * self.latency_backoff:
+                    self.cap = max(self.min, self.cap // 2)
+                    self.latencies.clear()
+                else:
+                    self.cap = min(self.max, self.cap + 1)
+            else:
+                self.cap = min(self.max, self.cap + 1)
+            job_seconds = self.job_seconds or self.drain_seconds
+            demand = math.ceil((backlog + inflight) * job_seconds / self.drain_seconds)
+            self.target = max(self.min, min(self.cap, demand))
+            return self.target
+
+
+class WorkerContext:
+    def __init__(self, message):
+        self.aws_request_id = message.id
+
+
+class QueueWorker:
+    def __init__(self, queue, process=None, min_concurrency=None, max_concurrency=None,
+                 visibility_timeout=None, max_receives=None, on_result=None):
+        """Pull messages from queue and run process(event, context) on a thread pool
+
+        process defaults to lambda_function.handler. on_result(message, result)
+        is called before the message is acked.
+        """
+        self.queue = queue
+        self.process = process
+        self.visibility_timeout = visibility_timeout or WORKER_VISIBILITY_TIMEOUT
+        self.max_receives = max_receives or WORKER_MAX_RECEIVES
+        self.on_result = on_result
+        self.controller = ConcurrencyController(
+            WORKER_MIN_CONCURRENCY if min_concurrency is None else min_concurrency,
+            max_concurrency or WORKER_MAX_CONCURRENCY)
+        self.executor = ThreadPoolExecutor(max_workers=self.controller.max, thread_name_prefix='queue-job')
+        self.inflight = {}
+        self.stats = {'processed': 0, 'failed': 0, 'retried': 0, 'dead_lettered': 0}
+        self._lock = threading.Lock()
+        # _stop 只停止接收新消息；心跳在进行中的任务全部结束后才停止
+        self._stop = threading.Event()
+        self._heartbeat_stop = threading.Event()
+        register_listener(self.controller.observe_trace)
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def run(self, drain=False, adjust_seconds=5.0):
+        """Poll until stop() (or, with drain, until the queue is empty and no job is running)"""
+        if self.process is None:
+            from lambda_function import handler
+            self.process = handler
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        next_adjust = 0.0
+        target = self.controller.min
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    inflight = len(self.inflight)
+                if time.time() >= next_adjust:
+                    target = self.controller.adjust(self.queue.backlog(), inflight)
+                    next_adjust = time.time() + adjust_seconds
+                free = target - inflight
+                if free <= 0:
+                    time.sleep(0.2)
+                    continue
+                messages = self.queue.receive(free, 1 if drain else 10, self.visibility_timeout)
+                if not messages:
+                    # 退避中的重试消息不可见但仍在队列里，不能算作排空
+                    if drain and inflight == 0 and self.queue.size() == 0:
+                        break
+                    continue
+                for message in messages:
+                    with self._lock:
+                        self.inflight[message.id] = message
+                    self.executor.submit(self._run_one, message)
+        finally:
+            self._stop.set()
+            # 停止接收新消息，等待进行中的任务完成并确认；期间心跳继续延长可见性，避免消息被重新投递
+            self.executor.shutdown(wait=True)
+            self._heartbeat_stop.set()
+            heartbeat.join()
+        return self.stats
+
+    def _run_one(self, message):
+        start_time = time.time()
+        try:
+            result = self.process(dict(message.body), WorkerContext(message))
+        except Exception as e:
+            result = {'err_no': 1, 'err_msg': f'{type(e).__name__}: {e}', 'data': {}}
+        self.controller.observe_job(time.time() - start_time)
+        try:
+            if result.get('err_no') == 0:
+                if self.on_result:
+                    self.on_result(message, result)
+                self.queue.ack(message)
+                self._count('processed')
+            elif message.receive_count >= self.max_receives:
+                if self.on_result:
+                    self.on_result(message, result)
+                print(f"消息 {message.id} 重试 {message.receive_count} 次仍失败，转入死信: {result.get('err_msg')}")
+                self.queue.dead_letter(message, result.get('err_msg', ''))
+                self._count('dead_lettered')
+            else:
+                # 指数退避后重新可见
+                self.queue.release(message, delay=min(900, 2 ** message.receive_count))
+                self._count('retried')
+        except Exception as e:
+            print(f"Failed to settle message {message.id}: {e}")
+            self._count('failed')
+        finally:
+            with self._lock:
+                self.inflight.pop(message.id, None)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _heartbeat(self):
+        interval = max(1.0, self.visibility_timeout / 3)
+        while not self._heartbeat_stop.wait(interval):
+            with self._lock:
+                messages = list(self.inflight.values())
+            for message in messages:
+                try:
+                    self.queue.extend(message, self.visibility_timeout)
+                except Exception as e:
+                    print(f"Failed to extend visibility of {message.id}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run handler events from a queue in one warm process; messages are acked after the handler '
+                    'returns, retried with backoff and dead-lettered after WORKER_MAX_RECEIVES failures')
+    parser.add_argument('--queue', default=os.environ.get('WORKER_QUEUE', ''),
+                        help='SQS queue URL, sqlite:///path.db or memory://')
+    parser.add_argument('--min-concurrency', type=int, default=None)
+    parser.add_argument('--max-concurrency', type=int, default=None)
+    parser.add_argument('--drain', action='store_true', help='exit once the queue is empty')
+    parser.add_argument('--enqueue', default=None, help='JSONL file of handler events to send first')
+    args = parser.parse_args()
+    if not args.queue:
+        parser.error('--queue (or WORKER_QUEUE) is required')
+
+    queue = open_queue(args.queue)
+    if args.enqueue:
+        with open(args.enqueue) as f:
+            count = sum(1 for line in f if line.strip() and queue.send(json.loads(line)))
+        print(f"已入队 {count} 条消息")
+
+    worker = QueueWorker(queue, min_concurrency=args.min_concurrency, max_concurrency=args.max_concurrency)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    print(json.dumps(worker.run(drain=args.drain)))
+
+
+if __name__ == "__main__":
+    main()
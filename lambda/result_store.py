@@ -0,0 +1,295 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from aws_clients import get_client
+
+# DynamoDB 条目的过期时间（表上开启 TTL，属性名 expires_at）；S3 用生命周期规则清理
+RESULT_TTL_SECONDS = int(os.environ.get('RESULT_TTL_SECONDS', 7 * 24 * 3600))
+
+QUEUED = 'QUEUED'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+
+
+def new_record(job_id, event):
+    now = time.time()
+    return {'job_id': job_id, 'status': QUEUED, 'created': now, 'updated': now,
+            'event': event, 'stages': {}, 'result': None}
+
+
+class FileResultStore:
+    def __init__(self, root):
+        """One JSON file per job under root, for local runs"""
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, job_id):
+        return os.path.join(self.root, f'{job_id}.json')
+
+    def _read(self, job_id):
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, record):
+        # 先写临时文件再替换，读取方不会看到写了一半的 JSON
+        tmp_path = self._path(record['job_id']) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self._path(record['job_id']))
+
+    def _update(self, job_id, fn):
+        with self._lock:
+            record = self._read(job_id)
+            if record is None:
+                raise KeyError(job_id)
+            fn(record)
+            record['updated'] = time.time()
+            self._write(record)
+
+    def create(self, job_id, event):
+        """Record a new job; False if job_id already exists"""
+        with self._lock:
+            if os.path.exists(self._path(job_id)):
+                return False
+            self._write(new_record(job_id, event))
+            return True
+
+    def put_stage(self, job_id, stage, data):
+        self._update(job_id, lambda record: record['stages'].__setitem__(stage, data))
+
+    def set_status(self, job_id, status, result=None):
+        def apply(record):
+            record['status'] = status
+            if result is not None:
+                record['result'] = result
+        self._update(job_id, apply)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._read(job_id)
+
+
+class SqliteResultStore:
+    def __init__(self, path):
+        """Jobs and their stage results in one SQLite file; several processes can share it"""
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT, created REAL, '
+                'updated REAL, event TEXT, result TEXT)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS stages (job_id TEXT, stage TEXT, data TEXT, updated REAL, '
+                'PRIMARY KEY (job_id, stage))')
+
+    def _execute(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def create(self, job_id, event):
+        record = new_record(job_id, event)
+        cursor = self._execute(
+            'INSERT OR IGNORE INTO jobs (job_id, status, created, updated, event) VALUES (?, ?, ?, ?, ?)',
+            (job_id, record['status'], record['created'], record['updated'], json.dumps(event, ensure_ascii=False)))
+        return cursor.rowcount == 1
+
+    def put_stage(self, job_id, stage, data):
+        now = time.time()
+        # 只为已存在的任务写阶段结果，未知 job_id 不留下孤立的 stages 行
+        cursor = self._execute(
+            'INSERT OR REPLACE INTO stages (job_id, stage, data, updated) '
+            'SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM jobs WHERE job_id = ?)',
+            (job_id, stage, json.dumps(data, ensure_ascii=False, default=str), now, job_id))
+        if cursor.rowcount == 0:
+            raise KeyError(job_id)
+        self._execute('UPDATE jobs SET updated = ? WHERE job_id = ?', (now, job_id))
+
+    def set_status(self, job_id, status, result=None):
+        if result is None:
+            cursor = self._execute('UPDATE jobs SET status = ?, updated = ? WHERE job_id = ?',
+                                   (status, time.time(), job_id))
+        else:
+            cursor = self._execute('UPDATE jobs SET status = ?, updated = ?, result = ? WHERE job_id = ?',
+                                   (status, time.time(), json.dumps(result, ensure_ascii=False, default=str), job_id))
+        if cursor.rowcount == 0:
+            raise KeyError(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status, created, updated, event, result FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            stages = self._conn.execute(
+                'SELECT stage, data FROM stages WHERE job_id = ? ORDER BY stage', (job_id,)).fetchall()
+        status, created, updated, event, result = row
+        return {'job_id': job_id, 'status': status, 'created': created, 'updated': updated,
+                'event': json.loads(event), 'stages': {stage: json.loads(data) for stage, data in stages},
+                'result': json.loads(result) if result else None}
+
+
+class S3ResultStore:
+    def __init__(self, bucket, prefix=''):
+        """<prefix><job_id>/status.json plus one object per stage
+
+        Stages are separate objects, so concurrent segments never overwrite
+        each other's results with a read-modify-write.
+        """
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.s3 = get_client('s3')
+
+    def _key(self, job_id, name):
+        return f'{self.prefix}{job_id}/{name}'
+
+    def _put(self, key, data, **kwargs):
+        self.s3.put_object(Bucket=self.bucket, Key=key, ContentType='application/json',
+                           Body=json.dumps(data, ensure_ascii=False, default=str).encode('utf-8'), **kwargs)
+
+    def _get(self, key):
+        try:
+            return json.loads(self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read())
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def create(self, job_id, event):
+        record = new_record(job_id, event)
+        del record['stages']
+        # 条件写入：同一 job_id 并发提交时只有一个成功，与 DynamoDB 的 attribute_not_exists 一致
+        try:
+            self._put(self._key(job_id, 'status.json'), record, IfNoneMatch='*')
+        except self.s3.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                return False
+            raise
+        return True
+
+    def put_stage(self, job_id, stage, data):
+        self._put(self._key(job_id, f'stages/{stage}.json'), data)
+
+    def set_status(self, job_id, status, result=None):
+        # 状态只由执行该任务的一次调用写入，不会并发修改
+        record = self._get(self._key(job_id, 'status.json'))
+        if record is None:
+            raise KeyError(job_id)
+        record['status'] = status
+        record['updated'] = time.time()
+        if result is not None:
+            record['result'] = result
+        self._put(self._key(job_id, 'status.json'), record)
+
+    def get(self, job_id):
+        record = self._get(self._key(job_id, 'status.json'))
+        if record is None:
+            return None
+        record['stages'] = {}
+        stage_prefix = self._key(job_id, 'stages/')
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=stage_prefix):
+            for obj in page.get('Contents', []):
+                stage = obj['Key'][len(stage_prefix):-len('.json')]
+                record['stages'][stage] = self._get(obj['Key'])
+        return record
+
+
+class DynamoResultStore:
+    def __init__(self, table):
+        """One item per job (partition key job_id); stage results in the stages map
+
+        Values are stored as JSON strings, which avoids DynamoDB's Decimal
+        conversion of floats; each stage is its own map entry, so concurrent
+        segment updates do not conflict.
+        """
+        self.table = table
+        self.dynamodb = get_client('dynamodb')
+
+    def create(self, job_id, event):
+        record = new_record(job_id, event)
+        try:
+            self.dynamodb.put_item(
+                TableName=self.table,
+                Item={
+                    'job_id': {'S': job_id},
+                    'status': {'S': record['status']},
+                    'created': {'N': str(record['created'])},
+                    'updated': {'N': str(record['updated'])},
+                    'event': {'S': json.dumps(event, ensure_ascii=False)},
+                    'stages': {'M': {}},
+                    'expires_at': {'N': str(int(record['created'] + RESULT_TTL_SECONDS))},
+                },
+                ConditionExpression='attribute_not_exists(job_id)',
+            )
+        except self.dynamodb.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def _update(self, job_id, **kwargs):
+        # update_item 对不存在的 key 会新建一条残缺的条目，只更新 create() 写入过的任务
+        try:
+            self.dynamodb.update_item(TableName=self.table, Key={'job_id': {'S': job_id}},
+                                      ConditionExpression='attribute_exists(job_id)', **kwargs)
+        except self.dynamodb.exceptions.ConditionalCheckFailedException:
+            raise KeyError(job_id)
+
+    def put_stage(self, job_id, stage, data):
+        self._update(
+            job_id,
+            UpdateExpression='SET stages.#stage = :data, updated = :updated',
+            ExpressionAttributeNames={'#stage': stage},
+            ExpressionAttributeValues={
+                ':data': {'S': json.dumps(data, ensure_ascii=False, default=str)},
+                ':updated': {'N': str(time.time())},
+            },
+        )
+
+    def set_status(self, job_id, status, result=None):
+        expression = 'SET #status = :status, updated = :updated'
+        values = {':status': {'S': status}, ':updated': {'N': str(time.time())}}
+        if result is not None:
+            expression += ', #result = :result'
+            values[':result'] = {'S': json.dumps(result, ensure_ascii=False, default=str)}
+        self._update(
+            job_id,
+            UpdateExpression=expression,
+            ExpressionAttributeNames={'#status': 'status', **({'#result': 'result'} if result is not None else {})},
+            ExpressionAttributeValues=values,
+        )
+
+    def get(self, job_id):
+        item = self.dynamodb.get_item(TableName=self.table, Key={'job_id': {'S': job_id}},
+                                      ConsistentRead=True).get('Item')
+        if item is None:
+            return None
+        # 旧版本可能留下只有部分属性的条目
+        return {
+            'job_id': job_id,
+            'status': item.get('status', {}).get('S'),
+            'created': float(item['created']['N']) if 'created' in item else None,
+            'updated': float(item['updated']['N']) if 'updated' in item else None,
+            'event': json.loads(item['event']['S']) if 'event' in item else None,
+            'stages': {stage: json.loads(value['S']) for stage, value in item.get('stages', {}).get('M', {}).items()},
+            'result': json.loads(item['result']['S']) if 'result' in item else None,
+        }
+
+
+def open_result_store(uri):
+    """s3://bucket/prefix | dynamodb://table | sqlite:///path.db | file:///dir"""
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3ResultStore(bucket, prefix)
+    if uri.startswith('dynamodb://'):
+        return DynamoResultStore(uri[len('dynamodb://'):])
+    if uri.startswith('sqlite://'):
+        return SqliteResultStore(uri[len('sqlite://'):])
+    if uri.startswith('file://'):
+        return FileResultStore(uri[len('file://'):])
+    raise ValueError(f"Unsupported result store: {uri}")
@@ -0,0 +1,325 @@
+import contextvars
+import os
+import shutil
+import threading
+import time
+import uuid
+
+SCRATCH_ROOT = os.environ.get('SCRATCH_ROOT', '/tmp')
+# /tmp 上本服务（临时目录 + 已登记的缓存目录）可用的字节数，0 表示文件系统容量的 90%（Lambda 默认 512MB，可配置到 10GB）
+SCRATCH_BUDGET_BYTES = int(os.environ.get('SCRATCH_BUDGET_BYTES', 0))
+# 不超过该大小的中间产物（抽帧、拼图）放在 memfd 里，不占 /tmp
+SCRATCH_MEMFD_MAX_BYTES = int(os.environ.get('SCRATCH_MEMFD_MAX_BYTES', 4 * 1024 * 1024))
+# 单次调用 memfd 总量上限，超过后落盘
+SCRATCH_MEMFD_BUDGET_BYTES = int(os.environ.get('SCRATCH_MEMFD_BUDGET_BYTES', 64 * 1024 * 1024))
+# 没有属主记录的临时目录超过该时长才视为遗留（Lambda 最长执行时间 15 分钟）
+SCRATCH_ORPHAN_MIN_AGE_SECONDS = float(os.environ.get('SCRATCH_ORPHAN_MIN_AGE_SECONDS', 900))
+SCRATCH_PREFIX = 'vu-'
+# 临时目录内记录创建进程（pid 与进程启动时间）的文件
+OWNER_FILE = '.owner'
+
+MEMFD_SUPPORTED = hasattr(os, 'memfd_create')
+
+_current_scratch = contextvars.ContextVar('scratch_space', default=None)
+_live_dirs = set()
+_evictors = []
+_cache_dirs = []
+_lock = threading.Lock()
+
+
+class ScratchBudgetExceeded(RuntimeError):
+    pass
+
+
+def register_evictor(evictor, cache_dir=None):
+    """evictor(bytes_needed) frees cached data under the scratch root and returns the bytes freed
+
+    The bytes under cache_dir count against the scratch budget.
+    """
+    with _lock:
+        _evictors.append(evictor)
+        if cache_dir:
+            _cache_dirs.append(cache_dir)
+
+
+def tree_bytes(path):
+    """Total size of the regular files under path"""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                pass
+    return total
+
+
+def budget_bytes(root=None):
+    if SCRATCH_BUDGET_BYTES:
+        return SCRATCH_BUDGET_BYTES
+    return int(shutil.disk_usage(root or SCRATCH_ROOT).total * 0.9)
+
+
+def _process_start_time(pid):
+    """Start time of pid (clock ticks since boot), None if unknown; tells a live owner from a reused pid"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rpartition(')')[2].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _owner_record():
+    pid = os.getpid()
+    return f'{pid} {_process_start_time(pid) or ""}'.strip()
+
+
+def _owner_alive(path):
+    """Whether the process that created the scratch directory is still running
+
+    None if the directory has no owner record (yet).
+    """
+    try:
+        with open(os.path.join(path, OWNER_FILE)) as f:
+            pid, _, start_time = f.read().strip().partition(' ')
+        pid = int(pid)
+    except (OSError, ValueError):
+        return None
+    if pid == os.getpid():
+        # 本进程（或 pid 相同的已退出进程）创建、但已不在使用中的目录，例如上一次调用超时
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    current = _process_start_time(pid)
+    return not (start_time and current and current != start_time)
+
+
+def own_bytes(root=None):
+    """Bytes this service holds under the scratch root: every scratch directory plus registered caches"""
+    root = root or SCRATCH_ROOT
+    total = 0
+    try:
+        names = os.listdir(root)
+    except OSError:
+        names = []
+    for name in names:
+        if name.startswith(SCRATCH_PREFIX):
+            total += tree_bytes(os.path.join(root, name))
+    with _lock:
+        cache_dirs = list(_cache_dirs)
+    for cache_dir in cache_dirs:
+        total += tree_bytes(cache_dir)
+    return total
+
+
+def sweep_orphans(root=None):
+    """Remove scratch directories left behind by earlier invocations (e.g. killed by a timeout)
+
+    Several processes (e.g. queue workers) may share the scratch root, so a
+    directory is only removed when its owner process is gone, or, without an
+    owner record, when it is older than SCRATCH_ORPHAN_MIN_AGE_SECONDS.
+    """
+    root = root or SCRATCH_ROOT
+    swept = 0
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(root, name)
+        if not name.startswith(SCRATCH_PREFIX) or not os.path.isdir(path):
+            continue
+        with _lock:
+            if path in _live_dirs:
+                continue
+        alive = _owner_alive(path)
+        if alive is None:
+            try:
+                alive = time.time() - os.stat(path).st_mtime < SCRATCH_ORPHAN_MIN_AGE_SECONDS
+            except OSError:
+                continue
+        if alive:
+            continue
+        swept += tree_bytes(path)
+        shutil.rmtree(path, ignore_errors=True)
+    if swept:
+        print(f"清理遗留临时目录 {swept} 字节")
+    return swept
+
+
+class ScratchSpace:
+    def __init__(self, root=None, budget=None, memfd_max_bytes=None, memfd_budget=None):
+        """Per-invocation scratch directory with memfd-backed small artifacts
+
+        Small artifacts written with write_bytes() live in anonymous memory files
+        (exposed as /proc/self/fd/<n> paths, usable by cv2/PIL/open in this
+        process) and never touch /tmp; everything else goes to the scratch
+        directory. cleanup() closes every memfd and removes the directory, and is
+        safe to call more than once.
+        """
+        self.root = root or SCRATCH_ROOT
+        self.budget = budget or budget_bytes(self.root)
+        self.memfd_max_bytes = SCRATCH_MEMFD_MAX_BYTES if memfd_max_bytes is None else memfd_max_bytes
+        self.memfd_budget = SCRATCH_MEMFD_BUDGET_BYTES if memfd_budget is None else memfd_budget
+        self.dir = os.path.join(self.root, f'{SCRATCH_PREFIX}{uuid.uuid4()}')
+        self.memfds = {}
+        self.memfd_bytes = 0
+        self.peak_bytes = 0
+        self.evicted_bytes = 0
+        self.swept_bytes = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        # 先登记再创建，避免并发调用的 sweep_orphans 误删
+        with _lock:
+            _live_dirs.add(self.dir)
+        os.makedirs(self.dir, exist_ok=True)
+        with open(os.path.join(self.dir, OWNER_FILE), 'w') as f:
+            f.write(_owner_record())
+
+    def path(self, *parts):
+        """Disk path inside the scratch directory (parent directories are created)"""
+        path = os.path.join(self.dir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def disk_bytes(self):
+        return tree_bytes(self.dir)
+
+    def write_bytes(self, path, data):
+        """Store an artifact and return a path that can be opened for reading
+
+        path is the on-disk location used when the artifact does not go to memfd.
+        """
+        size = len(data)
+        with self._lock:
+            use_memfd = (MEMFD_SUPPORTED and size <= self.memfd_max_bytes
+                         and self.memfd_bytes + size <= self.memfd_budget)
+            if use_memfd:
+                fd = os.memfd_create(os.path.basename(path), os.MFD_CLOEXEC)
+                self.memfd_bytes += size
+        if use_memfd:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            memfd_path = f'/proc/self/fd/{fd}'
+            with self._lock:
+                self.memfds[memfd_path] = (fd, size)
+            self._observe()
+            return memfd_path
+
+        self.ensure_capacity(size)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self._observe()
+        return path
+
+    def release(self, path):
+        """Drop an artifact early (memfd or file)"""
+        with self._lock:
+            entry = self.memfds.pop(path, None)
+            if entry:
+                self.memfd_bytes -= entry[1]
+        if entry:
+            os.close(entry[0])
+        elif path.startswith(self.dir + os.sep) and os.path.isfile(path):
+            os.remove(path)
+
+    def ensure_capacity(self, bytes_needed):
+        """Make room for bytes_needed more bytes under the scratch root, or raise
+
+        Container-wide caches are evicted first (see register_evictor). Large
+        inputs should be checked before they are streamed to disk, so a video
+        that cannot fit fails fast instead of filling /tmp.
+        """
+        room = self._room()
+        if bytes_needed <= room:
+            return
+        with _lock:
+            evictors = list(_evictors)
+        for evictor in evictors:
+            try:
+                self.evicted_bytes += evictor(bytes_needed - room) or 0
+            except Exception as e:
+                print(f"Scratch eviction failed: {e}")
+            room = self._room()
+            if bytes_needed <= room:
+                return
+        raise ScratchBudgetExceeded(
+            f"Scratch space exhausted: need {bytes_needed} bytes, {max(0, room)} available under {self.root}")
+
+    def _room(self):
+        # 预算只计本服务的数据（所有调用的临时目录和已登记的缓存），同一磁盘上其他程序的占用只体现在 fs.free 里
+        fs = shutil.disk_usage(self.root)
+        return min(fs.free, self.budget - own_bytes(self.root))
+
+    def _observe(self):
+        total = self.disk_bytes() + self.memfd_bytes
+        with self._lock:
+            self.peak_bytes = max(self.peak_bytes, total)
+        return total
+
+    def usage(self):
+        disk = self.disk_bytes() if not self.closed else 0
+        fs = shutil.disk_usage(self.root)
+        return {
+            'disk_bytes': disk,
+            'memfd_bytes': self.memfd_bytes,
+            'memfd_files': len(self.memfds),
+            'peak_bytes': max(self.peak_bytes, disk + self.memfd_bytes),
+            'budget_bytes': self.budget,
+            'evicted_bytes': self.evicted_bytes,
+            'swept_bytes': self.swept_bytes,
+            'fs_free_bytes': fs.free,
+        }
+
+    def cleanup(self):
+        """Close memfds and remove the scratch directory; returns the final usage"""
+        usage = self.usage()
+        with self._lock:
+            memfds = list(self.memfds.values())
+            self.memfds.clear()
+            self.memfd_bytes = 0
+            self.closed = True
+        for fd, _ in memfds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        shutil.rmtree(self.dir, ignore_errors=True)
+        with _lock:
+            _live_dirs.discard(self.dir)
+        return usage
+
+
+def open_scratch(root=None):
+    """Sweep orphans, create this invocation's scratch space and make it current"""
+    swept = sweep_orphans(root)
+    scratch = ScratchSpace(root)
+    scratch.swept_bytes = swept
+    _current_scratch.set(scratch)
+    return scratch
+
+
+def close_scratch(scratch):
+    if scratch is None:
+        return None
+    if _current_scratch.get() is scratch:
+        _current_scratch.set(None)
+    return scratch.cleanup()
+
+
+def current_scratch():
+    return _current_scratch.get()
@@ -0,0 +1,306 @@
+import contextvars
+import json
+import os
+import resource
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+TRACE_ENABLED = os.environ.get('TRACE_ENABLED', '1') == '1'
+# 设置后写入本地文件（每次调用一行 JSON），否则打印到 stdout（CloudWatch Logs 按 EMF 解析）
+TRACE_EXPORT_FILE = os.environ.get('TRACE_EXPORT_FILE', '')
+TRACE_NAMESPACE = os.environ.get('TRACE_NAMESPACE', 'VideoUnderstanding')
+
+_current_tracer = contextvars.ContextVar('tracer', default=None)
+_listeners = []
+# 进行中的 trace；VmHWM 是进程级的，多个 trace 同时进行时不能按阶段重置
+_active_tracers = weakref.WeakSet()
+_active_lock = threading.Lock()
+_stage_rss_supported = None
+
+
+def peak_rss_kb():
+    """Process peak RSS (KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def read_hwm_kb():
+    """Current VmHWM (peak RSS since the last reset) in KB, None if /proc is unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_hwm():
+    """Reset VmHWM to the current RSS (Linux >= 4.0), returns False if not supported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def stage_rss_supported():
+    """Whether VmHWM can be read and reset here; probed on first use, not at import"""
+    global _stage_rss_supported
+    if _stage_rss_supported is None:
+        _stage_rss_supported = read_hwm_kb() is not None and reset_hwm()
+    return _stage_rss_supported
+
+
+def _cpu_seconds():
+    # 进程自身 + 已结束子进程（ffmpeg/ffprobe）的 CPU 时间
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+class Span:
+    def __init__(self, name, attrs=None):
+        """Timing record of one stage"""
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.error = None
+        self._wall_start = time.perf_counter()
+        self._cpu_start = _cpu_seconds()
+        self.wall_ms = None
+        self.cpu_ms = None
+        self.peak_rss_kb = None
+        self.offset_ms = None
+        # 本阶段内观察到的最高 VmHWM（其他阶段开始时会重置 VmHWM，重置前的读数记在这里）
+        self.observed_hwm_kb = 0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add_bytes(self, bytes_in=0, bytes_out=0):
+        self.bytes_in += bytes_in or 0
+        self.bytes_out += bytes_out or 0
+
+    def end(self, trace_start, stage_rss):
+        self.wall_ms = (time.perf_counter() - self._wall_start) * 1000
+        self.cpu_ms = (_cpu_seconds() - self._cpu_start) * 1000
+        if stage_rss:
+            self.peak_rss_kb = max(self.observed_hwm_kb, read_hwm_kb() or 0)
+        else:
+            self.peak_rss_kb = peak_rss_kb()
+        self.offset_ms = (self._wall_start - trace_start) * 1000
+
+    def to_dict(self):
+        record = {
+            'name': self.name,
+            'offset_ms': round(self.offset_ms, 2),
+            'wall_ms': round(self.wall_ms, 2),
+            'cpu_ms': round(self.cpu_ms, 2),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'peak_rss_kb': self.peak_rss_kb,
+        }
+        if self.error:
+            record['error'] = self.error
+        if self.attrs:
+            record['attrs'] = self.attrs
+        return record
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+    def add_bytes(self, bytes_in=0, bytes_out=0):
+        pass
+
+
+class StdoutExporter:
+    def export(self, record):
+        print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+class FileExporter:
+    def __init__(self, path):
+        """Append one JSON line per invocation to a local file"""
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+def default_exporter():
+    return FileExporter(TRACE_EXPORT_FILE) if TRACE_EXPORT_FILE else StdoutExporter()
+
+
+class Tracer:
+    def __init__(self, name, exporter=None, dimensions=None):
+        """Collects the stage spans of one invocation and emits them as one EMF log line"""
+        self.name = name
+        self.exporter = exporter or default_exporter()
+        self.dimensions = dict(dimensions or {})
+        self.spans = []
+        self.attrs = {}
+        self.metrics = {}
+        self._open = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        # 按阶段统计峰值内存；与其他 trace 重叠后改为进程级峰值
+        self.stage_rss = True
+        with _active_lock:
+            _active_tracers.add(self)
+
+    def _begin_stage_rss(self, new_span):
+        """Reset VmHWM for a new span, crediting the reading so far to every open span
+
+        Only done while this is the only active trace: a reset would wipe the
+        peak another concurrent trace (queue job, Streamlit session) is measuring.
+        """
+        with _active_lock:
+            if len(_active_tracers) > 1 or not stage_rss_supported():
+                for tracer in _active_tracers:
+                    tracer.stage_rss = False
+            with self._lock:
+                if self.stage_rss:
+                    hwm = read_hwm_kb() or 0
+                    for open_span in self._open:
+                        open_span.observed_hwm_kb = max(open_span.observed_hwm_kb, hwm)
+                    reset_hwm()
+                self._open.append(new_span)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        s = Span(name, attrs)
+        self._begin_stage_rss(s)
+        try:
+            yield s
+        except Exception as e:
+            s.error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            s.end(self._start, self.stage_rss)
+            with self._lock:
+                self._open.remove(s)
+                self.spans.append(s)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def metric(self, name, value, unit='None'):
+        """Invocation-level metric emitted alongside the stage metrics"""
+        self.metrics[name] = (value, unit)
+
+    def to_emf(self, status):
+        """CloudWatch Embedded Metric Format record: per-stage metrics + the raw spans"""
+        total_ms = (time.perf_counter() - self._start) * 1000
+        metrics = {'total.wall_ms': round(total_ms, 2), 'peak_rss_kb': peak_rss_kb()}
+        units = {'total.wall_ms': 'Milliseconds', 'peak_rss_kb': 'Kilobytes'}
+        for key, (value, unit) in self.metrics.items():
+            metrics[key] = value
+            units[key] = unit
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans]
+        for s in spans:
+            # 同名阶段（如多个分段）以数组形式上报，EMF 支持一个指标多个值
+            for field, unit in (('wall_ms', 'Milliseconds'), ('cpu_ms', 'Milliseconds'),
+                                ('bytes_in', 'Bytes'), ('bytes_out', 'Bytes'),
+                                ('peak_rss_kb', 'Kilobytes')):
+                key = f"{s['name']}.{field}"
+                value = s[field]
+                if key in metrics:
+                    previous = metrics[key]
+                    metrics[key] = (previous if isinstance(previous, list) else [previous]) + [value]
+                else:
+                    metrics[key] = value
+                units[key] = unit
+
+        dimension_keys = ['Service'] + sorted(self.dimensions)
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': TRACE_NAMESPACE,
+                    'Dimensions': [dimension_keys],
+                    'Metrics': [{'Name': key, 'Unit': units[key]} for key in metrics],
+                }],
+            },
+            'Service': self.name,
+            'status': status,
+            'peak_rss_scope': 'stage' if self.stage_rss and _stage_rss_supported else 'process',
+            'spans': spans,
+        }
+        record.update(self.dimensions)
+        record.update(self.attrs)
+        record.update(metrics)
+        return record
+
+    def finish(self, status='ok'):
+        with _active_lock:
+            _active_tracers.discard(self)
+        record = self.to_emf(status)
+        try:
+            self.exporter.export(record)
+        except Exception as e:
+            print(f"Failed to export trace: {e}")
+        for listener in list(_listeners):
+            try:
+                listener(record)
+            except Exception as e:
+                print(f"Trace listener failed: {e}")
+        return record
+
+
+def register_listener(listener):
+    """listener(record) is called with every finished trace record (e.g. by the queue worker)"""
+    _listeners.append(listener)
+
+
+def start_trace(name, exporter=None, **dimensions):
+    """Start a trace for this invocation and make it current"""
+    if not TRACE_ENABLED:
+        return None
+    tracer = Tracer(name, exporter, dimensions)
+    _current_tracer.set(tracer)
+    return tracer
+
+
+def finish_trace(tracer, status='ok'):
+    if tracer is None:
+        return None
+    if _current_tracer.get() is tracer:
+        _current_tracer.set(None)
+    return tracer.finish(status)
+
+
+def current_tracer():
+    return _current_tracer.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Span on the current trace, or a no-op if there is none"""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield _NoopSpan()
+        return
+    with tracer.span(name, **attrs) as s:
+        yield s
+
+
+def wrap(fn):
+    """Bind fn to the caller's context (current trace, request usage) for worker threads"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # 同一个 Context 不能被多个线程同时进入，每次调用用一份副本
+        return context.copy().run(fn, *args, **kwargs)
+    return run
@@ -0,0 +1,365 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# 每千 token 美元价格：(input, output, cache_read, cache_write)，按 on-demand 公开价格
+MODEL_PRICES = {
+    'amazon.nova-pro-v1:0': (0.0008, 0.0032, 0.0002, 0.0),
+    'amazon.nova-lite-v1:0': (0.00006, 0.00024, 0.000015, 0.0),
+    'amazon.nova-micro-v1:0': (0.000035, 0.00014, 0.00000875, 0.0),
+    'anthropic.claude-3-7-sonnet-20250219-v1:0': (0.003, 0.015, 0.0003, 0.00375),
+    'anthropic.claude-3-5-sonnet-20241022-v2:0': (0.003, 0.015, 0.0003, 0.00375),
+    'anthropic.claude-3-5-sonnet-20240620-v1:0': (0.003, 0.015, 0.0003, 0.00375),
+}
+# 超出 token 预算时的降级模型（需支持同样的图片/视频输入）
+MODEL_DOWNGRADES = {
+    'anthropic.claude-3-7-sonnet-20250219-v1:0': 'amazon.nova-pro-v1:0',
+    'anthropic.claude-3-5-sonnet-20241022-v2:0': 'amazon.nova-pro-v1:0',
+    'anthropic.claude-3-5-sonnet-20240620-v1:0': 'amazon.nova-pro-v1:0',
+    'amazon.nova-pro-v1:0': 'amazon.nova-lite-v1:0',
+}
+# 跨 region 推理配置文件的前缀
+INFERENCE_PROFILE_PREFIXES = ('us', 'eu', 'apac', 'global')
+
+# JSON 文件 {"model_id": [input, output, cache_read, cache_write]} 覆盖内置价格
+USAGE_PRICES_FILE = os.environ.get('USAGE_PRICES_FILE', '')
+# 设置后每次 Bedrock 调用、每个请求各追加一行 JSON
+USAGE_LEDGER_FILE = os.environ.get('USAGE_LEDGER_FILE', '')
+USAGE_WINDOW = int(os.environ.get('USAGE_WINDOW', 1000))
+TOKEN_BUDGET = int(os.environ.get('TOKEN_BUDGET', 0))
+BATCH_TOKEN_BUDGET = int(os.environ.get('BATCH_TOKEN_BUDGET', 0))
+# 账本里还没有该模型的样本时，每张图片的 token 估计值（720px 边长）
+DEFAULT_TOKENS_PER_IMAGE = 800
+# 账本里还没有该模型的样本时，每次调用的 token 估计值
+DEFAULT_TOKENS_PER_CALL = 4000
+
+_current_usage = contextvars.ContextVar('request_usage', default=None)
+
+
+def split_model_id(model_id):
+    """(inference profile prefix or '', base model id)"""
+    prefix, _, rest = model_id.partition('.')
+    if rest and prefix in INFERENCE_PROFILE_PREFIXES:
+        return prefix, rest
+    return '', model_id
+
+
+def downgrade_model(model_id):
+    """Cheaper model for model_id, keeping the inference profile prefix; None if there is none"""
+    prefix, base = split_model_id(model_id)
+    cheaper = MODEL_DOWNGRADES.get(base)
+    if cheaper is None:
+        return None
+    return f'{prefix}.{cheaper}' if prefix else cheaper
+
+
+def load_prices(path=None):
+    prices = dict(MODEL_PRICES)
+    path = path or USAGE_PRICES_FILE
+    if path:
+        with open(path) as f:
+            prices.update({model_id: tuple(v) for model_id, v in json.load(f).items()})
+    return prices
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def usage_tokens(usage):
+    """Normalized token counts from a converse response's usage block"""
+    return {
+        'input_tokens': usage.get('inputTokens', 0),
+        'output_tokens': usage.get('outputTokens', 0),
+        'cache_read_tokens': usage.get('cacheReadInputTokens', 0),
+        'cache_write_tokens': usage.get('cacheWriteInputTokens', 0),
+    }
+
+
+class UsageLedger:
+    def __init__(self, window=None, export_file=None, prices=None):
+        """Rolling record of Bedrock usage and cost in this process
+
+        Calls and finished requests are kept in bounded windows, so a warm Lambda
+        container or the Streamlit process can report rolling percentiles.
+        """
+        self.prices = prices if prices is not None else load_prices()
+        self.export_file = USAGE_LEDGER_FILE if export_file is None else export_file
+        window = window or USAGE_WINDOW
+        self.calls = deque(maxlen=window)
+        self.requests = deque(maxlen=window)
+        # 批次内累计 token（仅限本进程）
+        self.batches = {}
+        self._lock = threading.Lock()
+
+    def cost(self, model_id, tokens):
+        """Estimated USD cost, None if the model has no price"""
+        price = self.prices.get(split_model_id(model_id)[1])
+        if price is None:
+            return None
+        input_price, output_price, cache_read_price, cache_write_price = price
+        return (tokens['input_tokens'] * input_price
+                + tokens['output_tokens'] * output_price
+                + tokens['cache_read_tokens'] * cache_read_price
+                + tokens['cache_write_tokens'] * cache_write_price) / 1000
+
+    def record(self, model_id, response, latency_ms, images=0, videos=0, request_id=None, hedge=False,
+               charged=True):
+        """Record one converse call and return its ledger entry
+
+        hedge marks a duplicate request that lost a hedged race (still billed);
+        charged=False means it finished after its request was closed.
+        """
+        tokens = usage_tokens(response.get('usage', {}))
+        entry = {
+            'type': 'call',
+            'timestamp': time.time(),
+            'request_id': request_id,
+            'model_id': model_id,
+            'latency_ms': round(latency_ms, 2),
+            'images': images,
+            'videos': videos,
+            **tokens,
+            'cost_usd': self.cost(model_id, tokens),
+        }
+        if hedge:
+            entry['hedge'] = True
+            entry['charged'] = charged
+        with self._lock:
+            self.calls.append(entry)
+        self._export(entry)
+        return entry
+
+    def finish_request(self, usage):
+        usage.finished = True
+        entry = {'type': 'request', 'timestamp': time.time(), **usage.summary()}
+        with self._lock:
+            self.requests.append(entry)
+        self._export(entry)
+        return entry
+
+    def charge_batch(self, batch_id, tokens):
+        with self._lock:
+            self.batches[batch_id] = self.batches.get(batch_id, 0) + tokens
+            return self.batches[batch_id]
+
+    def batch_tokens(self, batch_id):
+        with self._lock:
+            return self.batches.get(batch_id, 0)
+
+    def estimate_tokens(self, model_id, images=0):
+        """Expected tokens of the next call, from this model's recent calls"""
+        with self._lock:
+            calls = [c for c in self.calls if c['model_id'] == model_id]
+        if images:
+            per_image = [c['input_tokens'] / c['images'] for c in calls if c['images']]
+            tokens_per_image = percentile(per_image, 50) or DEFAULT_TOKENS_PER_IMAGE
+            output = percentile([c['output_tokens'] for c in calls], 50) or 0
+            return int(images * tokens_per_image + output)
+        totals = [c['input_tokens'] + c['output_tokens'] for c in calls]
+        return int(percentile(totals, 50) or DEFAULT_TOKENS_PER_CALL)
+
+    def summary(self):
+        """Rolling latency percentiles, token totals and cost per 1k videos"""
+        with self._lock:
+            calls = list(self.calls)
+            requests = list(self.requests)
+        latencies = [c['latency_ms'] for c in calls]
+        by_model = {}
+        for c in calls:
+            m = by_model.setdefault(c['model_id'], {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cost_usd': 0.0})
+            m['calls'] += 1
+            m['input_tokens'] += c['input_tokens']
+            m['output_tokens'] += c['output_tokens']
+            m['cost_usd'] += c['cost_usd'] or 0
+        request_costs = [r['cost_usd'] for r in requests]
+        hedges = [c for c in calls if c.get('hedge')]
+        # 请求结束后才返回的对冲调用没有计入请求成本，这里补上
+        late_hedge_cost = sum(c['cost_usd'] or 0 for c in hedges if not c['charged'])
+        return {
+            'calls': len(calls),
+            'requests': len(requests),
+            'latency_ms': {'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95),
+                           'p99': percentile(latencies, 99)},
+            'models': by_model,
+            'hedge_calls': len(hedges),
+            'hedge_cost_usd': sum(c['cost_usd'] or 0 for c in hedges),
+            'cost_per_1k_videos': ((sum(request_costs) + late_hedge_cost) / len(request_costs) * 1000
+                                   if request_costs else None),
+        }
+
+    def _export(self, entry):
+        if not self.export_file:
+            return
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.export_file, 'a') as f:
+                f.write(line + '\n')
+
+
+class RequestUsage:
+    def __init__(self, ledger, request_id=None, token_budget=None, batch_id=None, batch_budget=None):
+        """Token spend of one request (one video), with optional request and batch budgets"""
+        self.ledger = ledger
+        self.request_id = request_id
+        self.token_budget = token_budget or None
+        self.batch_id = batch_id
+        self.batch_budget = (batch_budget or None) if batch_id else None
+        self.tokens = 0
+        self.cost_usd = 0.0
+        self.calls = 0
+        self.hedge_calls = 0
+        self.downgrades = []
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        tokens = entry['input_tokens'] + entry['output_tokens']
+        with self._lock:
+            self.tokens += tokens
+            self.cost_usd += entry['cost_usd'] or 0
+            self.calls += 1
+            if entry.get('hedge'):
+                self.hedge_calls += 1
+        if self.batch_id:
+            self.ledger.charge_batch(self.batch_id, tokens)
+
+    def remaining(self):
+        """Tokens left under the tighter of the two budgets, None if unlimited"""
+        limits = []
+        if self.token_budget:
+            limits.append(self.token_budget - self.tokens)
+        if self.batch_budget:
+            limits.append(self.batch_budget - self.ledger.batch_tokens(self.batch_id))
+        return min(limits) if limits else None
+
+    def choose_model(self, model_id, images=0):
+        """model_id, or a cheaper model while the next call would exceed the budget"""
+        remaining = self.remaining()
+        if remaining is None:
+            return model_id
+        chosen = model_id
+        while self.ledger.estimate_tokens(chosen, images) > remaining:
+            cheaper = downgrade_model(chosen)
+            if cheaper is None:
+                break
+            chosen = cheaper
+        if chosen != model_id:
+            print(f"token 预算剩余 {remaining}，模型降级 {model_id} -> {chosen}")
+            with self._lock:
+                self.downgrades.append({'from': model_id, 'to': chosen})
+        return chosen
+
+    def choose_frame_count(self, model_id, frame_count, min_frames=1):
+        """Largest frame count (>= min_frames) whose estimated tokens fit the budget"""
+        remaining = self.remaining()
+        if remaining is None:
+            return frame_count
+        count = frame_count
+        while count > min_frames and self.ledger.estimate_tokens(model_id, count) > remaining:
+            count -= 1
+        if count != frame_count:
+            print(f"token 预算剩余 {remaining}，抽帧数 {frame_count} -> {count}")
+            with self._lock:
+                self.downgrades.append({'frames_from': frame_count, 'frames_to': count})
+        return count
+
+    def summary(self):
+        return {
+            'request_id': self.request_id,
+            'batch_id': self.batch_id,
+            'calls': self.calls,
+            'hedge_calls': self.hedge_calls,
+            'tokens': self.tokens,
+            'cost_usd': round(self.cost_usd, 6),
+            'token_budget': self.token_budget,
+            'downgrades': self.downgrades,
+        }
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger():
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger()
+        return _ledger
+
+
+def begin_request(request_id=None, token_budget=None, batch_id=None, batch_budget=None, ledger=None):
+    """Start accounting for one request and make it current"""
+    usage = RequestUsage(ledger or get_ledger(), request_id,
+                         token_budget or TOKEN_BUDGET, batch_id, batch_budget or BATCH_TOKEN_BUDGET)
+    _current_usage.set(usage)
+    return usage
+
+
+def end_request(usage):
+    if _current_usage.get() is usage:
+        _current_usage.set(None)
+    return usage.ledger.finish_request(usage)
+
+
+def current_usage():
+    return _current_usage.get()
+
+
+def record_call(model_id, response, latency_ms, images=0, videos=0):
+    """Record a converse call on the ledger and charge it to the current request"""
+    usage = _current_usage.get()
+    ledger = usage.ledger if usage else get_ledger()
+    entry = ledger.record(model_id, response, latency_ms, images, videos,
+                          usage.request_id if usage else None)
+    if usage:
+        usage.add(entry)
+    return entry
+
+
+def record_hedge_call(model_id, response, latency_ms, usage=None):
+    """Record a hedged duplicate that lost the race; Bedrock bills it like any other call
+
+    usage is the RequestUsage of the caller (losers finish on pool threads, outside
+    the request's context); it is charged unless the request already finished.
+    """
+    ledger = usage.ledger if usage else get_ledger()
+    charged = usage is not None and not usage.finished
+    entry = ledger.record(model_id, response, latency_ms, request_id=usage.request_id if usage else None,
+                          hedge=True, charged=charged)
+    if charged:
+        usage.add(entry)
+    return entry
+
+
+def choose_model(model_id, images=0):
+    usage = _current_usage.get()
+    return usage.choose_model(model_id, images) if usage else model_id
+
+
+def choose_frame_count(model_id, frame_count, min_frames=1):
+    usage = _current_usage.get()
+    return usage.choose_frame_count(model_id, frame_count, min_frames) if usage else frame_count
+
+
+def summarize_file(path):
+    """Rebuild the rolling summary from a USAGE_LEDGER_FILE"""
+    ledger = UsageLedger(window=sys.maxsize, export_file='')
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            (ledger.calls if entry['type'] == 'call' else ledger.requests).append(entry)
+    return ledger.summary()
+
+
+if __name__ == "__main__":
+    print(json.dumps(summarize_file(sys.argv[1]), indent=2, ensure_ascii=False))
@@ -0,0 +1,133 @@
+import json
+import os
+import subprocess
+
+# Bedrock Converse 原生支持的视频容器（video.format 取值）
+NOVA_VIDEO_FORMATS = {'mkv', 'mov', 'mp4', 'webm', 'flv', 'mpeg', 'mpg', 'wmv', 'three_gp'}
+
+# 可以直接 stream copy 进 mp4 的编码
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'mpeg4', 'av1', 'vp9'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'alac'}
+
+EXTENSION_FORMATS = {
+    '.mp4': 'mp4', '.m4v': 'mp4', '.mov': 'mov', '.qt': 'mov', '.mkv': 'mkv', '.webm': 'webm',
+    '.flv': 'flv', '.mpeg': 'mpeg', '.mpg': 'mpg', '.wmv': 'wmv', '.3gp': 'three_gp', '.avi': 'avi',
+}
+
+
+def probe_media(video_path):
+    """Container and codec info from ffprobe, empty dict if ffprobe fails"""
+    cmd = [
+        'ffprobe', '-v', 'quiet',
+        '-print_format', 'json',
+        '-show_format', '-show_streams',
+        video_path
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except FileNotFoundError:
+        return {}
+    if result.returncode != 0:
+        return {}
+    info = json.loads(result.stdout)
+
+    media = {
+        'format_name': info.get('format', {}).get('format_name', ''),
+        'major_brand': info.get('format', {}).get('tags', {}).get('major_brand', '').strip(),
+        'duration': float(info.get('format', {}).get('duration', 0) or 0),
+        'video_codec': None,
+        'audio_codec': None,
+    }
+    for stream in info.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type == 'video' and media['video_codec'] is None:
+            media['video_codec'] = stream.get('codec_name')
+            media['width'] = stream.get('width')
+            media['height'] = stream.get('height')
+        elif codec_type == 'audio' and media['audio_codec'] is None:
+            media['audio_codec'] = stream.get('codec_name')
+    return media
+
+
+def detect_container(video_path, media=None):
+    """Container of the file as a Bedrock video.format name (or "avi" etc. if unsupported)"""
+    media = probe_media(video_path) if media is None else media
+    format_name = media.get('format_name', '')
+    names = set(format_name.split(','))
+
+    if 'mov' in names or 'mp4' in names:
+        brand = media.get('major_brand', '')
+        if brand == 'qt':
+            return 'mov'
+        if brand.startswith('3g'):
+            return 'three_gp'
+        return 'mp4'
+    if 'matroska' in names or 'webm' in names:
+        webm_codecs = {'vp8', 'vp9', 'av1', 'opus', 'vorbis', None}
+        if media.get('video_codec') in webm_codecs and media.get('audio_codec') in webm_codecs:
+            return 'webm'
+        return 'mkv'
+    if 'avi' in names:
+        return 'avi'
+    if 'flv' in names:
+        return 'flv'
+    if 'asf' in names:
+        return 'wmv'
+    if 'mpeg' in names or 'mpegts' in names:
+        return 'mpeg'
+
+    # ffprobe 不可用或无法识别时按扩展名判断
+    ext = os.path.splitext(video_path)[1].lower()
+    return EXTENSION_FORMATS.get(ext, 'mp4')
+
+
+def remux_to_mp4(video_path, output_path, media=None):
+    """Rewrap into mp4, re-encoding only the streams that cannot be copied
+
+    Returns "remux" if both streams were copied, otherwise "transcode".
+    """
+    media = probe_media(video_path) if media is None else media
+    video_codec = media.get('video_codec')
+    audio_codec = media.get('audio_codec')
+
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', video_path, '-map', '0:v:0', '-map', '0:a:0?']
+    mode = 'remux'
+    if video_codec in MP4_VIDEO_CODECS:
+        cmd += ['-c:v', 'copy']
+        if video_codec == 'mpeg4':
+            # AVI 里的 mpeg4 常带 packed B-frames，mp4 不支持
+            cmd += ['-bsf:v', 'mpeg4_unpack_bframes']
+    else:
+        cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p']
+        mode = 'transcode'
+    if audio_codec is None or audio_codec in MP4_AUDIO_CODECS:
+        cmd += ['-c:a', 'copy']
+    else:
+        cmd += ['-c:a', 'aac', '-b:a', '128k']
+        mode = 'transcode'
+    cmd += ['-movflags', '+faststart', output_path]
+
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to {mode} {video_path}: {result.stderr.strip()[-500:]}")
+    return mode
+
+
+def prepare_video_for_bedrock(video_path, output_dir=None):
+    """Return (path, format) of a video Bedrock can read
+
+    Natively supported containers are passed through with their real format;
+    anything else (e.g. avi) is stream-copied into mp4, with a transcode fallback
+    only for codecs mp4 cannot carry.
+    """
+    media = probe_media(video_path)
+    container = detect_container(video_path, media)
+    if container in NOVA_VIDEO_FORMATS:
+        return video_path, container
+
+    output_dir = output_dir or os.path.dirname(video_path)
+    base = os.path.splitext(os.path.basename(video_path))[0]
+    output_path = os.path.join(output_dir, f'{base}.remux.mp4')
+    mode = remux_to_mp4(video_path, output_path, media)
+    print(f"{container} -> mp4 ({mode}): {output_path}")
+    return output_path, 'mp4'
@@ -0,0 +1,108 @@
+import os
+import uuid
+
+from aws_clients import get_client
+
+# 内存受限模式下 inline 的视频字节、base64 请求体同时驻留内存，阈值更低，较大视频走 scratch bucket
+MEMORY_BOUNDED = os.environ.get('MEMORY_BOUNDED', '0') == '1'
+# Bedrock 的 inline 请求体上限为 25MB（含 base64 开销），留出余量
+INLINE_MAX_BYTES = int(os.environ.get('NOVA_INLINE_MAX_BYTES', (6 if MEMORY_BOUNDED else 18) * 1024 * 1024))
+INLINE_HARD_LIMIT_BYTES = 25 * 1024 * 1024
+SCRATCH_BUCKET = os.environ.get('NOVA_SCRATCH_BUCKET', '')
+SCRATCH_PREFIX = os.environ.get('NOVA_SCRATCH_PREFIX', 'nova-staging')
+S3_BUCKET_OWNER = os.environ.get('NOVA_S3_BUCKET_OWNER', '')
+
+
+def parse_s3_uri(s3_uri):
+    assert s3_uri.startswith("s3://")
+    _, bucket_key = s3_uri.split("s3://", 1)
+    bucket, key = bucket_key.split("/", 1)
+    return bucket, key
+
+
+class VideoPayload:
+    def __init__(self, kind, local_path=None, s3_uri=None, staged=False, size=None, video_format="mp4"):
+        """How the video is handed to Bedrock
+
+        kind -- "s3" (s3Location reference) or "bytes" (inline upload)
+        local_path -- local copy, read only when the inline block is built
+        s3_uri -- object Bedrock reads directly when kind is "s3"
+        staged -- True if s3_uri was uploaded to the scratch bucket by us
+        video_format -- container declared to Bedrock (mp4, mov, mkv, ...)
+        """
+        self.kind = kind
+        self.local_path = local_path
+        self.s3_uri = s3_uri
+        self.staged = staged
+        self.size = size
+        self.video_format = video_format
+
+    def video_block(self, video_format=None):
+        """Build the Converse `video` content block"""
+        if self.kind == "s3":
+            s3_location = {"uri": self.s3_uri}
+            if S3_BUCKET_OWNER:
+                s3_location["bucketOwner"] = S3_BUCKET_OWNER
+            source = {"s3Location": s3_location}
+        else:
+            with open(self.local_path, "rb") as file:
+                source = {"bytes": file.read()}
+        return {
+            "video": {
+                "format": video_format or self.video_format,
+                "source": source
+            }
+        }
+
+    def cleanup(self, s3_client=None):
+        """Remove the staged scratch object, if any"""
+        if not self.staged:
+            return
+        try:
+            bucket, key = parse_s3_uri(self.s3_uri)
+            (s3_client or get_client('s3')).delete_object(Bucket=bucket, Key=key)
+        except Exception as e:
+            print(f"删除暂存对象失败 {self.s3_uri}: {e}")
+
+    def describe(self):
+        return {'kind': self.kind, 'format': self.video_format, 'staged': self.staged, 'size': self.size, 's3_uri': self.s3_uri}
+
+
+def stage_to_scratch_bucket(local_path, scratch_bucket=None, s3_client=None):
+    """Upload a local video to the scratch bucket and return its s3 uri"""
+    bucket = scratch_bucket or SCRATCH_BUCKET
+    key = f'{SCRATCH_PREFIX.strip("/")}/{uuid.uuid4()}/{os.path.basename(local_path)}'
+    # upload_file 走分片并发上传，不会把整个文件读入内存
+    (s3_client or get_client('s3')).upload_file(local_path, bucket, key)
+    return f's3://{bucket}/{key}'
+
+
+def plan_video_payload(local_path, video_s3_uri=None, inline_max_bytes=None, scratch_bucket=None, s3_client=None,
+                       video_format="mp4"):
+    """Decide how the video reaches Bedrock
+
+    1. Source already in S3 -> s3Location, nothing is uploaded again
+    2. Small local/URL source -> inline bytes
+    3. Large local/URL source -> staged to the scratch bucket, then s3Location
+    """
+    if video_s3_uri:
+        return VideoPayload("s3", local_path=local_path, s3_uri=video_s3_uri, video_format=video_format)
+
+    inline_max_bytes = INLINE_MAX_BYTES if inline_max_bytes is None else inline_max_bytes
+    scratch_bucket = scratch_bucket or SCRATCH_BUCKET
+    size = os.path.getsize(local_path)
+
+    if size <= inline_max_bytes:
+        return VideoPayload("bytes", local_path=local_path, size=size, video_format=video_format)
+
+    if scratch_bucket:
+        s3_uri = stage_to_scratch_bucket(local_path, scratch_bucket, s3_client)
+        print(f"视频 {size} 字节超过 inline 阈值，已暂存到 {s3_uri}")
+        return VideoPayload("s3", local_path=local_path, s3_uri=s3_uri, staged=True, size=size,
+                            video_format=video_format)
+
+    if size <= INLINE_HARD_LIMIT_BYTES:
+        print(f"视频 {size} 字节超过 inline 阈值但未配置 NOVA_SCRATCH_BUCKET，仍使用 inline 上传")
+        return VideoPayload("bytes", local_path=local_path, size=size, video_format=video_format)
+
+    raise RuntimeError(f"Video is too large for inline upload ({size} bytes) and NOVA_SCRATCH_BUCKET is not set")
@@ -0,0 +1,201 @@
+import math
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_SEGMENT_SECONDS = float(os.environ.get('SEGMENT_MAX_SECONDS', 18))
+SEGMENT_WORKERS = int(os.environ.get('SEGMENT_WORKERS', 4))
+
+
+def probe_keyframes(video_path):
+    """Keyframe timestamps (seconds) of the first video stream, empty list if ffprobe fails"""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-skip_frame', 'nokey',
+        '-show_entries', 'frame=pts_time',
+        '-of', 'csv=p=0',
+        video_path
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except FileNotFoundError:
+        return []
+    if result.returncode != 0:
+        return []
+    keyframes = []
+    for line in result.stdout.splitlines():
+        value = line.strip().strip(',')
+        try:
+            keyframes.append(float(value))
+        except ValueError:
+            continue
+    return sorted(set(keyframes))
+
+
+def choose_cut_points(keyframes, duration, max_segment_seconds):
+    """Greedy keyframe-aligned cut points so each chunk is at most max_segment_seconds
+
+    A chunk is only longer than the limit when the GOP itself is longer.
+    Without keyframe info the timeline is split evenly; such cuts are not on
+    keyframes and have to be cut with cut_segment(..., accurate=True).
+    """
+    if duration <= max_segment_seconds:
+        return []
+    if not keyframes:
+        step = duration / int(-(-duration // max_segment_seconds))
+        cuts = []
+        t = step
+        while t < duration - 0.5:
+            cuts.append(round(t, 3))
+            t += step
+        return cuts
+
+    cuts = []
+    start = 0.0
+    candidates = [k for k in keyframes if 0 < k < duration]
+    while duration - start > max_segment_seconds:
+        limit = start + max_segment_seconds
+        within = [k for k in candidates if start < k <= limit]
+        if within:
+            cut = within[-1]
+        else:
+            later = [k for k in candidates if k > limit]
+            if not later:
+                break
+            cut = later[0]
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+
+def split_video(video_path, output_dir, duration, max_segment_seconds=None, n_segments=None):
+    """Split a video at keyframes into chunks without re-encoding
+
+    Each chunk is written to its own directory (<output_dir>/seg_000/...), so the
+    per-chunk frame extraction does not collide.
+
+    Returns a list of {"index", "path", "start", "end"}.
+    """
+    max_segment_seconds = max_segment_seconds or MAX_SEGMENT_SECONDS
+    if n_segments:
+        max_segment_seconds = min(max_segment_seconds, duration / n_segments)
+    keyframes = probe_keyframes(video_path)
+    cuts = choose_cut_points(keyframes, duration, max_segment_seconds)
+    # 没有关键帧信息时均分点不在关键帧上，流复制会退到前一个关键帧，改为精确切割
+    accurate = bool(cuts) and not keyframes
+
+    ext = os.path.splitext(video_path)[1] or '.mp4'
+    bounds = [0.0] + cuts + [duration]
+    segments = []
+    for index in range(len(bounds) - 1):
+        seg_dir = os.path.join(output_dir, f'seg_{index:03d}')
+        os.makedirs(seg_dir, exist_ok=True)
+        seg_path = os.path.join(seg_dir, f'seg_{index:03d}{ext}')
+        cut_segment(video_path, bounds[index], bounds[index + 1], seg_path, accurate=accurate)
+        segments.append({
+            'index': index,
+            'path': seg_path,
+            'start': bounds[index],
+            'end': bounds[index + 1],
+        })
+    return segments
+
+
+def cut_segment(video_path, start, end, output_path, accurate=False):
+    """Write [start, end) of the video into output_path
+
+    By default the streams are copied, which is only exact when start is a
+    keyframe; accurate=True decodes from start and re-encodes the chunk.
+    """
+    if accurate:
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-i', video_path,
+            '-ss', f'{start:.3f}',
+            '-t', f'{end - start:.3f}',
+            '-map', '0:v:0', '-map', '0:a:0?',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-b:a', '128k',
+            output_path
+        ]
+    else:
+        # 输入端 -ss 会退到不晚于该时间的关键帧；向上取整到毫秒，避免舍入后落在关键帧之前而多出整个 GOP
+        seek = math.ceil(start * 1000) / 1000 if start > 0 else 0.0
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-ss', f'{seek:.3f}',
+            '-i', video_path,
+            '-t', f'{end - seek:.3f}',
+            '-map', '0:v:0', '-map', '0:a:0?',
+            '-c', 'copy',
+            '-avoid_negative_ts', 'make_zero',
+            output_path
+        ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to cut segment {start:.2f}-{end:.2f}s: {result.stderr.strip()[-500:]}")
+    return output_path
+
+
+def analyze_segments(segments, analyze_fn, max_workers=None):
+    """Run analyze_fn(segment) on every chunk concurrently
+
+    Returns [(segment, result)] in timeline order; the first failing chunk raises.
+    """
+    max_workers = max_workers or SEGMENT_WORKERS
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='segment') as executor:
+        futures = [executor.submit(analyze_fn, segment) for segment in segments]
+        return [(segment, future.result()) for segment, future in zip(segments, futures)]
+
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f'{minutes:02d}:{seconds:02d}'
+
+
+def merge_segment_results(segment_results):
+    """Merge per-chunk tag results into one verdict
+
+    - is_exist: a tag exists if any chunk reports it
+    - confidence: max confidence over the chunks that report it
+    - explanation: per-chunk explanations, prefixed with the chunk time range
+    - NO_ISSUE: kept only if no chunk reports any other tag
+    """
+    merged = {}
+    for segment, result in segment_results:
+        time_range = f"[{format_timestamp(segment['start'])}-{format_timestamp(segment['end'])}]"
+        for tag, detail in result.items():
+            if not isinstance(detail, dict):
+                continue
+            is_exist = int(detail.get('is_exist', 0))
+            confidence = detail.get('confidence', 0)
+            entry = merged.setdefault(tag, {
+                'explanation': [],
+                'is_exist': 0,
+                'confidence': 0,
+                'segments': [],
+            })
+            if is_exist:
+                if not entry['is_exist']:
+                    # 第一次出现正例时，丢弃之前负例的说明和置信度
+                    entry['explanation'] = []
+                    entry['confidence'] = 0
+                entry['is_exist'] = 1
+                entry['segments'].append(time_range)
+            elif entry['is_exist']:
+                continue
+            entry['explanation'].append(f"{time_range} {detail.get('explanation', '')}".strip())
+            entry['confidence'] = max(entry['confidence'], confidence)
+
+    positives = [tag for tag, entry in merged.items() if entry['is_exist'] and tag != 'NO_ISSUE']
+    if positives:
+        merged.pop('NO_ISSUE', None)
+    elif 'NO_ISSUE' in merged:
+        # 所有片段都无问题时，置信度取最弱的片段
+        no_issue = [r['NO_ISSUE'].get('confidence', 0) for _, r in segment_results if 'NO_ISSUE' in r]
+        merged['NO_ISSUE']['confidence'] = min(no_issue)
+
+    for entry in merged.values():
+        entry['explanation'] = ' '.join(entry['explanation'])
+    return merged
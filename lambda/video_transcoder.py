@@ -0,0 +1,122 @@
+import hashlib
+import os
+import subprocess
+import uuid
+
+from scratch_space import register_evictor
+
+PROXY_CACHE_DIR = os.environ.get('NOVA_PROXY_CACHE_DIR', '/tmp/nova_proxy_cache')
+PROXY_CACHE_MAX_BYTES = int(os.environ.get('NOVA_PROXY_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+PROXY_MAX_SIDE = int(os.environ.get('NOVA_PROXY_MAX_SIDE', 640))
+PROXY_FPS = float(os.environ.get('NOVA_PROXY_FPS', 4))
+PROXY_MAX_BITRATE = os.environ.get('NOVA_PROXY_MAX_BITRATE', '600k')
+PROXY_PRESET = os.environ.get('NOVA_PROXY_PRESET', 'veryfast')
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Content hash of a file, read in chunks"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _prune_cache(cache_dir, max_bytes, keep=None):
+    """Drop least recently used proxies until the cache fits in max_bytes, returns the bytes freed"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.mp4') and not name.startswith('.') and os.path.isfile(path):
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    freed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            freed += size
+        except OSError:
+            pass
+    return freed
+
+
+def evict_proxy_cache(bytes_needed):
+    """Scratch-space evictor: shrink the proxy cache by bytes_needed"""
+    if not os.path.isdir(PROXY_CACHE_DIR):
+        return 0
+    cached = sum(os.path.getsize(os.path.join(PROXY_CACHE_DIR, name)) for name in os.listdir(PROXY_CACHE_DIR)
+                 if name.endswith('.mp4') and not name.startswith('.'))
+    return _prune_cache(PROXY_CACHE_DIR, max(0, cached - bytes_needed))
+
+
+register_evictor(evict_proxy_cache, cache_dir=PROXY_CACHE_DIR)
+
+
+def build_moderation_proxy(video_path, max_side=None, fps=None, max_bitrate=None, keep_audio=False,
+                           preset=None, cache_dir=None):
+    """Build (or reuse) a small moderation proxy of the video
+
+    The proxy is downscaled so the longer side is at most max_side, resampled to fps,
+    encoded with a capped bitrate and, unless keep_audio is set, has no audio track.
+    Proxies are cached by content hash + parameters, so warm containers and reruns
+    reuse them.
+
+    Returns the path of the proxy mp4.
+    """
+    max_side = max_side or PROXY_MAX_SIDE
+    fps = fps or PROXY_FPS
+    max_bitrate = max_bitrate or PROXY_MAX_BITRATE
+    preset = preset or PROXY_PRESET
+    cache_dir = cache_dir or PROXY_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+
+    params = f'{max_side}|{fps}|{max_bitrate}|{int(keep_audio)}|{preset}'
+    key = hashlib.sha256(f'{file_sha256(video_path)}|{params}'.encode()).hexdigest()
+    proxy_path = os.path.join(cache_dir, f'{key}.mp4')
+    if os.path.exists(proxy_path):
+        os.utime(proxy_path)
+        print(f"命中审核代理视频缓存: {proxy_path}")
+        return proxy_path
+
+    # 只缩小不放大，保持宽高比且宽高为偶数
+    # 长边也取偶数：低于上限的奇数宽高原样传给 libx264（yuv420p）会编码失败
+    scale = (f"scale='if(gte(iw,ih),trunc(min(iw,{max_side})/2)*2,-2)'"
+             f":'if(gte(iw,ih),-2,trunc(min(ih,{max_side})/2)*2)'")
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', video_path,
+        '-vf', f'fps={fps},{scale}',
+        '-c:v', 'libx264',
+        '-preset', preset,
+        '-crf', '28',
+        '-maxrate', max_bitrate,
+        '-bufsize', max_bitrate,
+        '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+    ]
+    if keep_audio:
+        cmd += ['-c:a', 'aac', '-b:a', '64k', '-ac', '1']
+    else:
+        cmd += ['-an']
+
+    # 先写临时文件再原子替换，避免并发调用读到半成品
+    tmp_path = os.path.join(cache_dir, f'.{key}.{uuid.uuid4().hex}.mp4')
+    result = subprocess.run(cmd + [tmp_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(f"Failed to build moderation proxy: {result.stderr.strip()[-500:]}")
+    os.replace(tmp_path, proxy_path)
+
+    print(f"审核代理视频: {os.path.getsize(video_path)} -> {os.path.getsize(proxy_path)} 字节")
+    _prune_cache(cache_dir, PROXY_CACHE_MAX_BYTES, keep=proxy_path)
+    return proxy_path